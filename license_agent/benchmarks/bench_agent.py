@@ -0,0 +1,271 @@
+"""
+智能体离线基准测试 - 使用模拟模型与工具替身（fake_agent.py），测量对话吞吐量、轮次延迟与首token延迟
+
+两种驱动方式:
+- service: 直接调用 AgentService.chat_stream（不含Web层），衡量LangGraph流程本身的开销
+- socketio: 通过 Socket.IO 测试客户端发送 send_message，经过限流、持久化、分发与事件推送全流程
+
+每个模拟用户依次发送 --turns 条消息；--scenario tools 时消息中带设备IP，每轮包含两次工具调用。
+结果保存为JSON，指定 --baseline 时与之前的结果对比（用于比较不同提交之间的性能变化）。
+
+用法:
+    python benchmarks/bench_agent.py --modes service socketio --users 1 10 50 --turns 3 --output bench.json
+    python benchmarks/bench_agent.py --users 50 --baseline bench.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, PROJECT_DIR)
+
+from fake_agent import ScriptedChatModel, install_fakes
+
+MESSAGES = {
+    'chat': '你好',
+    'tools': '请帮我测试设备 192.168.1.{n} 的授权流程'
+}
+
+
+def percentile(values, pct):
+    """线性插值百分位数"""
+    if not values:
+        return None
+    values = sorted(values)
+    rank = (len(values) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+def make_message(scenario, user_index, turn):
+    if scenario == 'mixed':
+        scenario = 'tools' if (user_index + turn) % 2 else 'chat'
+    return MESSAGES[scenario].format(n=user_index % 250 + 1)
+
+
+def run_users(users, turns, run_turn):
+    """N 个用户线程同时开始，各自依次执行 turns 轮对话，返回 (每轮结果列表, 总耗时)"""
+    barrier = threading.Barrier(users + 1)
+    results = []
+    lock = threading.Lock()
+
+    def user(index):
+        barrier.wait()
+        for turn in range(turns):
+            try:
+                outcome = run_turn(index, turn)
+            except Exception as e:
+                outcome = {'error': str(e)}
+            with lock:
+                results.append(outcome)
+
+    threads = [threading.Thread(target=user, args=(i,), daemon=True) for i in range(users)]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    wall_start = time.perf_counter()
+    for t in threads:
+        t.join()
+    return results, time.perf_counter() - wall_start
+
+
+# ==================== service 模式 ====================
+
+def bench_service(args, users):
+    from langgraph.checkpoint.memory import MemorySaver
+    from web_agent.agent_service import AgentService
+
+    service = AgentService(
+        api_key='sk-bench', base_url='http://127.0.0.1:9/v1/', model_name='bench',
+        tool_max_workers=args.tool_workers, checkpointer=MemorySaver()
+    )
+    install_fakes(service, make_model(args), args.tool_latency, args.tool_latency_by_tool)
+
+    def run_turn(user_index, turn):
+        started = time.perf_counter()
+        state = {'ttft': None, 'error': None}
+
+        def callback(event):
+            if event['type'] == 'assistant_message' and state['ttft'] is None:
+                state['ttft'] = time.perf_counter() - started
+            elif event['type'] == 'error':
+                state['error'] = event['data'].get('message')
+
+        service.chat_stream(make_message(args.scenario, user_index, turn), callback,
+                            user_id=user_index + 1, conversation_id=user_index + 1)
+        return {'latency': time.perf_counter() - started, **state}
+
+    return run_users(users, args.turns, run_turn)
+
+
+# ==================== socketio 模式 ====================
+
+def load_app(args, db_path):
+    """以离线配置导入 web_agent.app 并装入模拟模型（同一进程内只导入一次）"""
+    os.environ.update(
+        DATABASE_URL=f'sqlite:///{db_path}',
+        DEEPSEEK_API_KEY='sk-bench',
+        DEEPSEEK_BASE_URL='http://127.0.0.1:9/v1/',
+        AGENT_DISPATCH='local',
+        LLM_CACHE_ENABLED='true' if args.llm_cache else 'false',
+        # 基准测试关注处理能力，关闭速率限制并放宽排队上限
+        ADMISSION_RATE_LIMIT_ENABLED='false',
+        ADMISSION_MAX_QUEUED='100000',
+        ADMISSION_MAX_QUEUED_PER_USER='100000'
+    )
+    from web_agent import app as app_module
+    app_module.setup_database()
+    install_fakes(app_module.agent_service.get(), make_model(args), args.tool_latency, args.tool_latency_by_tool)
+    return app_module
+
+
+def bench_socketio(args, users, app_module, run_id):
+    app, socketio = app_module.app, app_module.socketio
+
+    clients = []
+    for i in range(users):
+        http = app.test_client()
+        credentials = {'username': f'bench-{run_id}-{i}', 'password': 'bench-password'}
+        http.post('/api/register', json=credentials)
+        http.post('/api/login', json=credentials)
+        conv_id = http.post('/api/conversations', json={'title': f'基准测试{i}'}).json['conversation']['id']
+        clients.append((socketio.test_client(app, flask_test_client=http), conv_id))
+
+    def run_turn(user_index, turn):
+        client, conv_id = clients[user_index]
+        started = time.perf_counter()
+        ttft = None
+        client.emit('send_message', {'conversation_id': conv_id, 'message': make_message(args.scenario, user_index, turn)})
+        deadline = started + args.timeout
+        while time.perf_counter() < deadline:
+            for packet in client.get_received():
+                name = packet['name']
+                if name == 'agent_response' and ttft is None:
+                    ttft = time.perf_counter() - started
+                elif name == 'message_complete':
+                    return {'latency': time.perf_counter() - started, 'ttft': ttft, 'error': None}
+                elif name in ('error', 'rejected'):
+                    return {'error': packet['args'][0].get('message')}
+            time.sleep(args.poll_interval)
+        return {'error': 'timeout'}
+
+    try:
+        return run_users(users, args.turns, run_turn)
+    finally:
+        for client, _ in clients:
+            client.disconnect()
+
+
+# ==================== 汇总与对比 ====================
+
+def make_model(args):
+    return ScriptedChatModel(first_token_delay=args.first_token_delay, tokens_per_second=args.tokens_per_second)
+
+
+def summarize(mode, users, turns, results, wall):
+    ok = [r for r in results if not r.get('error')]
+    latencies = [r['latency'] for r in ok]
+    ttft = [r['ttft'] for r in ok if r.get('ttft') is not None]
+    row = {
+        'mode': mode,
+        'users': users,
+        'turns': users * turns,
+        'completed': len(ok),
+        'failed': len(results) - len(ok),
+        'wall_seconds': round(wall, 3),
+        'throughput_turns_per_sec': round(len(ok) / wall, 2) if wall else None
+    }
+    for name, values in (('latency', latencies), ('ttft', ttft)):
+        for pct in (50, 95, 99):
+            value = percentile(values, pct)
+            row[f'{name}_p{pct}'] = round(value, 4) if value is not None else None
+    errors = sorted({r['error'] for r in results if r.get('error')})
+    if errors:
+        row['errors'] = errors[:5]
+    return row
+
+
+def compare(rows, baseline_path):
+    """与基准结果中相同 mode/users 的行对比，打印变化百分比"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {(r['mode'], r['users']): r for r in json.load(f)['results']}
+    for row in rows:
+        base = baseline.get((row['mode'], row['users']))
+        if base is None:
+            continue
+        changes = []
+        for key in ('throughput_turns_per_sec', 'latency_p50', 'latency_p95', 'latency_p99', 'ttft_p95'):
+            if base.get(key) and row.get(key) is not None:
+                changes.append(f"{key} {(row[key] - base[key]) / base[key] * 100:+.1f}%")
+        print(f"📊 {row['mode']} users={row['users']}: " + ', '.join(changes))
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_latency_overrides(values):
+    overrides = {}
+    for value in values or []:
+        name, _, seconds = value.partition('=')
+        overrides[name] = float(seconds)
+    return overrides
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='智能体离线基准测试')
+    parser.add_argument('--modes', nargs='+', choices=['service', 'socketio'], default=['service', 'socketio'])
+    parser.add_argument('--users', nargs='+', type=int, default=[1, 10, 50])
+    parser.add_argument('--turns', type=int, default=3, help='每个用户发送的消息数')
+    parser.add_argument('--scenario', choices=['chat', 'tools', 'mixed'], default='mixed')
+    parser.add_argument('--first-token-delay', type=float, default=0.2, help='模拟模型首token延迟（秒）')
+    parser.add_argument('--tokens-per-second', type=float, default=50, help='模拟模型输出速率')
+    parser.add_argument('--tool-latency', type=float, default=0.1, help='工具替身默认耗时（秒）')
+    parser.add_argument('--tool-latency-for', nargs='*', metavar='TOOL=SECONDS',
+                        help='单独指定某个工具的耗时，例如 execute_auth_test=1.5')
+    parser.add_argument('--tool-workers', type=int, default=8)
+    parser.add_argument('--llm-cache', action='store_true', help='socketio 模式下开启LLM响应缓存')
+    parser.add_argument('--poll-interval', type=float, default=0.005, help='socketio 模式轮询事件的间隔（秒）')
+    parser.add_argument('--timeout', type=float, default=120, help='单轮对话超时（秒）')
+    parser.add_argument('--output', help='结果保存为JSON文件')
+    parser.add_argument('--baseline', help='与之前保存的JSON结果对比')
+    args = parser.parse_args()
+    args.tool_latency_by_tool = parse_latency_overrides(args.tool_latency_for)
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        app_module = load_app(args, os.path.join(tmp, 'bench.db')) if 'socketio' in args.modes else None
+        for mode in args.modes:
+            for run_id, users in enumerate(args.users):
+                if mode == 'service':
+                    results, wall = bench_service(args, users)
+                else:
+                    results, wall = bench_socketio(args, users, app_module, run_id)
+                row = summarize(mode, users, args.turns, results, wall)
+                rows.append(row)
+                print(json.dumps(row, ensure_ascii=False))
+
+    report = {
+        'commit': git_commit(),
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'config': {k: v for k, v in vars(args).items() if k not in ('output', 'baseline', 'tool_latency_for')},
+        'results': rows
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        compare(rows, args.baseline)
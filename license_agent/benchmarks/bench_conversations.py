@@ -0,0 +1,111 @@
+"""
+对话列表接口基准测试 - 对比逐个对话加载消息（N+1）与分组统计
+
+用法:
+    python benchmarks/bench_conversations.py --conversations 10000 --messages 10
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+
+from web_agent.models import db, init_schema, User, Conversation, Message
+
+
+def create_app(db_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def seed(num_conversations, messages_per_conversation):
+    """批量写入测试数据（绕过ORM逐行插入以缩短准备时间）"""
+    user = User(username='bench', password_hash='x')
+    db.session.add(user)
+    db.session.commit()
+
+    now = datetime.utcnow()
+    db.session.execute(Conversation.__table__.insert(), [
+        {
+            'user_id': user.id,
+            'title': f'对话{i}',
+            'created_at': now - timedelta(minutes=i),
+            'updated_at': now - timedelta(minutes=i)
+        }
+        for i in range(num_conversations)
+    ])
+    conv_ids = [row[0] for row in db.session.query(Conversation.id).all()]
+
+    batch = []
+    for conv_id in conv_ids:
+        for j in range(messages_per_conversation):
+            batch.append({
+                'conversation_id': conv_id,
+                'role': 'user' if j % 2 == 0 else 'assistant',
+                'content': '请帮我测试设备 192.168.1.100 的授权流程' * 3,
+                'created_at': now + timedelta(seconds=j)
+            })
+        if len(batch) >= 50000:
+            db.session.execute(Message.__table__.insert(), batch)
+            batch = []
+    if batch:
+        db.session.execute(Message.__table__.insert(), batch)
+    db.session.commit()
+    return user.id
+
+
+def list_n_plus_one(user_id):
+    """旧实现：to_dict 中 len(self.messages) 逐个对话加载全部消息"""
+    conversations = Conversation.query.filter_by(user_id=user_id)\
+        .order_by(Conversation.updated_at.desc()).all()
+    return [dict(conv.to_dict(message_count=0), message_count=len(conv.messages)) for conv in conversations]
+
+
+def list_grouped(user_id):
+    """新实现：一次分组查询统计消息数"""
+    conversations = Conversation.query.filter_by(user_id=user_id)\
+        .order_by(Conversation.updated_at.desc()).all()
+    counts = Conversation.count_messages([conv.id for conv in conversations])
+    return [conv.to_dict(message_count=counts.get(conv.id, 0)) for conv in conversations]
+
+
+def timed(fn, *args, repeat=3):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        db.session.expire_all()
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='对话列表查询基准测试')
+    parser.add_argument('--conversations', type=int, default=10000)
+    parser.add_argument('--messages', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(os.path.join(tmp, 'bench.db'))
+        with app.app_context():
+            init_schema()
+            print(f"准备数据: {args.conversations} 个对话 × {args.messages} 条消息 ...")
+            user_id = seed(args.conversations, args.messages)
+
+            old_time, old_result = timed(list_n_plus_one, user_id, repeat=args.repeat)
+            new_time, new_result = timed(list_grouped, user_id, repeat=args.repeat)
+            assert old_result == new_result
+
+            print(f"N+1 加载消息:   {old_time * 1000:9.1f} ms")
+            print(f"分组统计:       {new_time * 1000:9.1f} ms")
+            print(f"加速比:         {old_time / new_time:9.1f}x")
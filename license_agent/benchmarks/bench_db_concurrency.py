@@ -0,0 +1,153 @@
+"""
+数据库并发基准测试 - N 个读线程（加载对话侧边栏）与 M 个写线程（写入消息）同时运行，
+对比 SQLite 默认配置（回滚日志）与性能配置（WAL + SQLITE_PRAGMAS + 连接池）
+
+用法:
+    python benchmarks/bench_db_concurrency.py --readers 16 --writers 4 --seconds 10
+    python benchmarks/bench_db_concurrency.py --profile tuned  # 只测性能配置
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import func
+
+from web_agent.config import Config, build_engine_options
+from web_agent.models import db, init_db, init_schema, User, Conversation, Message
+
+
+def create_app(db_path, profile):
+    app = Flask(__name__)
+    url = f'sqlite:///{db_path}'
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    if profile == 'tuned':
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = build_engine_options(url)
+        app.config['SQLITE_PRAGMAS'] = Config.SQLITE_PRAGMAS
+    init_db(app)
+    return app
+
+
+def seed(num_users, conversations_per_user, messages_per_conversation):
+    now = datetime.utcnow()
+    db.session.execute(User.__table__.insert(), [
+        {'username': f'bench{i}', 'password_hash': 'x'} for i in range(num_users)
+    ])
+    user_ids = [row[0] for row in db.session.query(User.id).all()]
+    db.session.execute(Conversation.__table__.insert(), [
+        {
+            'user_id': user_id,
+            'title': f'对话{j}',
+            'created_at': now - timedelta(minutes=j),
+            'updated_at': now - timedelta(minutes=j)
+        }
+        for user_id in user_ids for j in range(conversations_per_user)
+    ])
+    conv_ids = [row[0] for row in db.session.query(Conversation.id).all()]
+    db.session.execute(Message.__table__.insert(), [
+        {
+            'conversation_id': conv_id,
+            'role': 'user' if j % 2 == 0 else 'assistant',
+            'content': '请帮我测试设备 192.168.1.100 的授权流程' * 3,
+            'created_at': now + timedelta(seconds=j)
+        }
+        for conv_id in conv_ids for j in range(messages_per_conversation)
+    ])
+    db.session.commit()
+    return user_ids, conv_ids
+
+
+def load_sidebar(user_id):
+    """与 /api/conversations 相同的查询：一页对话及各自的消息数"""
+    conversations = Conversation.query.filter_by(user_id=user_id)\
+        .order_by(Conversation.updated_at.desc(), Conversation.id.desc()).limit(30).all()
+    ids = [c.id for c in conversations]
+    if ids:
+        db.session.query(Message.conversation_id, func.count(Message.id))\
+            .filter(Message.conversation_id.in_(ids)).group_by(Message.conversation_id).all()
+
+
+def append_message(conv_id):
+    db.session.add(Message(conversation_id=conv_id, role='assistant', content='授权测试执行成功' * 10))
+    Conversation.query.filter_by(id=conv_id).update({'updated_at': datetime.utcnow()})
+    db.session.commit()
+
+
+def worker(app, action, ids, stop, samples, errors):
+    rng = random.Random()
+    with app.app_context():
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                action(rng.choice(ids))
+            except Exception as e:
+                db.session.rollback()
+                errors.append(type(e).__name__)
+                continue
+            finally:
+                db.session.remove()
+            samples.append((time.perf_counter() - start) * 1000)
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run(profile, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(os.path.join(tmp, 'bench.db'), profile)
+        with app.app_context():
+            init_schema()
+            user_ids, conv_ids = seed(args.users, 30, 10)
+
+        stop = threading.Event()
+        reads, writes, errors = [], [], []
+        threads = [
+            threading.Thread(target=worker, args=(app, load_sidebar, user_ids, stop, reads, errors))
+            for _ in range(args.readers)
+        ] + [
+            threading.Thread(target=worker, args=(app, append_message, conv_ids, stop, writes, errors))
+            for _ in range(args.writers)
+        ]
+        for thread in threads:
+            thread.start()
+        time.sleep(args.seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        with app.app_context():
+            db.engine.dispose()
+
+    print(f"[{profile}]")
+    print(f"  读: {len(reads) / args.seconds:8.1f} 次/秒  p50 {statistics.median(reads or [0]):7.2f} ms"
+          f"  p95 {percentile(reads, 95):7.2f} ms  p99 {percentile(reads, 99):7.2f} ms")
+    print(f"  写: {len(writes) / args.seconds:8.1f} 次/秒  p50 {statistics.median(writes or [0]):7.2f} ms"
+          f"  p95 {percentile(writes, 95):7.2f} ms  p99 {percentile(writes, 99):7.2f} ms")
+    if errors:
+        print(f"  错误: {len(errors)} 次（{', '.join(sorted(set(errors)))}）")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='数据库读写并发基准测试')
+    parser.add_argument('--readers', type=int, default=16)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--profile', choices=['default', 'tuned', 'both'], default='both')
+    args = parser.parse_args()
+
+    profiles = ['default', 'tuned'] if args.profile == 'both' else [args.profile]
+    for profile in profiles:
+        run(profile, args)
@@ -0,0 +1,118 @@
+"""
+登录吞吐基准测试 - 登录高峰（bcrypt 校验）对并发对话延迟的影响
+
+在同一进程内（与 bench_agent.py 的 socketio 模式相同，使用模拟模型）运行 --chat-users 个对话用户，
+同时 --login-threads 个线程持续调用 /api/login，直到对话全部完成。
+对每个 PASSWORD_HASH_WORKERS 取值分别测量（0 表示在请求线程中计算 bcrypt），
+并先测一次没有登录压力时的对话延迟作为基线。
+
+用法:
+    python benchmarks/bench_login.py --hash-workers 0 2 --login-threads 16 --chat-users 20 --output login.json
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+from bench_agent import bench_socketio, load_app, percentile, summarize
+
+_run_ids = itertools.count()
+
+
+def login_storm(app, usernames, threads, stop):
+    """多个线程轮流登录，返回每次登录的耗时"""
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(index):
+        client = app.test_client()
+        for attempt in itertools.count():
+            if stop.is_set():
+                return
+            username = usernames[(index + attempt) % len(usernames)]
+            started = time.perf_counter()
+            resp = client.post('/api/login', json={'username': username, 'password': 'bench-password'})
+            if resp.status_code != 200:
+                raise RuntimeError(f'登录失败: {resp.status_code}')
+            with lock:
+                latencies.append(time.perf_counter() - started)
+
+    workers = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(threads)]
+    for t in workers:
+        t.start()
+    return workers, latencies
+
+
+def measure(args, app_module, usernames, login_threads):
+    stop = threading.Event()
+    workers, login_latencies = [], []
+    started = time.perf_counter()
+    if login_threads:
+        workers, login_latencies = login_storm(app_module.app, usernames, login_threads, stop)
+    results, wall = bench_socketio(args, args.chat_users, app_module, f'login{next(_run_ids)}')
+    stop.set()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    row = summarize('socketio', args.chat_users, args.turns, results, wall)
+    row.update({
+        'login_threads': login_threads,
+        'logins': len(login_latencies),
+        'logins_per_sec': round(len(login_latencies) / elapsed, 2),
+        'login_p50': round(percentile(login_latencies, 50), 4) if login_latencies else None,
+        'login_p95': round(percentile(login_latencies, 95), 4) if login_latencies else None
+    })
+    return row
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='登录吞吐基准测试')
+    parser.add_argument('--hash-workers', nargs='+', type=int, default=[0, 2],
+                        help='PASSWORD_HASH_WORKERS 取值（0 表示在请求线程中计算）')
+    parser.add_argument('--bcrypt-rounds', type=int, default=12)
+    parser.add_argument('--login-threads', type=int, default=16)
+    parser.add_argument('--login-users', type=int, default=20, help='预先注册的登录账号数')
+    parser.add_argument('--chat-users', type=int, default=20)
+    parser.add_argument('--turns', type=int, default=3)
+    parser.add_argument('--first-token-delay', type=float, default=0.2)
+    parser.add_argument('--tokens-per-second', type=float, default=50)
+    parser.add_argument('--output', help='结果保存为JSON文件')
+    args = parser.parse_args()
+    # bench_agent 的 socketio 驱动使用的其余参数
+    args.scenario = 'chat'
+    args.tool_latency = 0.1
+    args.tool_latency_by_tool = {}
+    args.llm_cache = False
+    args.poll_interval = 0.005
+    args.timeout = 120
+    os.environ['BCRYPT_ROUNDS'] = str(args.bcrypt_rounds)
+
+    report = []
+    with tempfile.TemporaryDirectory() as tmp:
+        app_module = load_app(args, os.path.join(tmp, 'login.db'))
+        hasher, app = app_module.password_hasher, app_module.app
+
+        usernames = [f'login-{i}' for i in range(args.login_users)]
+        client = app.test_client()
+        for username in usernames:
+            client.post('/api/register', json={'username': username, 'password': 'bench-password'})
+
+        for workers in args.hash_workers:
+            app.config['PASSWORD_HASH_WORKERS'] = workers
+            hasher.init_app(app)
+            for login_threads in (0, args.login_threads):
+                row = {'hash_workers': workers, **measure(args, app_module, usernames, login_threads)}
+                report.append(row)
+                print(json.dumps(row, ensure_ascii=False))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
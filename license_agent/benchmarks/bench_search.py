@@ -0,0 +1,184 @@
+"""
+全文检索基准测试 - 验证百万级消息下关键词检索（含翻页）的耗时
+
+消息经触发器写入全文检索索引（与线上增量维护方式相同），写入耗时一并输出。
+
+用法:
+    python benchmarks/bench_search.py --messages 1000000
+    python benchmarks/bench_search.py --messages 200000 --without-index  # 对比 LIKE 扫描
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import text
+
+from web_agent.models import db, init_schema, User, Conversation, Message, TestRecord
+from web_agent.search import SearchIndex
+
+CONVERSATIONS_PER_USER = 10
+TEMPLATES = [
+    '请帮我测试设备 {ip} 的授权，产品 存储系统{product:02d} 版本 v{version}.0',
+    '设备 {ip} 的授权测试已提交，测试ID为 test-{n}，执行进度会自动推送到页面。',
+    '设备 {ip} 连接失败：网络不可达，请检查网络配置后重试。',
+    '您好，我是设备授权测试助手。请提供设备IP、产品名称、版本以及登录凭证，我将为您执行授权测试。',
+    '授权测试完成，共 5 个步骤全部通过，报告已生成。',
+]
+
+
+def create_app(db_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def random_ip(rng):
+    return f'10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}'
+
+
+def seed(num_messages, num_users, num_records, heavy_share, batch_size=50000):
+    """
+    批量写入用户、对话、消息与测试记录（绕过ORM逐行插入以缩短准备时间，索引仍由触发器维护）
+
+    heavy_share 比例的消息集中写入 1 号用户（消息很多的重度用户），其余随机分布。
+    """
+    rng = random.Random(42)
+    start = datetime.utcnow() - timedelta(days=365)
+    db.session.execute(User.__table__.insert(), [
+        {'id': i, 'username': f'user-{i}', 'password_hash': '-', 'role': 'developer'}
+        for i in range(1, num_users + 1)
+    ])
+    num_conversations = num_users * CONVERSATIONS_PER_USER
+    db.session.execute(Conversation.__table__.insert(), [
+        {'id': i, 'user_id': (i - 1) // CONVERSATIONS_PER_USER + 1, 'title': f'对话{i}', 'created_at': start}
+        for i in range(1, num_conversations + 1)
+    ])
+
+    batch = []
+    for i in range(1, num_messages + 1):
+        if rng.random() < heavy_share:
+            conversation_id = rng.randrange(1, CONVERSATIONS_PER_USER + 1)
+        else:
+            conversation_id = rng.randrange(CONVERSATIONS_PER_USER + 1, num_conversations + 1)
+        batch.append({
+            'conversation_id': conversation_id,
+            'role': 'user' if i % 2 else 'assistant',
+            'content': rng.choice(TEMPLATES).format(
+                ip=random_ip(rng), product=rng.randrange(40), version=rng.randrange(10), n=i),
+            'created_at': start + timedelta(seconds=i * 31)
+        })
+        if len(batch) >= batch_size:
+            db.session.execute(Message.__table__.insert(), batch)
+            batch = []
+    if batch:
+        db.session.execute(Message.__table__.insert(), batch)
+
+    db.session.execute(TestRecord.__table__.insert(), [
+        {
+            'record_id': f'REC-{i:08d}',
+            'test_id': f'TEST-{i:08d}',
+            'product_name': f'存储系统{rng.randrange(40):02d}',
+            'version': f'v{rng.randrange(10)}.0',
+            'device_ip': random_ip(rng),
+            'operator': f'工程师{rng.randrange(50):02d}',
+            'status': 'success' if rng.random() < 0.8 else 'failed',
+            'message': '授权测试执行成功',
+            'tags': '[]',
+            'created_at': start + timedelta(seconds=i * 31)
+        }
+        for i in range(num_records)
+    ])
+    db.session.commit()
+
+
+def drop_index():
+    for name in ('messages_fts', 'test_records_fts'):
+        db.session.execute(text(f'DROP TABLE IF EXISTS {name}'))
+    db.session.commit()
+
+
+def sample_ip(user_id):
+    """取该用户一条消息中的设备IP（检索"在哪个对话里测过某设备"）"""
+    content = db.session.execute(text(
+        "SELECT m.content FROM messages m JOIN conversations c ON c.id = m.conversation_id "
+        "WHERE c.user_id = :user_id AND m.content LIKE '%设备 10.%' LIMIT 1"
+    ), {'user_id': user_id}).scalar()
+    return content.split('设备 ')[1].split(' ')[0]
+
+
+def timed_pages(search, pages, repeat):
+    """连续翻页，返回每页耗时的中位数与最大值（毫秒）、第一页结果数以及命中是否超过候选上限"""
+    samples = []
+    first_page = 0
+    truncated = False
+    for _ in range(repeat):
+        offset = 0
+        for page in range(pages):
+            start = time.perf_counter()
+            results, offset, truncated = search(offset)
+            samples.append((time.perf_counter() - start) * 1000)
+            if page == 0:
+                first_page = len(results)
+            if offset is None:
+                break
+    return statistics.median(samples), max(samples), first_page, truncated
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='全文检索基准测试')
+    parser.add_argument('--messages', type=int, default=1000000)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--records', type=int, default=100000)
+    parser.add_argument('--heavy-share', type=float, default=0.1, help='集中到1号用户的消息比例')
+    parser.add_argument('--pages', type=int, default=3, help='每个查询连续翻页的页数')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--without-index', action='store_true', help='删除全文检索索引以对比 LIKE 扫描')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(os.path.join(tmp, 'bench.db'))
+        with app.app_context():
+            init_schema()
+            print(f"准备数据: {args.messages} 条消息（{args.users} 个用户）, {args.records} 条测试记录 ...")
+            started = time.perf_counter()
+            seed(args.messages, args.users, args.records, args.heavy_share)
+            print(f"写入耗时（含索引）: {time.perf_counter() - started:.1f} s")
+            if args.without_index:
+                drop_index()
+            db.session.execute(text('ANALYZE'))
+            db.session.commit()
+
+            search = SearchIndex(app)
+            ip = sample_ip(args.users // 2)
+            scenarios = []
+            for label, user_id in (('消息', args.users // 2), ('重度用户', 1)):
+                user_ip = sample_ip(user_id)
+                scenarios += [
+                    (f'{label}: 设备IP', lambda offset, u=user_id, q=user_ip: search.search_messages(u, q, offset=offset)),
+                    (f'{label}: 常见词', lambda offset, u=user_id: search.search_messages(u, '授权测试', offset=offset)),
+                    (f'{label}: 多关键词', lambda offset, u=user_id: search.search_messages(u, '存储系统07 v3', offset=offset)),
+                    (f'{label}: 短关键词', lambda offset, u=user_id: search.search_messages(u, '失败', offset=offset)),
+                ]
+            scenarios += [
+                ('记录: 设备IP', lambda offset: search.search_records(ip.rsplit('.', 1)[0], offset=offset)),
+                ('记录: 常见词', lambda offset: search.search_records('存储系统', offset=offset)),
+                ('记录: 产品+操作人', lambda offset: search.search_records('存储系统07 工程师03', offset=offset)),
+            ]
+            heavy_messages = db.session.execute(
+                text('SELECT COUNT(*) FROM messages WHERE conversation_id <= :n'), {'n': CONVERSATIONS_PER_USER}
+            ).scalar()
+            print(f"重度用户消息数: {heavy_messages}")
+            for name, run in scenarios:
+                median, worst, hits, truncated = timed_pages(run, args.pages, args.repeat)
+                print(f"{name:<14} 中位 {median:7.2f} ms  最慢 {worst:7.2f} ms  首页 {hits} 条"
+                      f"{'  (命中超过候选上限)' if truncated else ''}")
@@ -0,0 +1,132 @@
+"""
+冷启动基准测试 - 对比 AGENT_STARTUP_MODE（eager / background / lazy）下 Web 进程的启动耗时
+
+每次测量启动一个全新的 Python 子进程，记录:
+- import_seconds: 导入 web_agent.app 的耗时（进程可以开始接受连接的时间）
+- ready_seconds: /readyz 返回 200 的时间
+- first_reply_seconds: 第一条消息收到完整回复的时间（LLM指向本地模拟接口，lazy 模式的加载耗时体现在这里）
+
+数据库在测量前通过 init-db 初始化一次，不计入启动耗时。
+
+用法:
+    python benchmarks/bench_startup.py --modes eager background lazy --repeat 5 --output startup.json
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from fake_openai_server import make_server
+
+# 子进程中执行的测量脚本，结果以一行JSON输出
+CHILD_SCRIPT = r'''
+import json, sys, time
+started = time.perf_counter()
+from web_agent import app as app_module
+imported = time.perf_counter() - started
+
+client = app_module.app.test_client()
+while client.get('/readyz').status_code != 200:
+    if time.perf_counter() - started > 120:
+        sys.exit('readyz timeout')
+    time.sleep(0.01)
+ready = time.perf_counter() - started
+
+client.post('/api/login', json={'username': 'test', 'password': 'test123'})
+conv_id = client.post('/api/conversations', json={'title': 'startup'}).json['conversation']['id']
+sio = app_module.socketio.test_client(app_module.app, flask_test_client=client)
+message_sent = time.perf_counter()
+sio.emit('send_message', {'conversation_id': conv_id, 'message': '你好'})
+replied_at = None
+while replied_at is None and time.perf_counter() - started < 120:
+    if any(p['name'] == 'message_complete' for p in sio.get_received()):
+        replied_at = time.perf_counter()
+    time.sleep(0.005)
+print(json.dumps({
+    'import': imported,
+    'ready': ready,
+    'first_reply': replied_at - started if replied_at else None,
+    'first_reply_after_send': replied_at - message_sent if replied_at else None
+}))
+'''
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def child_env(mode, db_path, llm_url):
+    return dict(
+        os.environ,
+        PYTHONPATH=PROJECT_DIR,
+        AGENT_STARTUP_MODE=mode,
+        AGENT_DISPATCH='local',
+        DB_AUTO_INIT='false',
+        DATABASE_URL=f'sqlite:///{db_path}',
+        DEEPSEEK_API_KEY='sk-bench',
+        DEEPSEEK_BASE_URL=llm_url,
+        LLM_CACHE_ENABLED='false'
+    )
+
+
+def run_once(mode, db_path, llm_url):
+    proc = subprocess.run(
+        [sys.executable, '-c', CHILD_SCRIPT],
+        cwd=PROJECT_DIR, env=child_env(mode, db_path, llm_url),
+        capture_output=True, text=True, timeout=300
+    )
+    lines = [line for line in proc.stdout.splitlines() if line.startswith('{')]
+    if proc.returncode != 0 or not lines:
+        raise RuntimeError(f'{mode} 模式子进程失败: {proc.stderr.strip()[-500:]}')
+    return json.loads(lines[-1])
+
+
+def summarize(mode, samples):
+    row = {'mode': mode, 'runs': len(samples)}
+    for key in ('import', 'ready', 'first_reply', 'first_reply_after_send'):
+        values = [s[key] for s in samples if s.get(key) is not None]
+        row[f'{key}_seconds_median'] = round(statistics.median(values), 3) if values else None
+        row[f'{key}_seconds_max'] = round(max(values), 3) if values else None
+    return row
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='冷启动基准测试')
+    parser.add_argument('--modes', nargs='+', choices=['eager', 'background', 'lazy'],
+                        default=['eager', 'background', 'lazy'])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='结果保存为JSON文件')
+    args = parser.parse_args()
+
+    llm_port = free_port()
+    llm_server = make_server(port=llm_port, first_token_delay=0.05, token_delay=0.005)
+    threading.Thread(target=llm_server.serve_forever, daemon=True).start()
+    llm_url = f'http://127.0.0.1:{llm_port}/v1/'
+
+    report = []
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'startup.db')
+        subprocess.run(
+            [sys.executable, '-m', 'flask', '--app', 'web_agent.app', 'init-db'],
+            cwd=PROJECT_DIR, env=child_env('lazy', db_path, llm_url), check=True,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        for mode in args.modes:
+            row = summarize(mode, [run_once(mode, db_path, llm_url) for _ in range(args.repeat)])
+            report.append(row)
+            print(json.dumps(row, ensure_ascii=False))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,129 @@
+"""
+测试记录查询基准测试 - 验证百万级记录下各类筛选查询（含翻页）的耗时与索引使用情况
+
+用法:
+    python benchmarks/bench_test_records.py --records 1000000
+    python benchmarks/bench_test_records.py --records 200000 --without-indexes  # 对比全表扫描
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import text
+
+from web_agent.models import db, init_schema, TestRecord
+from web_agent.record_store import RecordStore
+
+PRODUCTS = [f"存储系统{i:02d}" for i in range(40)]
+VERSIONS = [f"v{major}.{minor}.0" for major in range(1, 4) for minor in range(10)]
+OPERATORS = [f"工程师{i:02d}" for i in range(50)]
+
+
+def create_app(db_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def seed(num_records, batch_size=50000):
+    """批量写入测试记录（绕过ORM逐行插入以缩短准备时间）"""
+    rng = random.Random(42)
+    start = datetime.utcnow() - timedelta(days=365)
+    batch = []
+    for i in range(num_records):
+        batch.append({
+            'record_id': f'REC-{i:08d}',
+            'test_id': f'TEST-{i:08d}',
+            'product_name': rng.choice(PRODUCTS),
+            'version': rng.choice(VERSIONS),
+            'device_ip': f'192.168.{i // 250 % 250}.{i % 250}',
+            'operator': rng.choice(OPERATORS),
+            'status': 'success' if rng.random() < 0.8 else 'failed',
+            'message': '授权测试执行成功',
+            'report_url': f'https://auth-system.com/reports/REPORT-{i:08d}.html',
+            'tags': '[]',
+            'created_at': start + timedelta(seconds=i * 31)
+        })
+        if len(batch) >= batch_size:
+            db.session.execute(TestRecord.__table__.insert(), batch)
+            batch = []
+    if batch:
+        db.session.execute(TestRecord.__table__.insert(), batch)
+    db.session.commit()
+
+
+def drop_indexes():
+    for index in TestRecord.__table__.indexes:
+        db.session.execute(text(f'DROP INDEX IF EXISTS {index.name}'))
+    db.session.commit()
+
+
+def query_plan(filters):
+    query = TestRecord.query
+    for column, value in filters.items():
+        query = query.filter(getattr(TestRecord, column) == value)
+    statement = query.order_by(TestRecord.created_at.desc(), TestRecord.id.desc()).limit(21)\
+        .statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+    rows = db.session.execute(text(f'EXPLAIN QUERY PLAN {statement}')).all()
+    return ' / '.join(row[-1] for row in rows)
+
+
+def timed_pages(store, filters, pages, repeat):
+    """连续翻页，返回每页耗时的中位数（毫秒）"""
+    samples = []
+    for _ in range(repeat):
+        cursor = None
+        for _ in range(pages):
+            start = time.perf_counter()
+            records, cursor = store.query(limit=20, cursor=cursor, **filters)
+            samples.append((time.perf_counter() - start) * 1000)
+            if not cursor:
+                break
+    return statistics.median(samples), max(samples)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='测试记录查询基准测试')
+    parser.add_argument('--records', type=int, default=1000000)
+    parser.add_argument('--pages', type=int, default=5, help='每个查询连续翻页的页数')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--without-indexes', action='store_true', help='删除复合索引以对比全表扫描')
+    args = parser.parse_args()
+
+    scenarios = [
+        ('产品+版本', {'product_name': PRODUCTS[3], 'version': VERSIONS[7]}),
+        ('产品+版本+状态', {'product_name': PRODUCTS[3], 'version': VERSIONS[7], 'status': 'failed'}),
+        ('产品', {'product_name': PRODUCTS[5]}),
+        ('操作人', {'operator': OPERATORS[9]}),
+        ('状态', {'status': 'failed'}),
+    ]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(os.path.join(tmp, 'bench.db'))
+        with app.app_context():
+            init_schema()
+            print(f"准备数据: {args.records} 条测试记录 ...")
+            started = time.perf_counter()
+            seed(args.records)
+            print(f"写入耗时: {time.perf_counter() - started:.1f} s")
+            if args.without_indexes:
+                drop_indexes()
+            db.session.execute(text('ANALYZE'))
+            db.session.commit()
+
+        store = RecordStore(app)
+        for name, filters in scenarios:
+            median, worst = timed_pages(store, filters, args.pages, args.repeat)
+            with app.app_context():
+                plan = query_plan(filters)
+            print(f"{name:<10} 中位 {median:7.2f} ms  最慢 {worst:7.2f} ms  | {plan}")
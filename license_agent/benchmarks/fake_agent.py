@@ -0,0 +1,150 @@
+"""
+离线模拟的对话模型与工具 - 替换 AgentService 的 LLM 与工具，基准测试不再依赖真实的 DeepSeek 接口与设备
+
+- ScriptedChatModel: 按固定脚本回复的聊天模型，可配置首token延迟与token速率；
+  用户消息中包含IP地址时依次调用 check_device_connection、execute_auth_test 后回复，否则直接回复
+- make_fake_tools: 与真实工具同名同参数的替身，按配置的延迟 sleep 后返回固定结果
+
+用法:
+    from fake_agent import ScriptedChatModel, install_fakes
+    install_fakes(agent_service, ScriptedChatModel(first_token_delay=0.2, tokens_per_second=50))
+"""
+import json
+import re
+import time
+import uuid
+from typing import Any, Dict, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.tools import StructuredTool
+
+DEFAULT_REPLY = "您好，我是设备授权测试助手。请提供设备IP、产品名称、版本以及登录凭证，我将为您执行授权测试。"
+TEST_REPLY = "设备 {ip} 的授权测试已提交，测试ID为 {test_id}，执行进度会自动推送到页面。"
+IP_PATTERN = re.compile(r'\b(\d{1,3}(?:\.\d{1,3}){3})\b')
+
+# 工具替身的固定返回结果（未列出的工具返回 {"success": True}）
+FAKE_RESULTS = {
+    "check_device_connection": {"success": True, "reachable": True, "message": "设备连接正常"},
+    "execute_auth_test": {"success": True, "status": "running", "message": "授权测试已提交"},
+    "query_auth_test_status": {"success": True, "status": "success", "result": {"auth_status": "passed"}},
+    "generate_test_report": {"success": True, "report_url": "/reports/fake.html"},
+    "save_test_record": {"success": True, "record_id": 1},
+    "query_test_history": {"success": True, "records": [], "total": 0}
+}
+
+
+class ScriptedChatModel(BaseChatModel):
+    """按脚本回复的聊天模型（支持流式输出与工具调用）"""
+
+    first_token_delay: float = 0.2
+    tokens_per_second: float = 50.0
+    chunk_chars: int = 2
+    reply: str = DEFAULT_REPLY
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted-fake"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    # ==================== 脚本 ====================
+
+    def _plan(self, messages: List[BaseMessage]) -> AIMessage:
+        """根据本轮已执行的工具调用决定下一步：调用工具或给出最终回复"""
+        last_human = max((i for i, m in enumerate(messages) if isinstance(m, HumanMessage)), default=-1)
+        text = messages[last_human].content if last_human >= 0 else ""
+        match = IP_PATTERN.search(text if isinstance(text, str) else "")
+        if match is None:
+            return AIMessage(content=self.reply)
+
+        ip = match.group(1)
+        steps = sum(1 for m in messages[last_human + 1:] if isinstance(m, AIMessage) and m.tool_calls)
+        script = [
+            ("check_device_connection", {"device_ip": ip, "username": "admin", "password": "admin"}),
+            ("execute_auth_test", {"device_ip": ip, "product_name": "bench", "version": "1.0",
+                                   "username": "admin", "password": "admin"})
+        ]
+        if steps < len(script):
+            name, args = script[steps]
+            return AIMessage(content="", tool_calls=[{
+                "name": name, "args": args, "id": f"call_{uuid.uuid4().hex[:12]}", "type": "tool_call"
+            }])
+        return AIMessage(content=TEST_REPLY.format(ip=ip, test_id=f"bench-{steps}"))
+
+    def _usage(self, messages: List[BaseMessage], output: str) -> Dict[str, int]:
+        input_tokens = sum(len(str(m.content)) for m in messages) // 2
+        output_tokens = max(1, len(output) // 2)
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens}
+
+    # ==================== 生成 ====================
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        planned = self._plan(messages)
+        output = planned.content or json.dumps([c["args"] for c in planned.tool_calls])
+        time.sleep(self.first_token_delay + len(output) / self.chunk_chars / self.tokens_per_second)
+        planned.usage_metadata = self._usage(messages, output)
+        return ChatResult(generations=[ChatGeneration(message=planned)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        planned = self._plan(messages)
+        time.sleep(self.first_token_delay)
+
+        content = planned.content
+        for start in range(0, len(content), self.chunk_chars):
+            piece = content[start:start + self.chunk_chars]
+            time.sleep(1 / self.tokens_per_second)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=piece))
+            if run_manager is not None:
+                run_manager.on_llm_new_token(piece, chunk=chunk)
+            yield chunk
+
+        output = content
+        for index, call in enumerate(planned.tool_calls):
+            args = json.dumps(call["args"], ensure_ascii=False)
+            output += args
+            time.sleep(len(args) / self.chunk_chars / self.tokens_per_second)
+            yield ChatGenerationChunk(message=AIMessageChunk(content="", tool_call_chunks=[{
+                "name": call["name"], "args": args, "id": call["id"], "index": index
+            }]))
+
+        yield ChatGenerationChunk(message=AIMessageChunk(
+            content="", usage_metadata=self._usage(messages, output)
+        ))
+
+
+def make_fake_tools(tools: List, latency: float = 0.1,
+                    latency_by_tool: Optional[Dict[str, float]] = None) -> List[StructuredTool]:
+    """创建与真实工具同名、同参数定义的替身工具"""
+    latency_by_tool = latency_by_tool or {}
+
+    def make(real_tool):
+        delay = latency_by_tool.get(real_tool.name, latency)
+        result = FAKE_RESULTS.get(real_tool.name, {"success": True})
+
+        def run(**kwargs) -> Dict[str, Any]:
+            time.sleep(delay)
+            return dict(result)
+
+        return StructuredTool.from_function(
+            func=run,
+            name=real_tool.name,
+            description=real_tool.description,
+            args_schema=real_tool.args_schema
+        )
+
+    return [make(t) for t in tools]
+
+
+def install_fakes(agent_service, model: ScriptedChatModel, tool_latency: float = 0.1,
+                  tool_latency_by_tool: Optional[Dict[str, float]] = None):
+    """把模拟模型与工具替身装入已创建的 AgentService，并重新构建流程图"""
+    agent_service.llm = model
+    agent_service.llm_with_tools = model.bind_tools(agent_service.tools)
+    agent_service.compactor.llm = model
+    agent_service.tools = make_fake_tools(agent_service.tools, tool_latency, tool_latency_by_tool)
+    agent_service.graph = agent_service._build_graph()
+    return agent_service
@@ -0,0 +1,134 @@
+"""
+本地模拟的 OpenAI 兼容接口 - 用于离线验证流式输出与连接池行为
+
+用法:
+    python benchmarks/fake_openai_server.py --port 8765 --token-delay 0.05
+
+然后将 DEEPSEEK_BASE_URL 指向 http://127.0.0.1:8765/v1/ 启动 app.py 即可。
+"""
+import argparse
+import json
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_REPLY = "您好，我是设备授权测试助手。请提供设备IP、产品名称、版本以及登录凭证，我将为您执行授权测试。"
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    """处理 /v1/chat/completions 请求，支持 stream=true 的 SSE 输出"""
+
+    protocol_version = 'HTTP/1.1'
+
+    # 由 make_server 注入
+    reply = DEFAULT_REPLY
+    first_token_delay = 0.2
+    token_delay = 0.05
+    chunk_chars = 2
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self.send_error(404)
+            return
+
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or b'{}')
+        model = body.get('model', 'fake-model')
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+
+        time.sleep(self.first_token_delay)
+
+        if not body.get('stream'):
+            payload = json.dumps({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": self.reply},
+                    "finish_reason": "stop"
+                }],
+                "usage": self._usage(body)
+            }, ensure_ascii=False).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        def send_chunk(delta, finish_reason=None, usage=None):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            }
+            if usage is not None:
+                chunk["usage"] = usage
+            self._write_event(json.dumps(chunk, ensure_ascii=False))
+
+        send_chunk({"role": "assistant", "content": ""})
+        for i in range(0, len(self.reply), self.chunk_chars):
+            send_chunk({"content": self.reply[i:i + self.chunk_chars]})
+            time.sleep(self.token_delay)
+        send_chunk({}, finish_reason="stop", usage=self._usage(body))
+        self._write_event("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _write_event(self, data):
+        event = f"data: {data}\n\n".encode('utf-8')
+        self.wfile.write(f"{len(event):X}\r\n".encode('ascii') + event + b"\r\n")
+        self.wfile.flush()
+
+    def _usage(self, body):
+        prompt_chars = sum(len(str(m.get('content') or '')) for m in body.get('messages', []))
+        return {
+            "prompt_tokens": prompt_chars,
+            "completion_tokens": len(self.reply),
+            "total_tokens": prompt_chars + len(self.reply)
+        }
+
+
+def make_server(host='127.0.0.1', port=8765, reply=DEFAULT_REPLY,
+                first_token_delay=0.2, token_delay=0.05, chunk_chars=2):
+    """创建模拟服务器（调用方负责 serve_forever / shutdown）"""
+    handler = type('ConfiguredFakeOpenAIHandler', (FakeOpenAIHandler,), {
+        'reply': reply,
+        'first_token_delay': first_token_delay,
+        'token_delay': token_delay,
+        'chunk_chars': chunk_chars
+    })
+    return ThreadingHTTPServer((host, port), handler)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='OpenAI兼容的本地模拟服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--reply', default=DEFAULT_REPLY)
+    parser.add_argument('--first-token-delay', type=float, default=0.2)
+    parser.add_argument('--token-delay', type=float, default=0.05)
+    parser.add_argument('--chunk-chars', type=int, default=2)
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.reply,
+                         args.first_token_delay, args.token_delay, args.chunk_chars)
+    print(f"🧪 模拟OpenAI接口: http://{args.host}:{args.port}/v1/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
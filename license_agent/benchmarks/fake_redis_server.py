@@ -0,0 +1,219 @@
+"""
+本地模拟的 Redis 服务 - 用于离线验证多进程部署（Socket.IO消息队列 + 智能体任务队列）
+
+只实现多进程部署用到的命令子集：PUBLISH/SUBSCRIBE（Socket.IO跨进程推送）、
+LPUSH/BRPOP（智能体任务队列）以及连接握手相关命令，支持RESP2/RESP3。数据只保存在内存中。
+
+用法:
+    python benchmarks/fake_redis_server.py --port 6379
+
+然后设置 SOCKETIO_MESSAGE_QUEUE=redis://127.0.0.1:6379/0 启动多个 app.py 与 agent_worker.py。
+"""
+import argparse
+import socketserver
+import threading
+import time
+from collections import defaultdict, deque
+
+
+class FakeRedisState:
+    """所有连接共享的数据：列表与频道订阅"""
+
+    def __init__(self):
+        self.lists = defaultdict(deque)
+        self.subscribers = defaultdict(set)
+        self.cond = threading.Condition()
+
+
+class FakeRedisHandler(socketserver.StreamRequestHandler):
+    """处理单个客户端连接"""
+
+    state = None  # 由 make_server 注入
+
+    def setup(self):
+        super().setup()
+        self.write_lock = threading.Lock()
+        self.channels = set()
+        self.resp3 = False
+
+    def finish(self):
+        with self.state.cond:
+            for channel in self.channels:
+                self.state.subscribers[channel].discard(self)
+        super().finish()
+
+    def handle(self):
+        while True:
+            try:
+                args = self._read_command()
+            except (ConnectionError, ValueError):
+                return
+            if args is None:
+                return
+            command = args[0].upper()
+            handler = getattr(self, f"cmd_{command.decode('ascii', 'replace').lower()}", None)
+            if handler is None:
+                self._send(b"-ERR unknown command '" + command + b"'\r\n")
+                continue
+            if handler(args[1:]) is False:
+                return
+
+    # ==================== 协议读写 ====================
+
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b'*'):
+            return line.split()  # inline命令（如 redis-cli 的 PING）
+        args = []
+        for _ in range(int(line[1:])):
+            size = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(size + 2)[:-2])
+        return args
+
+    def _send(self, data: bytes):
+        with self.write_lock:
+            self.wfile.write(data)
+            self.wfile.flush()
+
+    @staticmethod
+    def _bulk(value) -> bytes:
+        if isinstance(value, str):
+            value = value.encode('utf-8')
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+
+    def _array(self, items, kind=b"*") -> bytes:
+        parts = [kind + b"%d\r\n" % len(items)]
+        for item in items:
+            parts.append(b":%d\r\n" % item if isinstance(item, int) else self._bulk(item))
+        return b"".join(parts)
+
+    def _push_message(self, items) -> bytes:
+        """发布/订阅消息：RESP3 使用推送类型，RESP2 使用普通数组"""
+        return self._array(items, b">" if self.resp3 else b"*")
+
+    def _null_array(self) -> bytes:
+        return b"_\r\n" if self.resp3 else b"*-1\r\n"
+
+    # ==================== 命令实现 ====================
+
+    def cmd_hello(self, args):
+        self.resp3 = bool(args) and args[0] == b"3"
+        info = [b"server", b"redis", b"version", b"7.0.0", b"proto", 3 if self.resp3 else 2,
+                b"mode", b"standalone", b"role", b"master"]
+        if self.resp3:
+            # RESP3 的 map 类型：头部为键值对数量，其后与数组元素编码相同
+            body = self._array(info).split(b"\r\n", 1)[1]
+            self._send(b"%%%d\r\n" % (len(info) // 2) + body)
+        else:
+            self._send(self._array(info))
+
+    def cmd_ping(self, args):
+        self._send(self._bulk(args[0]) if args else b"+PONG\r\n")
+
+    def cmd_echo(self, args):
+        self._send(self._bulk(args[0]))
+
+    def cmd_client(self, args):
+        self._send(b"+OK\r\n")
+
+    def cmd_select(self, args):
+        self._send(b"+OK\r\n")
+
+    def cmd_quit(self, args):
+        self._send(b"+OK\r\n")
+        return False
+
+    def cmd_publish(self, args):
+        channel, message = args
+        with self.state.cond:
+            receivers = list(self.state.subscribers[channel])
+        for receiver in receivers:
+            try:
+                receiver._send(receiver._push_message([b"message", channel, message]))
+            except OSError:
+                pass
+        self._send(b":%d\r\n" % len(receivers))
+
+    def cmd_subscribe(self, args):
+        for channel in args:
+            with self.state.cond:
+                self.state.subscribers[channel].add(self)
+            self.channels.add(channel)
+            self._send(self._push_message([b"subscribe", channel, len(self.channels)]))
+
+    def cmd_unsubscribe(self, args):
+        for channel in args or list(self.channels):
+            with self.state.cond:
+                self.state.subscribers[channel].discard(self)
+            self.channels.discard(channel)
+            self._send(self._push_message([b"unsubscribe", channel, len(self.channels)]))
+
+    def cmd_lpush(self, args):
+        self._push(args, left=True)
+
+    def cmd_rpush(self, args):
+        self._push(args, left=False)
+
+    def _push(self, args, left):
+        key, values = args[0], args[1:]
+        with self.state.cond:
+            items = self.state.lists[key]
+            for value in values:
+                items.appendleft(value) if left else items.append(value)
+            length = len(items)
+            self.state.cond.notify_all()
+        self._send(b":%d\r\n" % length)
+
+    def cmd_llen(self, args):
+        with self.state.cond:
+            self._send(b":%d\r\n" % len(self.state.lists.get(args[0], ())))
+
+    def cmd_brpop(self, args):
+        self._blocking_pop(args, left=False)
+
+    def cmd_blpop(self, args):
+        self._blocking_pop(args, left=True)
+
+    def _blocking_pop(self, args, left):
+        keys, timeout = args[:-1], float(args[-1])
+        deadline = time.monotonic() + timeout if timeout else None
+        with self.state.cond:
+            while True:
+                for key in keys:
+                    items = self.state.lists.get(key)
+                    if items:
+                        value = items.popleft() if left else items.pop()
+                        self._send(self._array([key, value]))
+                        return
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self._send(self._null_array())
+                    return
+                self.state.cond.wait(remaining)
+
+
+class FakeRedisServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def make_server(host='127.0.0.1', port=6379):
+    """创建模拟服务器（调用方负责 serve_forever / shutdown）"""
+    handler = type('ConfiguredFakeRedisHandler', (FakeRedisHandler,), {'state': FakeRedisState()})
+    return FakeRedisServer((host, port), handler)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Redis子集的本地模拟服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6379)
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port)
+    print(f"🧪 模拟Redis服务: redis://{args.host}:{args.port}/0")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,201 @@
+"""
+并发会话压测 - 对比 threading / eventlet 等运行模式下单进程可承载的并发聊天会话数
+
+每种模式会启动一个独立的 app.py 子进程（LLM指向本地模拟接口），
+然后同时建立 N 个 Socket.IO 会话，各发送一条消息并等待完整回复。
+
+用法:
+    python benchmarks/load_test_sessions.py --modes threading eventlet --sessions 50 200 500
+
+依赖: websockets（压测客户端使用原生WebSocket实现Socket.IO协议，避免客户端成为瓶颈）
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from http.cookiejar import CookieJar
+
+import websockets
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from fake_openai_server import make_server
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_app(mode, port, llm_url, db_path):
+    """以指定模式启动应用子进程，等待端口可用"""
+    env = dict(
+        os.environ,
+        SOCKETIO_ASYNC_MODE=mode,
+        SERVER_HOST='127.0.0.1',
+        SERVER_PORT=str(port),
+        FLASK_DEBUG='false',
+        DATABASE_URL=f'sqlite:///{db_path}',
+        DEEPSEEK_BASE_URL=llm_url,
+        DEEPSEEK_API_KEY='sk-load-test',
+        # 所有会话共用一个测试账号，关闭单用户速率限制与排队上限
+        ADMISSION_RATE_LIMIT_ENABLED='false',
+        ADMISSION_MAX_QUEUED='100000',
+        ADMISSION_MAX_QUEUED_PER_USER='100000'
+    )
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(PROJECT_DIR, 'web_agent', 'app.py')],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/login', timeout=1)
+            return proc
+        except OSError:
+            time.sleep(0.3)
+    proc.kill()
+    raise RuntimeError(f'{mode} 模式服务启动失败')
+
+
+def http_json(opener, url, payload=None):
+    data = json.dumps(payload).encode('utf-8') if payload is not None else None
+    req = urllib.request.Request(url, data=data, headers={'Content-Type': 'application/json'})
+    with opener.open(req, timeout=30) as resp:
+        return json.loads(resp.read())
+
+
+def prepare_sessions(base_url, count):
+    """登录一次并为每个会话创建独立对话，返回 (cookie, 对话ID列表)"""
+    jar = CookieJar()
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+    http_json(opener, f'{base_url}/api/login', {'username': 'test', 'password': 'test123'})
+    cookie = '; '.join(f'{c.name}={c.value}' for c in jar)
+    conv_ids = [
+        http_json(opener, f'{base_url}/api/conversations', {'title': f'压测{i}'})['conversation']['id']
+        for i in range(count)
+    ]
+    return cookie, conv_ids
+
+
+async def run_session(ws_url, cookie, conv_id, start_event, timeout):
+    """
+    单个Socket.IO会话：连接、发送一条消息，直到收到完整回复
+
+    Returns:
+        (首token延迟, 总延迟)，失败时抛出异常
+    """
+    async with websockets.connect(ws_url, additional_headers={'Cookie': cookie},
+                                  open_timeout=timeout, max_size=None) as ws:
+        await ws.recv()  # Engine.IO open 包
+        await ws.send('40')  # 连接默认命名空间
+        while not (await ws.recv()).startswith('40'):
+            pass
+
+        await start_event.wait()
+        started = time.perf_counter()
+        first_token = None
+        await ws.send('42' + json.dumps(['send_message', {'conversation_id': conv_id, 'message': '你好'}]))
+
+        while True:
+            packet = await asyncio.wait_for(ws.recv(), timeout)
+            if packet == '2':  # Engine.IO ping
+                await ws.send('3')
+                continue
+            if not packet.startswith('42'):
+                continue
+            event, data = json.loads(packet[2:])[:2]
+            if event == 'agent_response' and first_token is None:
+                first_token = time.perf_counter() - started
+            elif event == 'message_complete':
+                return first_token, time.perf_counter() - started
+            elif event == 'error':
+                raise RuntimeError(data.get('message'))
+
+
+async def run_load(base_url, cookie, conv_ids, timeout):
+    ws_url = base_url.replace('http://', 'ws://') + '/socket.io/?EIO=4&transport=websocket'
+    start_event = asyncio.Event()
+    tasks = [
+        asyncio.create_task(asyncio.wait_for(
+            run_session(ws_url, cookie, conv_id, start_event, timeout), timeout * 2
+        ))
+        for conv_id in conv_ids
+    ]
+    # 等全部会话建立连接后同时发送消息
+    await asyncio.sleep(min(10, 0.5 + len(conv_ids) * 0.02))
+    wall_start = time.perf_counter()
+    start_event.set()
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    return results, time.perf_counter() - wall_start
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def summarize(mode, sessions, results, wall):
+    ok = [r for r in results if isinstance(r, tuple)]
+    latencies = [r[1] for r in ok]
+    ttft = [r[0] for r in ok if r[0] is not None]
+    return {
+        'mode': mode,
+        'sessions': sessions,
+        'completed': len(ok),
+        'failed': sessions - len(ok),
+        'wall_seconds': round(wall, 2),
+        'throughput_per_sec': round(len(ok) / wall, 2) if wall else None,
+        'ttft_p50': round(statistics.median(ttft), 3) if ttft else None,
+        'latency_p50': round(statistics.median(latencies), 3) if latencies else None,
+        'latency_p95': round(percentile(latencies, 95), 3) if latencies else None
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='并发会话压测')
+    parser.add_argument('--modes', nargs='+', default=['threading', 'eventlet'])
+    parser.add_argument('--sessions', nargs='+', type=int, default=[50, 200])
+    parser.add_argument('--token-delay', type=float, default=0.05, help='模拟LLM每个token的间隔（秒）')
+    parser.add_argument('--timeout', type=float, default=120)
+    parser.add_argument('--output', help='结果保存为JSON文件')
+    args = parser.parse_args()
+
+    llm_port = free_port()
+    llm_server = make_server(port=llm_port, token_delay=args.token_delay)
+    threading.Thread(target=llm_server.serve_forever, daemon=True).start()
+    llm_url = f'http://127.0.0.1:{llm_port}/v1/'
+
+    report = []
+    for mode in args.modes:
+        for sessions in args.sessions:
+            with tempfile.TemporaryDirectory() as tmp:
+                port = free_port()
+                proc = start_app(mode, port, llm_url, os.path.join(tmp, 'load.db'))
+                try:
+                    base_url = f'http://127.0.0.1:{port}'
+                    cookie, conv_ids = prepare_sessions(base_url, sessions)
+                    results, wall = asyncio.run(run_load(base_url, cookie, conv_ids, args.timeout))
+                    row = summarize(mode, sessions, results, wall)
+                finally:
+                    proc.terminate()
+                    proc.wait(timeout=10)
+            report.append(row)
+            print(json.dumps(row, ensure_ascii=False))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
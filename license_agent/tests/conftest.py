@@ -0,0 +1,31 @@
+"""
+测试公共夹具：每个测试使用独立的 SQLite 临时库
+"""
+import os
+import sys
+
+import pytest
+from flask import Flask
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from web_agent.models import db, init_schema, User, Conversation
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'test.db'}",
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        SECRET_KEY='test'
+    )
+    db.init_app(app)
+    with app.app_context():
+        init_schema()
+        db.session.add(User(id=1, username='alice', password_hash='-', role='developer'))
+        db.session.add(User(id=2, username='bob', password_hash='-', role='developer'))
+        db.session.add(Conversation(id=1, user_id=1, title='对话'))
+        db.session.commit()
+    return app
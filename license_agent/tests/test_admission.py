@@ -0,0 +1,109 @@
+"""
+公平排队：每用户排队上限、排队超时拒绝、按角色权重出队
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from web_agent.admission import AdmissionRejected, FairQueue
+
+
+class _Runner:
+    """按执行顺序记录任务；blocker 任务在 release 之前一直占用并发"""
+
+    def __init__(self):
+        self.order = []
+        self.release = threading.Event()
+        self.finished = threading.Semaphore(0)
+
+    def __call__(self, task):
+        if task['id'] == 'blocker':
+            self.release.wait(5)
+        else:
+            self.order.append(task['id'])
+        self.finished.release()
+
+    def wait(self, count):
+        return all(self.finished.acquire(timeout=5) for _ in range(count))
+
+
+@pytest.fixture
+def runner():
+    return _Runner()
+
+
+@pytest.fixture
+def executor():
+    executor = ThreadPoolExecutor(max_workers=4)
+    yield executor
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _task(task_id, user_id, role='developer'):
+    return {'id': task_id, 'user_id': user_id, 'role': role}
+
+
+def test_per_user_queue_cap(runner, executor):
+    queue = FairQueue(runner, executor, max_concurrent=1, max_queued_per_user=2)
+    assert queue.submit(_task('blocker', 1)) is None
+    queue.check(1)
+    assert queue.submit(_task('a1', 1)) == 1
+    assert queue.submit(_task('a2', 1)) == 2
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        queue.check(1)
+    assert rejected.value.reason == 'user_queue_full'
+    with pytest.raises(AdmissionRejected):
+        queue.submit(_task('a3', 1))
+    # 其他用户不受影响
+    queue.check(2)
+    assert queue.submit(_task('b1', 2)) is not None
+
+    runner.release.set()
+    assert runner.wait(4)
+    assert sorted(runner.order) == ['a1', 'a2', 'b1']
+
+
+def test_global_queue_cap(runner, executor):
+    queue = FairQueue(runner, executor, max_concurrent=1, max_queued=1, queue_timeout=10)
+    queue.submit(_task('blocker', 1))
+    queue.submit(_task('a1', 2))
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        queue.submit(_task('b1', 3))
+    assert rejected.value.reason == 'overloaded' and rejected.value.retry_after == 5
+    runner.release.set()
+
+
+def test_queue_timeout_rejects_via_notify(runner, executor):
+    notified = []
+    queue = FairQueue(runner, executor, max_concurrent=1, queue_timeout=0.1,
+                      notify=lambda task, event, data: notified.append((task['id'], event, data['reason'])))
+    queue.submit(_task('blocker', 1))
+    queue.submit(_task('a1', 2))
+
+    time.sleep(0.2)
+    # 下一次提交时移出超时的排队任务
+    queue.submit(_task('b1', 3))
+    assert notified == [('a1', 'rejected', 'queue_timeout')]
+    assert queue.stats()['expired'] == 1
+
+    runner.release.set()
+    assert runner.wait(2)
+    assert runner.order == ['b1']
+
+
+def test_weighted_fair_order(runner, executor):
+    queue = FairQueue(runner, executor, max_concurrent=1, weights={'admin': 2.0, 'developer': 1.0},
+                      max_queued_per_user=5)
+    queue.submit(_task('blocker', 9))
+    for task in (_task('dev-1', 1), _task('dev-2', 1), _task('dev-3', 1),
+                 _task('admin-1', 2, 'admin'), _task('admin-2', 2, 'admin')):
+        queue.submit(task)
+
+    runner.release.set()
+    assert runner.wait(6)
+    # 虚拟完成时间：admin 每个任务 0.5，developer 每个任务 1.0；相同时按提交顺序
+    assert runner.order == ['admin-1', 'dev-1', 'admin-2', 'dev-2', 'dev-3']
@@ -0,0 +1,83 @@
+"""
+检查点存储：按版本保存通道值、只保留最近的检查点、并发写入冲突
+"""
+from typing import Annotated, TypedDict
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.graph import END, START, StateGraph
+from langgraph.graph.message import add_messages
+from sqlalchemy import func, select
+
+from web_agent.checkpointer import CheckpointConflict, SQLAlchemyCheckpointSaver, blobs_table, checkpoints_table
+
+CONFIG = {"configurable": {"thread_id": "1"}}
+
+
+class _State(TypedDict):
+    messages: Annotated[list, add_messages]
+
+
+def _agent(state):
+    return {"messages": [AIMessage(content=f"reply {len(state['messages'])}")]}
+
+
+@pytest.fixture
+def saver(app):
+    return SQLAlchemyCheckpointSaver(app, retention=3)
+
+
+@pytest.fixture
+def graph(saver):
+    builder = StateGraph(_State)
+    builder.add_node("agent", _agent)
+    builder.add_edge(START, "agent")
+    builder.add_edge("agent", END)
+    return builder.compile(checkpointer=saver)
+
+
+def _count(saver, table):
+    with saver.engine.connect() as conn:
+        return conn.execute(select(func.count()).select_from(table)).scalar()
+
+
+def test_latest_checkpoint_restores_full_state(graph, saver):
+    for turn in range(5):
+        result = graph.invoke({"messages": [HumanMessage(content=f"hi {turn}")]}, CONFIG)
+
+    assert len(result["messages"]) == 10
+    messages = saver.get_tuple(CONFIG).checkpoint["channel_values"]["messages"]
+    assert [m.content for m in messages[-2:]] == ["hi 4", "reply 9"]
+
+
+def test_old_checkpoints_and_unreferenced_blobs_are_pruned(graph, saver):
+    for turn in range(5):
+        graph.invoke({"messages": [HumanMessage(content=f"hi {turn}")]}, CONFIG)
+
+    remaining = list(saver.list(CONFIG))
+    assert len(remaining) == _count(saver, checkpoints_table) == 3
+    referenced = {(channel, str(version))
+                  for item in remaining for channel, version in item.checkpoint["channel_versions"].items()}
+    with saver.engine.connect() as conn:
+        stored = set(conn.execute(select(blobs_table.c.channel, blobs_table.c.version)).tuples())
+    assert stored and stored <= referenced
+
+
+def test_put_with_stale_parent_raises_conflict(graph, saver):
+    for turn in range(2):
+        graph.invoke({"messages": [HumanMessage(content=f"hi {turn}")]}, CONFIG)
+    latest = saver.get_tuple(CONFIG)
+    stale = list(saver.list(CONFIG))[-1]
+
+    with pytest.raises(CheckpointConflict):
+        saver.put(stale.config, {**latest.checkpoint, "id": "zzzz"}, {}, {})
+    assert saver.get_tuple(CONFIG).config == latest.config
+
+
+def test_delete_thread_removes_checkpoints_and_blobs(graph, saver):
+    graph.invoke({"messages": [HumanMessage(content="hi")]}, CONFIG)
+    saver.delete_thread(1)
+
+    assert saver.get_tuple(CONFIG) is None
+    assert _count(saver, checkpoints_table) == 0
+    assert _count(saver, blobs_table) == 0
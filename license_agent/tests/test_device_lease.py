@@ -0,0 +1,122 @@
+"""
+设备租约：相同请求关联、排队与释放后执行下一个、租约到期与轮询接管
+"""
+import itertools
+import threading
+import time
+
+import pytest
+
+from web_agent.device_lease import DeviceLeaseRegistry
+
+DEVICE = '10.0.0.1'
+
+
+def _registry(app, backend='memory', ttl=600):
+    app.config.update(DEVICE_LEASE_BACKEND=backend, DEVICE_LEASE_TTL=ttl, DEVICE_LEASE_POLL_INTERVAL=0.05)
+    registry = DeviceLeaseRegistry()
+    registry.init_app(app)
+    return registry
+
+
+class _Tests:
+    """按申请顺序生成 test_id，记录获得租约开始执行的测试"""
+
+    def __init__(self, prefix='T'):
+        self._ids = (f'{prefix}{n}' for n in itertools.count(1))
+        self.started = []
+        self.changed = threading.Condition()
+
+    def create(self):
+        return next(self._ids)
+
+    def start(self, test_id):
+        with self.changed:
+            self.started.append(test_id)
+            self.changed.notify_all()
+
+    def wait_started(self, test_id, timeout=5):
+        with self.changed:
+            return self.changed.wait_for(lambda: test_id in self.started, timeout)
+
+
+@pytest.mark.parametrize('backend', ['memory', 'database'])
+def test_identical_request_attaches_and_other_request_queues(app, backend):
+    registry, tests = _registry(app, backend), _Tests()
+
+    first = registry.request(DEVICE, 'fp-a', tests.create, tests.start)
+    same = registry.request(DEVICE, 'fp-a', tests.create, tests.start)
+    other = registry.request(DEVICE, 'fp-b', tests.create, tests.start)
+
+    assert first == {"test_id": "T1", "state": "running", "queue_position": None}
+    assert same["test_id"] == "T1" and same["state"] == "attached"
+    assert other == {"test_id": "T2", "state": "queued", "queue_position": 1}
+    assert tests.started == ['T1']
+    assert registry.holder(DEVICE) == ('T1', 'fp-a')
+
+
+def test_release_promotes_next_request_in_order(app):
+    registry, tests = _registry(app), _Tests()
+    for fingerprint in ('fp-a', 'fp-b', 'fp-c'):
+        registry.request(DEVICE, fingerprint, tests.create, tests.start)
+
+    assert registry.release(DEVICE, 'T1') == [('T3', 1)]
+    assert tests.started == ['T1', 'T2']
+    assert registry.holder(DEVICE) == ('T2', 'fp-b')
+
+    assert registry.release(DEVICE, 'T2') == []
+    assert tests.started == ['T1', 'T2', 'T3']
+    registry.release(DEVICE, 'T3')
+    assert registry.holder(DEVICE) is None
+    assert registry.stats() == {"running": 0, "queued": 0}
+
+
+def test_cancel_only_withdraws_queued_request(app):
+    registry, tests = _registry(app), _Tests()
+    registry.request(DEVICE, 'fp-a', tests.create, tests.start)
+    registry.request(DEVICE, 'fp-b', tests.create, tests.start)
+
+    assert registry.cancel(DEVICE, 'T1') is False
+    assert registry.cancel(DEVICE, 'T2') is True
+    assert registry.position('T2') is None
+    registry.release(DEVICE, 'T1')
+    assert tests.started == ['T1']
+
+
+@pytest.mark.parametrize('backend', ['memory', 'database'])
+def test_expired_lease_is_not_held(app, backend):
+    registry = _registry(app, backend, ttl=0.2)
+    assert registry.backend.acquire(DEVICE, 'T1', 'fp-a', 0.2)
+    assert registry.leased([DEVICE, '10.0.0.2']) == {DEVICE}
+
+    time.sleep(0.3)
+    assert registry.holder(DEVICE) is None
+    assert registry.leased([DEVICE]) == set()
+
+    registry.clear_expired()
+    assert registry.backend.acquire(DEVICE, 'T2', 'fp-b', 600)
+    assert registry.holder(DEVICE) == ('T2', 'fp-b')
+
+
+def test_poller_takes_over_lease_expired_in_other_process(app):
+    # 两个注册表共用 device_leases 表，模拟两个进程；持有租约的进程不再续期也不释放
+    other_process, tests_other = _registry(app, 'database', ttl=0.3), _Tests('O')
+    registry, tests = _registry(app, 'database', ttl=600), _Tests()
+
+    other_process.request(DEVICE, 'fp-a', tests_other.create, tests_other.start)
+    assert registry.request(DEVICE, 'fp-b', tests.create, tests.start)["state"] == "queued"
+
+    # 租约到期后由轮询线程为排队的请求获取租约
+    assert tests.wait_started('T1')
+    assert registry.holder(DEVICE) == ('T1', 'fp-b')
+
+
+def test_identical_request_attaches_to_holder_in_other_process(app):
+    other_process, tests_other = _registry(app, 'database'), _Tests('O')
+    registry, tests = _registry(app, 'database'), _Tests()
+
+    other_process.request(DEVICE, 'fp-a', tests_other.create, tests_other.start)
+    lease = registry.request(DEVICE, 'fp-a', tests.create, tests.start)
+
+    assert lease == {"test_id": "O1", "state": "attached", "queue_position": None}
+    assert tests.started == [] and registry.stats() == {"running": 0, "queued": 0}
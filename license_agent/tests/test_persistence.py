@@ -0,0 +1,79 @@
+"""
+后写式持久化队列：组提交、失败操作逐个重写、落库后回调
+"""
+import threading
+
+import pytest
+
+from web_agent.models import db, Message
+from web_agent.persistence import PersistenceQueue
+
+
+@pytest.fixture
+def persistence(app):
+    # 收集窗口足够长，测试中连续提交的操作落在同一批次
+    app.config['PERSIST_FLUSH_INTERVAL'] = 0.2
+    queue = PersistenceQueue(app)
+    yield queue
+    queue.shutdown()
+
+
+def _add(conversation_id, content, fail=False):
+    def work():
+        if fail:
+            raise RuntimeError("写入失败")
+        message = Message(conversation_id=conversation_id, role='user', content=content)
+        db.session.add(message)
+        db.session.flush()
+        return message.id
+    return work
+
+
+def test_ops_commit_in_one_batch(app, persistence):
+    futures = [persistence.submit(_add(1, f"m{i}"), conversation_id=1) for i in range(3)]
+    ids = [future.result(timeout=5) for future in futures]
+
+    assert ids == sorted(ids)
+    assert persistence.stats() == {"queued": 0, "batches": 1, "writes": 3}
+    with app.app_context():
+        assert [m.content for m in Message.query.order_by(Message.id)] == ['m0', 'm1', 'm2']
+
+
+def test_failed_op_is_retried_alone(app, persistence):
+    ok_before = persistence.submit(_add(1, 'before'), conversation_id=1)
+    failing = persistence.submit(_add(1, 'bad', fail=True), conversation_id=1)
+    ok_after = persistence.submit(_add(1, 'after'), conversation_id=1)
+
+    assert ok_before.result(timeout=5) and ok_after.result(timeout=5)
+    with pytest.raises(RuntimeError):
+        failing.result(timeout=5)
+    # 整批回滚后逐个重写：成功的两条各自提交
+    assert persistence.batches == 2
+    assert persistence.wait_for_conversation(1)
+    with app.app_context():
+        assert [m.content for m in Message.query.order_by(Message.id)] == ['before', 'after']
+
+
+def test_on_done_runs_after_commit_off_writer_thread(app, persistence):
+    seen = []
+    done = threading.Event()
+
+    def callback(future):
+        # 回调执行时写入已提交，其他会话可读到
+        with app.app_context():
+            seen.append((threading.current_thread().name, db.session.get(Message, future.result())))
+        done.set()
+
+    persistence.on_done(persistence.submit(_add(1, 'hello'), conversation_id=1), callback)
+    assert done.wait(5)
+
+    thread_name, message = seen[0]
+    assert thread_name.startswith('persistence-callback')
+    assert message is not None and message.content == 'hello'
+
+
+def test_failing_callback_does_not_stop_later_callbacks(persistence):
+    done = threading.Event()
+    persistence.on_done(persistence.submit(lambda: 1), lambda f: 1 / 0)
+    persistence.on_done(persistence.submit(lambda: 2), lambda f: done.set())
+    assert done.wait(5)
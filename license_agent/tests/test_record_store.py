@@ -0,0 +1,32 @@
+"""
+测试记录存储：保存测试记录前的任务归属检查
+"""
+import pytest
+
+from web_agent.models import db, TestJob as Job
+from web_agent.record_store import RecordStore
+
+
+@pytest.fixture
+def store(app):
+    with app.app_context():
+        db.session.add(Job(test_id='TEST-20250101-AAAA0001', user_id=1, device_ip='10.0.0.1',
+                          product_name='P', version='1.0', status='running'))
+        db.session.commit()
+    return RecordStore(app)
+
+
+def test_other_user_cannot_save_record(store):
+    with pytest.raises(LookupError):
+        store.save_from_job('TEST-20250101-AAAA0001', 2, 'bob')
+
+
+def test_owner_passes_ownership_check(store):
+    # 归属检查通过后才检查任务状态
+    with pytest.raises(ValueError):
+        store.save_from_job('TEST-20250101-AAAA0001', 1, 'alice')
+
+
+def test_missing_job(store):
+    with pytest.raises(LookupError):
+        store.save_from_job('TEST-20250101-MISSING0', 1, 'alice')
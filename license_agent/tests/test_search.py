@@ -0,0 +1,75 @@
+"""
+全文检索：候选集截断标记、BM25 排序、只检索本人消息
+"""
+import pytest
+
+from web_agent.models import db, Conversation, Message, TestRecord as Record
+from web_agent.search import SearchIndex
+
+
+@pytest.fixture
+def search(app):
+    with app.app_context():
+        db.session.add(Conversation(id=2, user_id=2, title='bob 的对话'))
+        db.session.add_all([
+            Message(conversation_id=1, role='user', content='在 192.168.1.100 上测试授权 ' + '其他说明' * 30),
+            Message(conversation_id=1, role='assistant', content='192.168.1.100 授权测试失败，192.168.1.100 登录超时'),
+            Message(conversation_id=1, role='user', content='检查 10.0.0.5 的授权'),
+            Message(conversation_id=2, role='user', content='bob 也测了 192.168.1.100'),
+        ])
+        db.session.commit()
+    index = SearchIndex(app)
+    with app.app_context():
+        yield index
+
+
+# scan_limit=0 时走 FTS5 索引（按 owner 匹配），否则扫描本人消息；两条路径结果一致
+@pytest.fixture(params=[0, 5000], ids=['fts', 'scan'])
+def scan_limit(request, search):
+    search.scan_limit = request.param
+    assert search._has_fts()
+    return request.param
+
+
+def test_messages_ranked_by_relevance_and_limited_to_owner(search, scan_limit):
+    results, next_offset, truncated = search.search_messages(1, '192.168.1.100')
+
+    # 关键词出现两次、正文更短的消息排在前面；bob 的消息不出现
+    assert [r['message_id'] for r in results] == [2, 1]
+    assert results[0]['score'] > results[1]['score']
+    assert results[0]['conversation_title'] == '对话'
+    assert next_offset is None and truncated is False
+
+
+def test_truncated_when_hits_exceed_max_candidates(search, scan_limit):
+    search.max_candidates = 2
+    results, _, truncated = search.search_messages(1, '授权')
+    assert len(results) == 2 and truncated is True
+
+    search.max_candidates = 3
+    results, _, truncated = search.search_messages(1, '授权')
+    assert len(results) == 3 and truncated is False
+
+
+def test_multiple_terms_and_short_terms(search, scan_limit):
+    results, _, _ = search.search_messages(1, '授权 失败')
+    assert [r['role'] for r in results] == ['assistant']
+    assert search.search_messages(1, '   ') == ([], None, False)
+
+
+def test_records_rank_field_weight_and_paginate(search):
+    db.session.add_all([
+        Record(record_id='REC-1', test_id='TEST-1', user_id=1, product_name='P', version='1.0',
+               device_ip='10.0.0.1', operator='alice', status='failed', message='设备 10.0.0.9 无响应'),
+        Record(record_id='REC-2', test_id='TEST-2', user_id=1, product_name='P', version='1.0',
+               device_ip='10.0.0.9', operator='alice', status='success', message='完成'),
+    ])
+    db.session.commit()
+
+    results, next_offset, truncated = search.search_records('10.0.0.9', limit=1)
+    # 设备IP字段的权重高于备注
+    assert [r['record_id'] for r in results] == ['REC-2']
+    assert next_offset == 1 and truncated is False
+
+    results, next_offset, _ = search.search_records('10.0.0.9', limit=1, offset=1)
+    assert [r['record_id'] for r in results] == ['REC-1'] and next_offset is None
@@ -0,0 +1,33 @@
+from web_agent import tool_log
+from web_agent.tool_log import ToolCallLog
+
+FLEET_CSV = (
+    "device_ip,product_name,version,username,password\n"
+    "10.0.0.1,存储系统01,v1.0,admin,S3cret-Pass\n"
+    "10.0.0.2,存储系统02,v2.0,root,hunter2\n"
+)
+
+
+def test_stored_fleet_tool_call_contains_no_credential():
+    log = ToolCallLog()
+    log.call('call-1', 'execute_fleet_test', {
+        'csv_text': FLEET_CSV,
+        'devices': [{'device_ip': '10.0.0.3', 'product_name': 'p', 'version': 'v',
+                     'username': 'admin', 'password': 'plain-pass'}]
+    })
+    text, payloads = tool_log.encode(log.take())
+
+    stored = tool_log.decode(text)[0]['args']
+    raw = repr(stored)
+    for secret in ('S3cret-Pass', 'hunter2', 'plain-pass'):
+        assert secret not in raw
+    assert not payloads
+    # 设备、产品、版本保留，便于审计
+    assert '10.0.0.1,存储系统01,v1.0,admin,***' in stored['csv_text']
+    assert stored['devices'][0]['device_ip'] == '10.0.0.3'
+
+
+def test_redact_masks_sensitive_keys_recursively():
+    args = {'device_ip': '10.0.0.1', 'auth': {'api_key': 'k', 'token': 't'}, 'passwd': 'p'}
+    assert tool_log.redact(args) == {'device_ip': '10.0.0.1', 'auth': {'api_key': '***', 'token': '***'},
+                                     'passwd': '***'}
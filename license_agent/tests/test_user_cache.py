@@ -0,0 +1,28 @@
+"""
+用户身份缓存：Socket.IO 连接的身份随用户更新与删除失效
+"""
+from web_agent.models import db, User
+from web_agent.user_cache import UserCache
+
+
+def test_socket_user_sees_role_change_and_deletion(app):
+    cache = UserCache()
+    cache.init_app(app)
+    with app.app_context():
+        cache.bind_socket('sid-1', cache.load(2))
+        assert cache.socket_user('sid-1').role == 'developer'
+
+        db.session.get(User, 2).role = 'admin'
+        db.session.commit()
+        assert cache.socket_user('sid-1').role == 'admin'
+
+        db.session.delete(db.session.get(User, 2))
+        db.session.commit()
+        assert cache.socket_user('sid-1') is None
+        assert cache.unbind_socket('sid-1').username == 'bob'
+
+
+def test_unbound_socket(app):
+    cache = UserCache()
+    with app.app_context():
+        assert cache.socket_user('sid-unknown') is None
@@ -0,0 +1,327 @@
+"""
+准入控制 - 在 handle_message 与智能体之间限制单个用户对LLM与工具资源的占用
+
+- RateLimiter: 每用户与每角色两级令牌桶，超出速率的消息直接拒绝（rejected 事件，附建议重试时间）
+- FairQueue: 全局并发上限 + 加权公平排队。并发已满时按用户排队，每个用户的任务按
+  虚拟完成时间（1/角色权重 递增）出队，连续发送大量消息的用户不会挤占其他用户；
+  排队时推送 queued 事件，排队过长或超时的任务推送 rejected 事件
+"""
+import heapq
+import itertools
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+
+class AdmissionRejected(Exception):
+    """请求未被接纳"""
+
+    def __init__(self, reason: str, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.reason = reason
+        self.message = message
+        self.retry_after = retry_after
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'reason': self.reason,
+            'message': self.message,
+            'retry_after': round(self.retry_after, 1) if self.retry_after is not None else None
+        }
+
+
+class TokenBucket:
+    """令牌桶：按 rate 个/秒补充，最多积累 burst 个"""
+
+    __slots__ = ('rate', 'burst', 'tokens', 'updated_at')
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self) -> float:
+        """距离有一个可用令牌还需等待的秒数（0 表示可立即取用）"""
+        self._refill()
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else float('inf')
+
+    def take(self):
+        self._refill()
+        self.tokens -= 1
+
+
+class RateLimiter:
+    """每用户与每角色两级令牌桶（Flask扩展风格，通过 init_app 读取配置）"""
+
+    def __init__(self, max_users: int = 10000):
+        self.enabled = True
+        self.user_limits = {}
+        self.role_limits = {}
+        self.max_users = max_users
+        self._user_buckets = OrderedDict()  # user_id -> TokenBucket（按最近使用淘汰）
+        self._role_buckets = {}
+        self._lock = threading.Lock()
+        self.rejected = Counter()
+
+    def init_app(self, app):
+        self.enabled = app.config.get('ADMISSION_RATE_LIMIT_ENABLED', True)
+        self.user_limits = app.config.get('ADMISSION_USER_LIMITS', {})
+        self.role_limits = app.config.get('ADMISSION_ROLE_LIMITS', {})
+
+    def check(self, user_id: int, role: str):
+        """
+        为一条消息取用令牌，用户与角色的桶都有令牌时才放行
+
+        Raises:
+            AdmissionRejected: 超出速率限制
+        """
+        if not self.enabled:
+            return
+        user_limit = self.user_limits.get(role) or self.user_limits.get('developer')
+        role_limit = self.role_limits.get(role)
+
+        with self._lock:
+            buckets = []
+            if user_limit:
+                bucket = self._user_buckets.get(user_id)
+                if bucket is None:
+                    bucket = self._user_buckets[user_id] = TokenBucket(user_limit['rate'], user_limit['burst'])
+                    while len(self._user_buckets) > self.max_users:
+                        self._user_buckets.popitem(last=False)
+                self._user_buckets.move_to_end(user_id)
+                buckets.append(('user', bucket))
+            if role_limit:
+                bucket = self._role_buckets.get(role)
+                if bucket is None:
+                    bucket = self._role_buckets[role] = TokenBucket(role_limit['rate'], role_limit['burst'])
+                buckets.append(('role', bucket))
+
+            # 先检查全部桶再扣减，被拒绝的消息不消耗任何一级的令牌
+            for scope, bucket in buckets:
+                wait = bucket.wait_time()
+                if wait > 0:
+                    self.rejected[scope] += 1
+                    raise AdmissionRejected(
+                        'rate_limited',
+                        '发送过于频繁，请稍后再试' if scope == 'user' else '当前使用人数较多，请稍后再试',
+                        retry_after=wait
+                    )
+            for _, bucket in buckets:
+                bucket.take()
+
+
+class _Entry:
+    __slots__ = ('task', 'user_id', 'enqueued_at')
+
+    def __init__(self, task, user_id):
+        self.task = task
+        self.user_id = user_id
+        self.enqueued_at = time.monotonic()
+
+
+class FairQueue:
+    """全局并发上限 + 按用户加权公平排队的执行器"""
+
+    def __init__(
+        self,
+        runner: Callable[[Dict[str, Any]], None],
+        executor,
+        max_concurrent: int,
+        weights: Optional[Dict[str, float]] = None,
+        max_queued: int = 200,
+        max_queued_per_user: int = 3,
+        queue_timeout: float = 60,
+        notify: Optional[Callable[[Dict[str, Any], str, Dict[str, Any]], None]] = None
+    ):
+        """
+        Args:
+            runner: 执行单个任务的函数，任务字典需包含 user_id 与 role
+            executor: 执行任务的线程池
+            max_concurrent: 同时执行的任务上限
+            weights: 角色权重，权重越大排队时出队越快
+            max_queued / max_queued_per_user: 全局与每用户的排队上限，超出时拒绝
+            queue_timeout: 排队超过该时间（秒）的任务不再执行，直接拒绝
+            notify: 推送 queued / rejected 事件的回调 (task, event, data)
+        """
+        self.runner = runner
+        self.executor = executor
+        self.max_concurrent = max_concurrent
+        self.weights = weights or {}
+        self.max_queued = max_queued
+        self.max_queued_per_user = max_queued_per_user
+        self.queue_timeout = queue_timeout
+        self.notify = notify
+
+        self._heap = []  # (虚拟完成时间, 序号, _Entry)
+        self._seq = itertools.count()
+        self._virtual_time = 0.0
+        self._last_finish = {}  # user_id -> 该用户最后一个任务的虚拟完成时间
+        self._queued_by_user = Counter()
+        self._running = 0
+        self._lock = threading.Lock()
+        self._room = threading.Condition(self._lock)
+        self.stats_counter = Counter()
+
+        # 并发占满时没有任务完成也要按时拒绝超时的排队任务
+        threading.Thread(target=self._sweep, name='admission-sweeper', daemon=True).start()
+
+    def submit(self, task: Dict[str, Any]) -> Optional[int]:
+        """
+        提交任务：有空闲并发时立即执行，否则排队
+
+        Returns:
+            排队位置（从1开始），立即执行时返回 None
+
+        Raises:
+            AdmissionRejected: 排队已满
+        """
+        user_id = task['user_id']
+        with self._lock:
+            expired = self._expire()
+        self._reject_expired(expired)
+
+        with self._lock:
+            if self._running < self.max_concurrent and not self._heap:
+                self._running += 1
+                self.stats_counter['admitted'] += 1
+                self.executor.submit(self._run, task)
+                return None
+
+            if self._queued_by_user[user_id] >= self.max_queued_per_user:
+                self.stats_counter['rejected'] += 1
+                raise AdmissionRejected('user_queue_full', '您已有多条消息在排队，请等待当前回复完成')
+            if len(self._heap) >= self.max_queued:
+                self.stats_counter['rejected'] += 1
+                raise AdmissionRejected('overloaded', '系统繁忙，请稍后再试', retry_after=self.queue_timeout / 2)
+
+            weight = self.weights.get(task.get('role'), 1.0)
+            finish = max(self._virtual_time, self._last_finish.get(user_id, 0.0)) + 1.0 / weight
+            self._last_finish[user_id] = finish
+            heapq.heappush(self._heap, (finish, next(self._seq), _Entry(task, user_id)))
+            self._queued_by_user[user_id] += 1
+            self.stats_counter['enqueued'] += 1
+            return sum(1 for item in self._heap if item[0] <= finish)
+
+    def check(self, user_id: int):
+        """
+        提交前检查排队容量（调用方据此决定是否保存消息），检查与提交之间的并发仍可能使 submit 被拒绝
+
+        Raises:
+            AdmissionRejected: 该用户或全局排队已满
+        """
+        with self._lock:
+            if self._running < self.max_concurrent and not self._heap:
+                return
+            if self._queued_by_user[user_id] >= self.max_queued_per_user:
+                raise AdmissionRejected('user_queue_full', '您已有多条消息在排队，请等待当前回复完成')
+            if len(self._heap) >= self.max_queued:
+                raise AdmissionRejected('overloaded', '系统繁忙，请稍后再试', retry_after=self.queue_timeout / 2)
+
+    def wait_for_room(self, timeout: Optional[float] = None) -> bool:
+        """等待排队长度低于上限（供从外部队列拉取任务的工作进程使用）"""
+        with self._room:
+            return self._room.wait_for(lambda: len(self._heap) < self.max_queued, timeout)
+
+    def _run(self, task: Dict[str, Any]):
+        try:
+            self.runner(task)
+        except Exception as e:
+            print(f"❌ 对话任务执行失败: {e}")
+        finally:
+            with self._lock:
+                self._running -= 1
+                expired = self._expire()
+                self._dispatch()
+            self._reject_expired(expired)
+
+    def _sweep(self):
+        while True:
+            time.sleep(1)
+            with self._lock:
+                expired = self._expire()
+            self._reject_expired(expired)
+
+    def _dispatch(self):
+        """出队虚拟完成时间最小的任务（需持有锁）"""
+        while self._heap and self._running < self.max_concurrent:
+            finish, _, entry = heapq.heappop(self._heap)
+            self._dequeued(entry)
+            self._virtual_time = finish
+            self._running += 1
+            self.stats_counter['admitted'] += 1
+            self.executor.submit(self._run, entry.task)
+
+        # 清理已落后于虚拟时间的用户记录
+        if len(self._last_finish) > 1000:
+            self._last_finish = {u: f for u, f in self._last_finish.items() if f > self._virtual_time}
+
+    def _expire(self) -> list:
+        """移出排队超时的任务（需持有锁），返回被移出的任务"""
+        if not self._heap:
+            return []
+        deadline = time.monotonic() - self.queue_timeout
+        expired = [item[2] for item in self._heap if item[2].enqueued_at < deadline]
+        if not expired:
+            return []
+        self._heap = [item for item in self._heap if item[2].enqueued_at >= deadline]
+        heapq.heapify(self._heap)
+        for entry in expired:
+            self._dequeued(entry)
+            self.stats_counter['expired'] += 1
+        return expired
+
+    def _reject_expired(self, expired: list):
+        """在锁外推送超时拒绝事件"""
+        for entry in expired:
+            self._notify(entry.task, 'rejected', AdmissionRejected(
+                'queue_timeout', '排队等待超时，请稍后重新发送'
+            ).to_dict())
+
+    def _dequeued(self, entry: _Entry):
+        self._queued_by_user[entry.user_id] -= 1
+        if self._queued_by_user[entry.user_id] <= 0:
+            del self._queued_by_user[entry.user_id]
+        self._room.notify_all()
+
+    def _notify(self, task, event, data):
+        if self.notify is not None:
+            try:
+                self.notify(task, event, data)
+            except Exception as e:
+                print(f"⚠️ 准入事件推送失败: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "running": self._running,
+                "queued": len(self._heap),
+                "queued_users": len(self._queued_by_user),
+                **self.stats_counter
+            }
+
+
+def create_fair_queue(config, runner, executor, notify=None, max_queued=None) -> FairQueue:
+    """按应用配置创建公平排队执行器（全局并发上限即 AGENT_MAX_WORKERS）"""
+    return FairQueue(
+        runner,
+        executor,
+        max_concurrent=config.get('AGENT_MAX_WORKERS', 32),
+        weights=config.get('ADMISSION_WEIGHTS'),
+        max_queued=max_queued or config.get('ADMISSION_MAX_QUEUED', 200),
+        max_queued_per_user=config.get('ADMISSION_MAX_QUEUED_PER_USER', 3),
+        queue_timeout=config.get('ADMISSION_QUEUE_TIMEOUT', 60),
+        notify=notify
+    )
+
+
+# 全局速率限制器，在 app.py 中通过 init_app 读取配置
+rate_limiter = RateLimiter()
@@ -0,0 +1,242 @@
+"""
+智能体对话轮次执行 - 与Socket.IO连接解耦，可在Web进程或独立的 agent_worker 进程中运行
+
+事件通过 socketio.emit(..., to=sid) 推送：配置了消息队列时，
+即使执行轮次的进程不持有该客户端连接，事件也会经消息队列转发到正确的进程。
+同一对话的轮次在本进程内依次执行（见 ConversationLocks），跨进程的并发写入由检查点存储检测。
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, Dict, Optional
+
+from web_agent.device_cache import device_check_cache
+from web_agent.http_client import create_llm_http_client_from_config
+from web_agent.metrics import SOCKETIO_EMIT_SECONDS, component_stats, observe
+from web_agent.persistence import persistence
+from web_agent.record_store import test_record_store
+from web_agent.tool_log import ToolCallLog, redact
+
+if TYPE_CHECKING:
+    from web_agent.agent_service import AgentService
+
+
+def create_agent_service(app) -> 'AgentService':
+    """按应用配置创建智能体服务（检查点保存在应用数据库中，多进程共享对话记忆）"""
+    # langchain / langgraph 导入耗时较长，推迟到真正创建服务时
+    from web_agent.agent_service import AgentService
+    from web_agent.checkpointer import SQLAlchemyCheckpointSaver
+    from web_agent.llm_cache import create_llm_cache_backend
+
+    config = app.config
+    device_check_cache.init_app(app)
+    test_record_store.init_app(app)
+    service = AgentService(
+        api_key=config['DEEPSEEK_API_KEY'],
+        base_url=config['DEEPSEEK_BASE_URL'],
+        model_name=config['DEEPSEEK_MODEL'],
+        streaming=config['LLM_STREAMING'],
+        tool_max_workers=config['TOOL_MAX_WORKERS'],
+        tool_timeout=config['TOOL_TIMEOUT'],
+        tool_timeouts=config['TOOL_TIMEOUTS'],
+        checkpointer=SQLAlchemyCheckpointSaver(app, retention=config['CHECKPOINT_RETENTION']),
+        max_history_messages=config['AGENT_MEMORY_MAX_MESSAGES'],
+        context_token_budget=config['CONTEXT_TOKEN_BUDGET'],
+        http_client=create_llm_http_client_from_config(config),
+        llm_cache_backend=create_llm_cache_backend(config)
+    )
+
+    # 组件统计随 /metrics 一起导出
+    component_stats.add('device_cache', device_check_cache.stats)
+    component_stats.add('llm_pool', service.http_client.pool_stats.snapshot)
+    if service.llm_cache is not None:
+        component_stats.add('llm_cache', service.llm_cache.stats)
+    return service
+
+
+class LazyAgentService:
+    """
+    延迟创建的智能体服务
+
+    lazy 模式在第一条消息到来时创建；background 模式在后台线程预热，预热完成前到达的消息
+    等待预热结束；eager 模式在构造时同步创建（与直接调用 create_agent_service 相同）。
+    """
+
+    def __init__(self, app, mode: str = 'background'):
+        self.app = app
+        self.mode = mode
+        self.error = None
+        self.load_seconds = None
+        self._service = None
+        self._lock = threading.Lock()
+
+        if mode == 'eager':
+            self.get()
+        elif mode == 'background':
+            threading.Thread(target=self._warm_up, name='agent-warmup', daemon=True).start()
+
+    @property
+    def ready(self) -> bool:
+        return self._service is not None
+
+    def current(self) -> Optional['AgentService']:
+        """已创建的服务，尚未加载时返回 None（不触发加载）"""
+        return self._service
+
+    def get(self) -> 'AgentService':
+        """返回智能体服务，尚未创建时在当前线程创建（并发调用只创建一次）"""
+        if self._service is None:
+            with self._lock:
+                if self._service is None:
+                    started = time.perf_counter()
+                    self._service = create_agent_service(self.app)
+                    self.load_seconds = time.perf_counter() - started
+                    self.error = None
+                    print(f"🤖 智能体服务已加载（{self.load_seconds:.2f}s）")
+        return self._service
+
+    def _warm_up(self):
+        try:
+            self.get()
+        except Exception as e:
+            # 预热失败时保留错误信息供就绪检查展示，第一条消息到来时会再次尝试
+            self.error = str(e)
+            print(f"⚠️ 智能体服务预热失败: {e}")
+
+
+class ConversationLocks:
+    """按对话ID分配的锁：同一对话的轮次依次执行，不同对话互不影响（无人使用的锁随即释放）"""
+
+    def __init__(self):
+        self._locks = {}  # conversation_id -> [lock, 使用者数量]
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def hold(self, conversation_id):
+        with self._lock:
+            entry = self._locks.setdefault(conversation_id, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[conversation_id]
+
+
+# 本进程中执行的对话轮次按对话串行
+conversation_locks = ConversationLocks()
+
+
+def reject_turn(socketio, task: Dict[str, Any], data: Dict[str, Any]):
+    """
+    本轮在排队阶段被拒绝：撤回已保存的用户消息并通知客户端
+
+    避免对话中留下没有回复的用户消息，客户端按提示重新发送时也不会重复。
+    """
+    if task.get('message_id') is not None:
+        persistence.on_done(
+            persistence.delete_message(task['message_id'], task['conversation_id']),
+            lambda future: future.exception() and print(f"⚠️ 撤回用户消息失败: {future.exception()}")
+        )
+    socketio.emit('rejected', {**data, 'message_id': task.get('message_id')}, to=task['sid'])
+
+
+def run_agent_turn(agent_service: 'AgentService', socketio, task: Dict[str, Any]):
+    """
+    执行一轮对话并把事件推送给发起请求的客户端
+
+    Args:
+        agent_service: 智能体服务
+        socketio: SocketIO实例（Web进程中的服务端实例，或 worker 进程中的只写实例）
+        task: 对话任务 {"user_id", "role", "conversation_id", "message", "message_id", "sid"}
+    """
+    sid = task['sid']
+    conversation_id = task['conversation_id']
+    assistant_content = ""
+    # 本轮的工具调用事件，随AI回复一起保存（没有最终回复时单独保存为 tool 消息）
+    tool_calls = ToolCallLog()
+
+    def send(event: str, data: Dict[str, Any]):
+        with observe(SOCKETIO_EMIT_SECONDS, event=event):
+            socketio.emit(event, data, to=sid)
+
+    def stream_callback(event):
+        """流式回调函数"""
+        nonlocal assistant_content
+
+        event_type = event.get('type')
+        event_data = event.get('data', {})
+
+        if event_type == 'tool_call':
+            # 工具调用
+            tool_calls.call(event_data.get('tool_call_id'), event_data.get('tool_name'),
+                            event_data.get('parameters'))
+            send('tool_call', {
+                'tool_name': event_data.get('tool_name'),
+                'parameters': redact(event_data.get('parameters') or {})
+            })
+
+        elif event_type == 'tool_result':
+            tool_calls.result(event_data.get('tool_call_id'), event_data.get('tool_name'),
+                              event_data.get('status'), event_data.get('duration_ms'),
+                              event_data.get('content'))
+
+        elif event_type == 'assistant_message':
+            # AI回复：未完成时content为token增量，完成时为完整回复
+            content = event_data.get('content', '')
+            is_complete = event_data.get('is_complete', False)
+
+            if is_complete:
+                assistant_content = content
+            else:
+                assistant_content += content
+
+            send('agent_response', {
+                'content': content,
+                'is_complete': is_complete
+            })
+
+            if is_complete:
+                # 保存AI消息并更新对话时间（每轮只保存一次完整内容），落库后通知客户端
+                def on_saved(future):
+                    if future.exception() is not None:
+                        send('error', {'message': f'消息保存失败: {future.exception()}'})
+                    else:
+                        send('message_complete', {'message': future.result()})
+
+                persistence.on_done(persistence.add_message(
+                    conversation_id, 'assistant', content, touch_conversation=True,
+                    tool_events=tool_calls.take()
+                ), on_saved)
+
+        elif event_type == 'error':
+            # 错误
+            save_orphan_tool_calls()
+            send('error', {
+                'message': event_data.get('message', '处理消息时发生错误')
+            })
+
+        elif event_type == 'complete':
+            # 完成
+            save_orphan_tool_calls()
+            print(f"✅ 消息处理完成")
+
+    def save_orphan_tool_calls():
+        """本轮没有最终回复时，已执行的工具调用单独保存，审计记录不丢失"""
+        if tool_calls:
+            persistence.on_done(
+                persistence.add_message(conversation_id, 'tool', '', tool_events=tool_calls.take()),
+                lambda future: future.exception() and print(f"⚠️ 工具调用记录保存失败: {future.exception()}")
+            )
+
+    # 同一对话的上一轮尚未结束时等待，两轮并发会基于同一个检查点各自写入
+    with conversation_locks.hold(conversation_id):
+        agent_service.chat_stream(
+            task['message'],
+            stream_callback,
+            user_id=task['user_id'],
+            conversation_id=conversation_id
+        )
@@ -3,32 +3,33 @@
 """
 import json
 import time
+import uuid
 from typing import Dict, Any, List, Callable, TypedDict, Annotated, Literal
-from datetime import datetime
 
 from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+from langchain_core.messages import HumanMessage, AIMessage, AIMessageChunk, RemoveMessage
+from langchain_core.runnables import RunnableConfig
 from langchain_core.tools import tool
 from langgraph.graph import StateGraph, END
-from langgraph.prebuilt import ToolNode
 from langgraph.graph.message import add_messages
 
+from web_agent.context_compaction import ContextCompactor
+from web_agent.device_cache import device_check_cache
+from web_agent.fleet import fleet_scheduler, parse_devices
+from web_agent.jobs import job_manager
+from web_agent.llm_cache import LLMResponseCache
+from web_agent.metrics import (
+    AGENT_ERRORS, AGENT_NODE_SECONDS, AGENT_TTFT_SECONDS, AGENT_TURN_SECONDS, AGENT_TURNS_ACTIVE,
+    observe, record_llm_call, span
+)
+from web_agent.record_store import test_record_store
+from web_agent.tool_executor import ConcurrentToolNode
 
-# ==================== 工具定义（复用之前的代码） ====================
 
-@tool
-def check_device_connection(device_ip: str, username: str, password: str) -> Dict[str, Any]:
-    """
-    检查目标设备是否在线并获取基本信息
-
-    Args:
-        device_ip: 设备IP地址或域名
-        username: 设备登录用户名
-        password: 设备登录密码
+# ==================== 工具定义（复用之前的代码） ====================
 
-    Returns:
-        包含设备连接状态和基本信息的字典
-    """
+def _probe_device(device_ip: str, username: str, password: str) -> Dict[str, Any]:
+    """实际探测设备（模拟一次完整的网络往返）"""
     time.sleep(1)
 
     # 模拟不同场景
@@ -58,6 +59,23 @@ def check_device_connection(device_ip: str, username: str, password: str) -> Dic
     }
 
 
+@tool
+def check_device_connection(device_ip: str, username: str, password: str) -> Dict[str, Any]:
+    """
+    检查目标设备是否在线并获取基本信息
+
+    Args:
+        device_ip: 设备IP地址或域名
+        username: 设备登录用户名
+        password: 设备登录密码
+
+    Returns:
+        包含设备连接状态和基本信息的字典
+    """
+    # 短时间内重复检查同一设备直接返回缓存结果，并发检查合并为一次探测
+    return device_check_cache.check(device_ip, username, password, _probe_device)
+
+
 @tool
 def execute_auth_test(
     device_ip: str,
@@ -65,12 +83,15 @@ def execute_auth_test(
     password: str,
     product_name: str,
     version: str,
-    timeout: int = 300
+    timeout: int = 300,
+    config: RunnableConfig = None
 ) -> Dict[str, Any]:
     """
-    执行设备授权测试的完整流程
+    提交设备授权测试任务，后台异步执行完整流程
 
-    包括获取特征文件、上传授权系统、下载授权文件、导入设备、验证激活状态
+    包括获取特征文件、上传授权系统、下载授权文件、导入设备、验证激活状态。
+    工具立即返回测试任务ID，执行进度会实时推送给用户；
+    需要最终结果时使用 query_auth_test_status 查询。
 
     Args:
         device_ip: 设备IP地址
@@ -81,64 +102,155 @@ def execute_auth_test(
         timeout: 超时时间（秒），默认300
 
     Returns:
-        包含测试执行结果的字典
+        包含测试任务ID和当前状态的字典
     """
-    test_id = f"TEST-{datetime.now().strftime('%Y%m%d')}-{int(time.time()) % 1000:03d}"
-
-    steps = [
-        {"step": 1, "name": "登录设备门户", "status": "pending"},
-        {"step": 2, "name": "获取硬件特征文件", "status": "pending"},
-        {"step": 3, "name": "上传到授权系统", "status": "pending"},
-        {"step": 4, "name": "生成授权文件", "status": "pending"},
-        {"step": 5, "name": "导入授权文件到设备", "status": "pending"},
-        {"step": 6, "name": "验证授权激活状态", "status": "pending"}
-    ]
-
-    # 模拟执行过程
-    for step in steps:
-        time.sleep(0.5)
-
-        # 模拟第3步可能失败（10.0.0网段设备）
-        if step['step'] == 3 and device_ip.startswith("10.0.0"):
-            step['status'] = 'failed'
-            step['error'] = {
-                "code": "NETWORK_TIMEOUT",
-                "message": "连接授权系统超时",
-                "suggestion": "请检查授权系统网络连通性，或稍后重试"
-            }
-            return {
-                "success": False,
-                "test_id": test_id,
-                "data": {
-                    "steps": steps,
-                    "summary": {
-                        "total_steps": 6,
-                        "success_steps": 2,
-                        "failed_steps": 1,
-                        "failed_at_step": 3
-                    }
-                },
-                "message": f"授权测试在第{step['step']}步失败"
-            }
+    user_id = (config or {}).get("configurable", {}).get("user_id")
+    if user_id is None:
+        return {
+            "success": False,
+            "error": "缺少用户上下文",
+            "message": "无法确定任务所属用户，授权测试未提交"
+        }
 
-        step['status'] = 'success'
-        step['duration'] = round(0.5 + (step['step'] % 3) * 0.5, 1)
+    job = job_manager.submit(
+        user_id=user_id,
+        device_ip=device_ip,
+        username=username,
+        password=password,
+        product_name=product_name,
+        version=version,
+        timeout=timeout
+    )
+    if job["attached"]:
+        message = "该设备上已有相同的授权测试，已关联到该测试，无需重复执行"
+    elif job["queue_position"]:
+        message = f"该设备正在执行其他授权测试，已排队（第{job['queue_position']}位），轮到后自动执行"
+    else:
+        message = "授权测试已提交，正在后台执行"
+    return {
+        "success": True,
+        "test_id": job["test_id"],
+        "data": {
+            "status": job["status"],
+            "attached": job["attached"],
+            "queue_position": job["queue_position"]
+        },
+        "message": message
+    }
 
-    total_duration = sum(s.get('duration', 0) for s in steps)
+
+@tool
+def query_auth_test_status(test_id: str, config: RunnableConfig = None) -> Dict[str, Any]:
+    """
+    查询授权测试任务的执行状态和结果
+
+    Args:
+        test_id: 测试任务ID
+
+    Returns:
+        包含任务状态、当前步骤及最终结果（如已完成）的字典
+    """
+    user_id = (config or {}).get("configurable", {}).get("user_id")
+    job = job_manager.get(test_id)
+    # 只能查询本人的任务或本人关联到的任务；无权查询时与任务不存在的返回相同
+    if not job or user_id is None or not job_manager.can_view(job, user_id):
+        return {
+            "success": False,
+            "error": "任务不存在",
+            "message": f"未找到测试任务 {test_id}"
+        }
 
     return {
         "success": True,
         "test_id": test_id,
         "data": {
-            "steps": steps,
-            "total_duration": total_duration,
-            "summary": {
-                "total_steps": 6,
-                "success_steps": 6,
-                "failed_steps": 0
-            }
+            "status": job["status"],
+            "queue_position": job["queue_position"],
+            "current_step": job["current_step"],
+            "result": job["result"]
+        },
+        "message": "查询成功"
+    }
+
+
+@tool
+def execute_fleet_test(
+    devices: List[Dict[str, str]] = None,
+    csv_text: str = None,
+    timeout: int = 300,
+    config: RunnableConfig = None
+) -> Dict[str, Any]:
+    """
+    批量提交多台设备的授权测试（如整个发布版本矩阵），后台并发执行
+
+    每台设备需提供 device_ip, product_name, version, username, password；
+    可直接传设备列表，或传带表头的CSV文本。工具立即返回批次ID，
+    聚合进度会实时推送给用户；需要合并报告时使用 query_fleet_test_status 查询。
+
+    Args:
+        devices: 设备列表（可选）
+        csv_text: CSV格式的设备清单，首行为表头（可选）
+        timeout: 单台设备的超时时间（秒），默认300
+
+    Returns:
+        包含批次ID和设备数量的字典
+    """
+    user_id = (config or {}).get("configurable", {}).get("user_id")
+    if user_id is None:
+        return {
+            "success": False,
+            "error": "缺少用户上下文",
+            "message": "无法确定任务所属用户，批量测试未提交"
+        }
+
+    try:
+        batch = fleet_scheduler.submit(user_id, parse_devices(devices, csv_text), timeout=timeout)
+    except ValueError as e:
+        return {
+            "success": False,
+            "error": "设备清单无效",
+            "message": str(e)
+        }
+
+    return {
+        "success": True,
+        "batch_id": batch["batch_id"],
+        "data": {
+            "status": batch["status"],
+            "total": batch["total"]
         },
-        "message": "授权测试执行成功"
+        "message": f"批量授权测试已提交，共 {batch['total']} 台设备，正在后台执行"
+    }
+
+
+@tool
+def query_fleet_test_status(batch_id: str, config: RunnableConfig = None) -> Dict[str, Any]:
+    """
+    查询批量授权测试的进度，全部完成后返回合并报告
+
+    Args:
+        batch_id: 批次ID
+
+    Returns:
+        包含批次进度及合并报告（如已完成）的字典
+    """
+    user_id = (config or {}).get("configurable", {}).get("user_id")
+    batch = fleet_scheduler.get(batch_id)
+    # 只能查询本人的批次；无权查询时与批次不存在的返回相同
+    if not batch or user_id is None or batch["user_id"] != user_id:
+        return {
+            "success": False,
+            "error": "批次不存在",
+            "message": f"未找到批量测试 {batch_id}"
+        }
+
+    # 报告中已包含失败明细，不再返回每台设备的执行情况
+    batch.pop("items", None)
+    return {
+        "success": True,
+        "batch_id": batch_id,
+        "data": batch,
+        "message": "查询成功"
     }
 
 
@@ -170,7 +282,8 @@ def generate_test_report(test_id: str, report_format: str = "html") -> Dict[str,
 
 
 @tool
-def save_test_record(test_id: str, operator: str, tags: List[str] = None) -> Dict[str, Any]:
+def save_test_record(test_id: str, operator: str, tags: List[str] = None,
+                     config: RunnableConfig = None) -> Dict[str, Any]:
     """
     将测试验证记录持久化保存到数据库
 
@@ -182,14 +295,34 @@ def save_test_record(test_id: str, operator: str, tags: List[str] = None) -> Dic
     Returns:
         包含记录保存结果的字典
     """
-    time.sleep(0.3)
+    user_id = (config or {}).get("configurable", {}).get("user_id")
+    if user_id is None:
+        return {
+            "success": False,
+            "error": "缺少用户上下文",
+            "message": "无法确定操作用户，测试记录未保存"
+        }
+
+    try:
+        record = test_record_store.save_from_job(test_id, user_id, operator, tags)
+    except LookupError as e:
+        return {
+            "success": False,
+            "error": "任务不存在",
+            "message": str(e)
+        }
+    except ValueError as e:
+        return {
+            "success": False,
+            "error": "测试未完成",
+            "message": str(e)
+        }
 
-    record_id = f"REC-{test_id.split('-', 1)[1]}"
     return {
         "success": True,
         "data": {
-            "record_id": record_id,
-            "saved_at": datetime.now().isoformat()
+            "record_id": record["record_id"],
+            "saved_at": record["created_at"]
         },
         "message": "测试记录保存成功"
     }
@@ -201,79 +334,61 @@ def query_test_history(
     version: str = None,
     operator: str = None,
     status: str = "all",
-    limit: int = 10
+    limit: int = 10,
+    cursor: str = None
 ) -> Dict[str, Any]:
     """
-    查询历史测试验证记录，支持多种筛选条件
+    查询历史测试验证记录，支持多种筛选条件，按时间倒序分页返回
 
     Args:
         product_name: 产品名称（可选）
         version: 产品版本（可选）
         operator: 操作人员（可选）
         status: 测试状态筛选，可选值: success, failed, all，默认all
-        limit: 返回记录数量限制，默认10
+        limit: 每页记录数，默认10，最多100
+        cursor: 翻页游标，传入上一次返回的 next_cursor 获取更早的记录（可选）
 
     Returns:
-        包含历史记录列表的字典
+        包含历史记录列表和下一页游标的字典
     """
-    time.sleep(0.5)
-
-    # 模拟返回历史记录
-    mock_records = [
-        {
-            "test_id": "TEST-20250114-001",
-            "product_name": "存储系统A",
-            "version": "v2.3.5",
-            "device_ip": "192.168.1.100",
-            "operator": "张三",
-            "status": "success",
-            "created_at": "2025-01-14T10:00:00Z",
-            "report_url": "https://auth-system.com/reports/REPORT-20250114-001.html"
-        },
-        {
-            "test_id": "TEST-20250113-008",
-            "product_name": "存储系统A",
-            "version": "v2.3.5",
-            "device_ip": "192.168.1.101",
-            "operator": "李四",
-            "status": "success",
-            "created_at": "2025-01-13T16:20:00Z",
-            "report_url": "https://auth-system.com/reports/REPORT-20250113-008.html"
-        },
-        {
-            "test_id": "TEST-20250112-005",
-            "product_name": "存储系统A",
-            "version": "v2.3.4",
-            "device_ip": "192.168.1.102",
-            "operator": "王五",
-            "status": "failed",
-            "created_at": "2025-01-12T09:15:00Z",
-            "report_url": "https://auth-system.com/reports/REPORT-20250112-005.html"
+    try:
+        records, next_cursor = test_record_store.query(
+            product_name=product_name,
+            version=version,
+            operator=operator,
+            status=None if status == "all" else status,
+            limit=max(1, min(limit, 100)),
+            cursor=cursor
+        )
+    except ValueError as e:
+        return {
+            "success": False,
+            "error": "参数错误",
+            "message": str(e)
         }
-    ]
-
-    # 简单过滤
-    if product_name:
-        mock_records = [r for r in mock_records if r['product_name'] == product_name]
-
-    if status != "all":
-        mock_records = [r for r in mock_records if r['status'] == status]
 
     return {
         "success": True,
         "data": {
-            "total": len(mock_records),
-            "records": mock_records[:limit]
+            "count": len(records),
+            "records": records,
+            "next_cursor": next_cursor
         },
         "message": "查询成功"
     }
 
 
+# 有副作用的工具：调用这些工具的模型回复不进入响应缓存
+SIDE_EFFECT_TOOLS = ("execute_auth_test", "execute_fleet_test", "save_test_record")
+
+
 # ==================== LangGraph 状态定义 ====================
 
 class AgentState(TypedDict):
     """智能体状态"""
     messages: Annotated[List, add_messages]
+    summary: str  # 早期对话的滚动摘要
+    summary_upto: str  # 摘要覆盖到的最后一条消息ID
 
 
 # ==================== 智能体服务类 ====================
@@ -281,24 +396,44 @@ class AgentState(TypedDict):
 class AgentService:
     """智能体服务 - 支持流式回调"""
 
-    def __init__(self, api_key: str, base_url: str, model_name: str):
+    def __init__(self, api_key: str, base_url: str, model_name: str, streaming: bool = True,
+                 tool_max_workers: int = 8, tool_timeout: float = 60,
+                 tool_timeouts: Dict[str, float] = None, checkpointer=None,
+                 max_history_messages: int = 100, context_token_budget: int = 6000,
+                 http_client=None, llm_cache_backend=None):
         self.api_key = api_key
         self.base_url = base_url
         self.model_name = model_name
-
-        # 初始化LLM
+        self.streaming = streaming
+        self.tool_max_workers = tool_max_workers
+        self.tool_timeout = tool_timeout
+        self.tool_timeouts = tool_timeouts or {}
+        # 对话记忆：检查点存储（按对话ID保存状态）与保留的最大消息数
+        self.checkpointer = checkpointer
+        self.max_history_messages = max_history_messages
+
+        # 初始化LLM（streaming=True 时逐token回调，降低首字延迟）
+        # 传入共享的 http_client 时，连接池、超时与重试由该客户端统一控制，关闭SDK自带重试避免叠加
+        self.http_client = http_client
+        llm_options = {"http_client": http_client, "max_retries": 0} if http_client is not None else {}
         self.llm = ChatOpenAI(
             api_key=api_key,
             base_url=base_url,
             model=model_name,
             temperature=0,
-            streaming=False
+            streaming=streaming,
+            # 流式响应末尾附带token用量，用于 llm_tokens 指标
+            stream_usage=True,
+            **llm_options
         )
 
         # 定义工具列表
         self.tools = [
             check_device_connection,
             execute_auth_test,
+            query_auth_test_status,
+            execute_fleet_test,
+            query_fleet_test_status,
             generate_test_report,
             save_test_record,
             query_test_history
@@ -307,6 +442,14 @@ class AgentService:
         # 绑定工具到LLM
         self.llm_with_tools = self.llm.bind_tools(self.tools)
 
+        # 响应缓存：重复的只读提问不再调用模型
+        self.llm_cache = LLMResponseCache(
+            llm_cache_backend, model_name, self.tools, side_effect_tools=SIDE_EFFECT_TOOLS
+        ) if llm_cache_backend is not None else None
+
+        # 上下文压缩：超出token预算时把早期轮次合并为滚动摘要
+        self.compactor = ContextCompactor(self.llm, token_budget=context_token_budget)
+
         # 构建LangGraph
         self.graph = self._build_graph()
 
@@ -315,18 +458,22 @@ class AgentService:
 
 你可以使用以下工具：
 1. check_device_connection - 检查设备连通性
-2. execute_auth_test - 执行完整的授权测试流程
-3. generate_test_report - 生成测试报告
-4. save_test_record - 保存测试记录
-5. query_test_history - 查询历史测试记录
+2. execute_auth_test - 提交授权测试任务（后台执行，立即返回测试ID）
+3. query_auth_test_status - 查询授权测试任务的状态和结果
+4. execute_fleet_test - 批量提交多台设备的授权测试（设备列表或CSV，后台并发执行，立即返回批次ID）
+5. query_fleet_test_status - 查询批量测试进度和合并报告
+6. generate_test_report - 生成测试报告
+7. save_test_record - 保存测试记录
+8. query_test_history - 查询历史测试记录
 
 工作流程：
 1. 当用户要进行设备测试时，先收集必要信息（设备IP、产品名称、版本、登录凭证）
 2. 使用check_device_connection验证设备连通性
-3. 使用execute_auth_test执行授权测试
-4. 测试完成后，自动调用generate_test_report生成报告
+3. 使用execute_auth_test提交授权测试，告知用户测试ID，执行进度会自动推送到页面
+4. 用户询问结果时，使用query_auth_test_status查询；测试成功后自动调用generate_test_report生成报告
 5. 调用save_test_record保存记录（operator参数使用"系统用户"）
 6. 向用户展示完整的测试结果和报告链接
+7. 用户一次要测试多台设备或整个版本矩阵时，使用execute_fleet_test一次提交，不要逐台调用execute_auth_test
 
 注意事项：
 - 如果信息不完整，主动询问用户
@@ -342,15 +489,36 @@ class AgentService:
 
         def call_model(state: AgentState) -> AgentState:
             """调用LLM节点"""
-            messages = state["messages"]
+            with span('agent.node', node='agent'), observe(AGENT_NODE_SECONDS, node='agent'):
+                return invoke_model(state)
 
-            # 添加系统提示
-            if len(messages) == 1 or not any(isinstance(m, SystemMessage) for m in messages):
-                system_message = SystemMessage(content=self.system_prompt)
-                messages = [system_message] + messages
+        def invoke_model(state: AgentState) -> AgentState:
+            messages = state["messages"]
 
-            response = self.llm_with_tools.invoke(messages)
-            return {"messages": [response]}
+            # 裁剪过旧的历史消息，避免对话记忆无限增长；被裁剪的消息先并入摘要
+            stale = self._stale_messages(messages)
+
+            # 压缩上下文：早期轮次替换为摘要，历史工具结果只保留关键字段
+            prompt, summary, summary_upto = self.compactor.compact(
+                messages,
+                self.system_prompt,
+                summary=state.get("summary", ""),
+                summary_upto=state.get("summary_upto"),
+                min_cut=len(stale)
+            )
+
+            if self.llm_cache is not None:
+                response = self.llm_cache.invoke(self.llm_with_tools, prompt)
+            else:
+                started = time.perf_counter()
+                response = self.llm_with_tools.invoke(prompt)
+                record_llm_call(response, time.perf_counter() - started)
+            removals = [RemoveMessage(id=m.id) for m in stale]
+            return {
+                "messages": removals + [response],
+                "summary": summary,
+                "summary_upto": summary_upto
+            }
 
         def should_continue(state: AgentState) -> Literal["tools", "end"]:
             """判断是否需要调用工具"""
@@ -366,7 +534,13 @@ class AgentService:
 
         # 添加节点
         workflow.add_node("agent", call_model)
-        workflow.add_node("tools", ToolNode(self.tools))
+        # 同一轮的多个工具调用并行执行
+        workflow.add_node("tools", ConcurrentToolNode(
+            self.tools,
+            max_workers=self.tool_max_workers,
+            default_timeout=self.tool_timeout,
+            tool_timeouts=self.tool_timeouts
+        ))
 
         # 设置入口点
         workflow.set_entry_point("agent")
@@ -384,26 +558,89 @@ class AgentService:
         # 工具执行后返回到agent
         workflow.add_edge("tools", "agent")
 
-        # 编译图
-        return workflow.compile()
+        # 编译图（配置检查点存储后，状态按 thread_id 跨轮次保留）
+        return workflow.compile(checkpointer=self.checkpointer)
+
+    def _stale_messages(self, messages: List) -> List:
+        """
+        计算需要从对话记忆中移除的旧消息
+
+        只在用户消息处截断，保证保留部分不会以孤立的工具结果开头。
+        """
+        if len(messages) <= self.max_history_messages:
+            return []
+
+        for cut in range(len(messages) - self.max_history_messages, len(messages)):
+            if isinstance(messages[cut], HumanMessage):
+                return messages[:cut]
+        return []
 
-    def chat_stream(self, user_message: str, callback: Callable):
+    def chat_stream(self, user_message: str, callback: Callable, user_id: int = None,
+                    conversation_id: int = None):
         """
         流式对话 - 通过回调函数实时推送状态
 
         Args:
             user_message: 用户输入
             callback: 回调函数，接收事件字典 {"type": "...", "data": {...}}
+            user_id: 当前用户ID（后台任务据此推送进度）
+            conversation_id: 对话ID，作为检查点的 thread_id 保留上下文
+
+        assistant_message 事件分两类：is_complete=False 时 content 为本次新增的token片段，
+        is_complete=True 时 content 为完整回复（每轮对话只发送一次）。
         """
-        # 创建初始状态
+        started = time.perf_counter()
+        outcome = "ok"
+        first_token_seen = False
+
+        def observed(event):
+            nonlocal outcome, first_token_seen
+            if event.get("type") == "assistant_message" and not first_token_seen:
+                first_token_seen = True
+                AGENT_TTFT_SECONDS.observe(time.perf_counter() - started)
+            elif event.get("type") == "error":
+                outcome = "error"
+                AGENT_ERRORS.labels(stage="agent").inc()
+            callback(event)
+
+        AGENT_TURNS_ACTIVE.inc()
+        with span("agent.turn", user_id=user_id, conversation_id=conversation_id) as turn:
+            try:
+                self._run_turn(user_message, observed, user_id, conversation_id)
+            finally:
+                AGENT_TURNS_ACTIVE.dec()
+                AGENT_TURN_SECONDS.labels(outcome=outcome).observe(time.perf_counter() - started)
+                if outcome == "error":
+                    turn.status = "ERROR"
+
+    def _run_turn(self, user_message: str, callback: Callable, user_id: int, conversation_id: int):
+        """执行一轮对话并通过回调推送事件（异常转换为 error 事件）"""
+        # 创建本轮输入（历史消息由检查点存储按对话ID恢复）
         initial_state = {
             "messages": [HumanMessage(content=user_message)]
         }
+        thread_id = str(conversation_id) if conversation_id is not None else uuid.uuid4().hex
+        config = {"configurable": {"user_id": user_id, "thread_id": thread_id}}
 
         try:
-            # 流式运行图
-            for event in self.graph.stream(initial_state):
-                for node_name, node_output in event.items():
+            # 同时订阅 messages（token增量）与 updates（节点完整输出）两种流
+            for mode, payload in self.graph.stream(initial_state, config, stream_mode=["messages", "updates"]):
+                if mode == "messages":
+                    chunk, metadata = payload
+                    # 只转发agent节点产生的文本增量，工具调用参数的增量不推送
+                    if (isinstance(chunk, AIMessageChunk)
+                            and metadata.get("langgraph_node") == "agent"
+                            and chunk.content):
+                        callback({
+                            "type": "assistant_message",
+                            "data": {
+                                "content": chunk.content,
+                                "is_complete": False
+                            }
+                        })
+                    continue
+
+                for node_name, node_output in payload.items():
                     if node_name == "agent":
                         messages = node_output.get("messages", [])
                         if messages:
@@ -415,12 +652,13 @@ class AgentService:
                                         callback({
                                             "type": "tool_call",
                                             "data": {
+                                                "tool_call_id": tool_call.get('id'),
                                                 "tool_name": tool_call.get('name', ''),
                                                 "parameters": tool_call.get('args', {})
                                             }
                                         })
                                 elif last_msg.content:
-                                    # LLM回复内容
+                                    # LLM回复内容（完整）
                                     callback({
                                         "type": "assistant_message",
                                         "data": {
@@ -429,8 +667,19 @@ class AgentService:
                                         }
                                     })
                     elif node_name == "tools":
-                        # 工具执行完成（可以在这里添加更多回调）
-                        pass
+                        # 工具执行完成：结果与状态、耗时写入本轮的工具调用日志
+                        for tool_msg in node_output.get("messages", []):
+                            metadata = tool_msg.response_metadata or {}
+                            callback({
+                                "type": "tool_result",
+                                "data": {
+                                    "tool_call_id": tool_msg.tool_call_id,
+                                    "tool_name": tool_msg.name,
+                                    "status": metadata.get("status", tool_msg.status),
+                                    "duration_ms": metadata.get("duration_ms"),
+                                    "content": tool_msg.content
+                                }
+                            })
 
             callback({
                 "type": "complete",
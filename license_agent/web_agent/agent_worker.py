@@ -0,0 +1,116 @@
+"""
+智能体工作进程 - 从任务队列取出对话轮次执行，事件经Socket.IO消息队列推送回持有连接的Web进程
+
+用法（可启动多个，与多个 app.py 进程共用同一个 Redis 与数据库）:
+    SOCKETIO_MESSAGE_QUEUE=redis://localhost:6379/0 python web_agent/agent_worker.py
+"""
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from flask_socketio import SocketIO
+
+from web_agent.admission import AdmissionRejected, create_fair_queue
+from web_agent.config import Config
+from web_agent.models import init_db, init_schema
+from web_agent.fleet import fleet_scheduler
+from web_agent.device_lease import device_lease
+from web_agent.jobs import job_manager
+from web_agent.metrics import component_stats, init_tracing
+from web_agent.persistence import persistence
+from web_agent.agent_runner import create_agent_service, reject_turn, run_agent_turn
+
+
+def create_worker_app() -> Flask:
+    """工作进程只需要配置与数据库，不注册任何路由"""
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    init_db(app)
+    return app
+
+
+class AgentWorker:
+    """
+    消费对话任务队列，在本进程内按用户公平排队执行
+
+    本地排队数达到 ADMISSION_WORKER_PREFETCH 后暂停取任务，让其他工作进程分担负载。
+    """
+
+    def __init__(self, app: Flask, redis_url: str, queue_name: str, max_workers: int):
+        import redis
+
+        self.app = app
+        self.queue_name = queue_name
+        self.redis = redis.Redis.from_url(redis_url)
+        # 只写实例：不接受客户端连接，只把事件发布到消息队列
+        self.socketio = SocketIO(message_queue=redis_url)
+        job_manager.init_app(app, self.socketio)
+        fleet_scheduler.init_app(app, self.socketio)
+        persistence.init_app(app)
+        self.agent_service = create_agent_service(app)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='agent-turn')
+        self.queue = create_fair_queue(
+            dict(app.config, AGENT_MAX_WORKERS=max_workers),
+            lambda task: run_agent_turn(self.agent_service, self.socketio, task),
+            self.executor,
+            notify=self._notify,
+            max_queued=app.config.get('ADMISSION_WORKER_PREFETCH', 8)
+        )
+        init_tracing(app)
+        component_stats.add('persistence', persistence.stats)
+        component_stats.add('fleet', fleet_scheduler.stats)
+        component_stats.add('device_lease', device_lease.stats)
+        component_stats.add('admission', self.queue.stats)
+
+    def serve_forever(self, poll_timeout: int = 5):
+        while True:
+            if not self.queue.wait_for_room(poll_timeout):
+                continue
+            item = self.redis.brpop([self.queue_name], timeout=poll_timeout)
+            if item is None:
+                continue
+            task = json.loads(item[1])
+            try:
+                position = self.queue.submit(task)
+            except AdmissionRejected as e:
+                self._notify(task, 'rejected', e.to_dict())
+                continue
+            if position:
+                self._notify(task, 'queued', {'position': position})
+
+    def _notify(self, task, event, data):
+        if event == 'rejected':
+            reject_turn(self.socketio, task, data)
+        else:
+            self.socketio.emit(event, data, to=task['sid'])
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        job_manager.shutdown()
+        fleet_scheduler.shutdown()
+        persistence.shutdown()
+
+
+if __name__ == '__main__':
+    if not Config.SOCKETIO_MESSAGE_QUEUE:
+        sys.exit("请先配置 SOCKETIO_MESSAGE_QUEUE（如 redis://localhost:6379/0）")
+
+    app = create_worker_app()
+    with app.app_context():
+        init_schema()
+
+    worker = AgentWorker(app, Config.SOCKETIO_MESSAGE_QUEUE, Config.AGENT_TASK_QUEUE, Config.AGENT_MAX_WORKERS)
+    if Config.WORKER_METRICS_PORT:
+        from prometheus_client import start_http_server
+        start_http_server(Config.WORKER_METRICS_PORT)
+        print(f"📈 指标导出: http://0.0.0.0:{Config.WORKER_METRICS_PORT}/metrics")
+    print(f"🤖 智能体工作进程已启动，监听任务队列: {Config.AGENT_TASK_QUEUE}")
+    try:
+        worker.serve_forever()
+    except KeyboardInterrupt:
+        worker.shutdown()
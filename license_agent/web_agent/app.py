@@ -1,12 +1,10 @@
 """
 Flask Web应用主文件
 """
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
-from flask_socketio import SocketIO, emit, disconnect
-from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 import os
 import sys
 import io
+import time
 
 # 修复Windows控制台编码问题
 if sys.platform == 'win32':
@@ -16,46 +14,191 @@ if sys.platform == 'win32':
 # 添加项目根目录到Python路径
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from web_agent.models import db, User, Conversation, Message
 from web_agent.config import Config
-from web_agent.agent_service import AgentService
+
+# 协程模式：必须在导入Flask、数据库驱动、HTTP客户端等库之前打补丁，
+# 使socket、线程、sleep变为协作式，等待LLM/工具的会话不再各占一个系统线程
+if Config.SOCKETIO_ASYNC_MODE == 'eventlet':
+    import eventlet
+    eventlet.monkey_patch()
+elif Config.SOCKETIO_ASYNC_MODE == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+    try:
+        # PostgreSQL驱动需要额外补丁才能在gevent下让出执行权
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+    except ImportError:
+        pass
+
+from flask import Flask, Response, g, render_template, request, jsonify, session, redirect, url_for
+from flask_socketio import SocketIO, emit, disconnect, join_room
+from flask_login import LoginManager, login_user, logout_user, login_required, current_user
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from web_agent.models import db, init_db, init_schema, User, Conversation, Message, ToolPayload
+from web_agent import tool_log
+from web_agent.agent_runner import LazyAgentService, reject_turn, run_agent_turn
+from web_agent.device_cache import device_check_cache
+from web_agent.dispatch import create_dispatcher
+from web_agent.admission import AdmissionRejected, rate_limiter
+from web_agent.fleet import fleet_scheduler, parse_devices
+from web_agent.device_lease import device_lease
+from web_agent.jobs import job_manager, user_room
+from web_agent.passwords import password_hasher
+from web_agent.user_cache import user_cache
+from web_agent.metrics import (
+    HTTP_REQUEST_SECONDS, MESSAGE_STAGE_SECONDS, SOCKETIO_SESSIONS_ACTIVE,
+    component_stats, init_tracing, observe, render_metrics
+)
+from web_agent.persistence import persistence, PersistenceFullError
+from web_agent.pagination import encode_cursor, decode_cursor, before_cursor, parse_limit, parse_offset
+from web_agent.record_store import test_record_store
+from web_agent.search import search_index
 
 # 创建Flask应用
 app = Flask(__name__)
 app.config.from_object(Config)
 
-# 初始化扩展
-db.init_app(app)
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
+# 初始化扩展（密码哈希进程池需在其他扩展启动后台线程之前 fork 出工作进程）
+password_hasher.init_app(app)
+init_db(app)
+# 配置消息队列后，任一进程（包括 agent_worker）发出的事件都会转发到持有该连接的进程
+socketio = SocketIO(
+    app,
+    cors_allowed_origins="*",
+    async_mode=Config.SOCKETIO_ASYNC_MODE,
+    message_queue=Config.SOCKETIO_MESSAGE_QUEUE
+)
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login_page'
-
-# 创建数据库表
-with app.app_context():
-    db.create_all()
-    # 创建默认测试用户（如果不存在）
-    if not User.query.filter_by(username='test').first():
-        test_user = User(username='test', role='developer')
-        test_user.set_password('test123')
-        db.session.add(test_user)
-        db.session.commit()
-        print("✅ 创建测试用户: test / test123")
-
-# 初始化智能体服务
-agent_service = AgentService(
-    api_key=Config.DEEPSEEK_API_KEY,
-    base_url=Config.DEEPSEEK_BASE_URL,
-    model_name=Config.DEEPSEEK_MODEL
+job_manager.init_app(app, socketio)
+fleet_scheduler.init_app(app, socketio)
+rate_limiter.init_app(app)
+user_cache.init_app(app)
+init_tracing(app)
+test_record_store.init_app(app)
+search_index.init_app(app)
+persistence.init_app(app)
+
+
+def setup_database():
+    """创建缺失的表与索引，并创建默认测试用户（如果不存在）"""
+    with app.app_context():
+        init_schema()
+        if not User.query.filter_by(username='test').first():
+            test_user = User(username='test', role='developer')
+            test_user.set_password('test123')
+            db.session.add(test_user)
+            db.session.commit()
+            print("✅ 创建测试用户: test / test123")
+
+
+@app.cli.command('init-db')
+def init_db_command():
+    """创建数据表并写入默认测试用户（flask --app web_agent.app init-db）"""
+    setup_database()
+    print("✅ 数据库初始化完成")
+
+
+# 建表与测试用户的密码哈希不再放在每次进程启动中，由 init-db 命令完成；直接运行 app.py 时仍自动执行
+if Config.DB_AUTO_INIT or __name__ == '__main__':
+    setup_database()
+
+# 数据库尚未初始化时（例如正在执行 init-db）没有需要恢复的任务
+if Config.JOB_RECOVER_ON_STARTUP:
+    with app.app_context():
+        if db.inspect(db.engine).has_table(User.__tablename__):
+            job_manager.recover_interrupted()
+            fleet_scheduler.recover_interrupted()
+
+def notify_admission(task, event, data):
+    """推送排队事件；排队超时被拒绝时撤回已保存的用户消息"""
+    if event == 'rejected':
+        reject_turn(socketio, task, data)
+    else:
+        socketio.emit(event, data, to=task['sid'])
+
+
+# 初始化智能体服务与任务分发器（智能体服务按 AGENT_STARTUP_MODE 延迟加载）
+agent_service = LazyAgentService(app, Config.AGENT_STARTUP_MODE) if Config.AGENT_DISPATCH == 'local' else None
+agent_dispatcher = create_dispatcher(
+    app.config,
+    lambda task: run_agent_turn(agent_service.get(), socketio, task),
+    notify=notify_admission
 )
 
+# 组件统计随 /metrics 一起导出
+component_stats.add('persistence', persistence.stats)
+component_stats.add('fleet', fleet_scheduler.stats)
+component_stats.add('device_lease', device_lease.stats)
+component_stats.add('passwords', password_hasher.stats)
+component_stats.add('user_cache', user_cache.stats)
+if getattr(agent_dispatcher, 'queue', None) is not None:
+    component_stats.add('admission', agent_dispatcher.queue.stats)
+
+
+# ==================== 请求耗时与指标 ====================
+
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_request_duration(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        HTTP_REQUEST_SECONDS.labels(
+            method=request.method,
+            endpoint=request.url_rule.rule if request.url_rule else 'unmatched',
+            status=response.status_code
+        ).observe(time.perf_counter() - started)
+    return response
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus指标（配置 METRICS_TOKEN 时需携带 Authorization: Bearer <token>）"""
+    token = Config.METRICS_TOKEN
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return Response('unauthorized', status=401)
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
+
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """就绪检查：数据库已初始化且智能体服务已加载（lazy 模式下未加载也视为就绪）"""
+    checks = {}
+    try:
+        db.session.execute(text('SELECT 1 FROM users LIMIT 1'))
+        checks['database'] = 'ok'
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        checks['database'] = f'error: {e.__class__.__name__}'
+
+    if agent_service is not None:
+        if agent_service.ready:
+            checks['agent'] = 'ok'
+        elif agent_service.mode == 'lazy':
+            checks['agent'] = 'deferred'
+        else:
+            checks['agent'] = f'error: {agent_service.error}' if agent_service.error else 'loading'
+
+    ready = all(status in ('ok', 'deferred') for status in checks.values())
+    return jsonify({'ready': ready, 'checks': checks}), 200 if ready else 503
+
 
 # ==================== Flask-Login配置 ====================
 
 @login_manager.user_loader
 def load_user(user_id):
-    """加载用户"""
-    return User.query.get(int(user_id))
+    """加载用户（返回缓存的只读身份，不再每个请求查询数据库）"""
+    return user_cache.load(int(user_id))
 
 
 # ==================== 路由 - 页面 ====================
@@ -122,6 +265,11 @@ def login():
     if not user or not user.check_password(password):
         return jsonify({'success': False, 'message': '用户名或密码错误'}), 401
 
+    # BCRYPT_ROUNDS 调整后，旧哈希在用户登录成功时按新 cost 重新生成
+    if user.password_needs_rehash():
+        user.set_password(password)
+        db.session.commit()
+
     # 登录用户
     login_user(user)
 
@@ -142,31 +290,103 @@ def logout():
 @app.route('/api/conversations', methods=['GET'])
 @login_required
 def get_conversations():
-    """获取用户的所有对话"""
-    conversations = Conversation.query.filter_by(user_id=current_user.id)\
-        .order_by(Conversation.updated_at.desc()).all()
+    """
+    分页获取用户的对话（按更新时间倒序）
+
+    Query参数:
+        limit: 每页数量
+        cursor: 上一页返回的 next_cursor
+    """
+    limit = parse_limit(request.args.get('limit'), Config.CONVERSATIONS_PAGE_SIZE, Config.MAX_PAGE_SIZE)
+
+    query = Conversation.query.filter_by(user_id=current_user.id)
+    if request.args.get('cursor'):
+        try:
+            cursor = decode_cursor(request.args['cursor'])
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        query = query.filter(before_cursor(Conversation.updated_at, Conversation.id, cursor))
+
+    # 多取一条用于判断是否还有下一页
+    conversations = query.order_by(Conversation.updated_at.desc(), Conversation.id.desc())\
+        .limit(limit + 1).all()
+    has_more = len(conversations) > limit
+    conversations = conversations[:limit]
+
+    # 一次分组查询统计消息数，避免逐个对话加载全部消息
+    counts = Conversation.count_messages([conv.id for conv in conversations])
 
     return jsonify({
         'success': True,
-        'conversations': [conv.to_dict() for conv in conversations]
+        'conversations': [conv.to_dict(message_count=counts.get(conv.id, 0)) for conv in conversations],
+        'next_cursor': encode_cursor(conversations[-1].updated_at, conversations[-1].id) if has_more else None
     })
 
 
 @app.route('/api/conversations/<int:conv_id>/messages', methods=['GET'])
 @login_required
 def get_messages(conv_id):
-    """获取对话的所有消息"""
+    """
+    分页获取对话消息：默认返回最新一页，传入 before 游标加载更早的消息
+
+    Query参数:
+        limit: 每页数量
+        before: 上一页返回的 before_cursor
+
+    返回的每页消息按时间正序排列。
+    """
     conversation = Conversation.query.get(conv_id)
 
     if not conversation or conversation.user_id != current_user.id:
         return jsonify({'success': False, 'message': '对话不存在'}), 404
 
-    messages = Message.query.filter_by(conversation_id=conv_id)\
-        .order_by(Message.created_at).all()
+    limit = parse_limit(request.args.get('limit'), Config.MESSAGES_PAGE_SIZE, Config.MAX_PAGE_SIZE)
+
+    # 读己之写：本进程中该对话尚在队列里的消息先落库
+    persistence.wait_for_conversation(conv_id)
+
+    query = Message.query.filter_by(conversation_id=conv_id)
+    if request.args.get('before'):
+        try:
+            cursor = decode_cursor(request.args['before'])
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        query = query.filter(before_cursor(Message.created_at, Message.id, cursor))
+
+    messages = query.order_by(Message.created_at.desc(), Message.id.desc())\
+        .limit(limit + 1).all()
+    has_more = len(messages) > limit
+    messages = list(reversed(messages[:limit]))
+
+    return jsonify({
+        'success': True,
+        'messages': [msg.to_dict() for msg in messages],
+        'before_cursor': encode_cursor(messages[0].created_at, messages[0].id) if has_more else None
+    })
+
+
+@app.route('/api/messages/<int:message_id>/tool-calls', methods=['GET'])
+@login_required
+def get_message_tool_calls(message_id):
+    """获取消息对应轮次的完整工具调用记录（参数与结果，拆出保存的大结果一并加载）"""
+    message = Message.query.get(message_id)
+    conversation = Conversation.query.get(message.conversation_id) if message else None
+    if not conversation or conversation.user_id != current_user.id:
+        return jsonify({'success': False, 'message': '消息不存在'}), 404
+
+    events = tool_log.decode(message.tool_calls)
+    refs = {event['ref'] for event in events if event.get('ref')}
+    if refs:
+        payloads = {p.digest: p for p in ToolPayload.query.filter(ToolPayload.digest.in_(refs))}
+        for event in events:
+            payload = payloads.get(event.get('ref'))
+            if payload is not None:
+                event['result'] = tool_log.load_payload(payload.data)
 
     return jsonify({
         'success': True,
-        'messages': [msg.to_dict() for msg in messages]
+        'message_id': message_id,
+        'events': events
     })
 
 
@@ -183,7 +403,258 @@ def create_conversation():
 
     return jsonify({
         'success': True,
-        'conversation': conversation.to_dict()
+        'conversation': conversation.to_dict(message_count=0)
+    })
+
+
+@app.route('/api/conversations/<int:conv_id>', methods=['DELETE'])
+@login_required
+def delete_conversation(conv_id):
+    """删除对话及其消息，并清除该对话的智能体记忆（检查点）"""
+    conversation = Conversation.query.get(conv_id)
+
+    if not conversation or conversation.user_id != current_user.id:
+        return jsonify({'success': False, 'message': '对话不存在'}), 404
+
+    # 队列中尚未落库的消息先写入，避免删除后再插入
+    persistence.wait_for_conversation(conv_id)
+
+    # 批量删除消息，不逐条加载到会话中
+    Message.query.filter_by(conversation_id=conv_id).delete(synchronize_session=False)
+    db.session.delete(conversation)
+    db.session.commit()
+
+    # langgraph 导入耗时较长，只在删除对话时加载检查点存储
+    from web_agent.checkpointer import SQLAlchemyCheckpointSaver
+    service = agent_service.current() if agent_service is not None else None
+    checkpointer = service.checkpointer if service is not None else SQLAlchemyCheckpointSaver(app)
+    checkpointer.delete_thread(conv_id)
+
+    return jsonify({'success': True})
+
+
+@app.route('/api/tests/<test_id>', methods=['GET'])
+@login_required
+def get_test_status(test_id):
+    """查询授权测试任务状态"""
+    job = job_manager.get(test_id)
+
+    if not job or not job_manager.can_view(job, current_user.id):
+        return jsonify({'success': False, 'message': '测试任务不存在'}), 404
+
+    return jsonify({
+        'success': True,
+        'job': job
+    })
+
+
+@app.route('/api/fleet-tests', methods=['POST'])
+@login_required
+def create_fleet_test():
+    """
+    提交批量授权测试
+
+    JSON: {"devices": [{device_ip, product_name, version, username, password}, ...], "csv": "...", "timeout": 300}
+    或 multipart 表单上传CSV文件（字段名 file）
+    """
+    if request.files.get('file'):
+        data = request.form
+        csv_text = request.files['file'].read().decode('utf-8-sig')
+        devices = None
+    else:
+        data = request.get_json(silent=True) or {}
+        csv_text = data.get('csv')
+        devices = data.get('devices')
+
+    try:
+        batch = fleet_scheduler.submit(
+            current_user.id,
+            parse_devices(devices, csv_text),
+            timeout=int(data.get('timeout') or 300)
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    return jsonify({
+        'success': True,
+        'batch': batch
+    })
+
+
+@app.route('/api/fleet-tests/<batch_id>', methods=['GET'])
+@login_required
+def get_fleet_test(batch_id):
+    """查询批量授权测试进度与合并报告"""
+    batch = fleet_scheduler.get(batch_id)
+
+    if not batch or batch['user_id'] != current_user.id:
+        return jsonify({'success': False, 'message': '批量测试不存在'}), 404
+
+    return jsonify({
+        'success': True,
+        'batch': batch
+    })
+
+
+@app.route('/api/test-records', methods=['GET'])
+@login_required
+def get_test_records():
+    """
+    分页查询测试记录（按时间倒序）
+
+    Query参数:
+        product_name / version / operator / status: 筛选条件（可选）
+        limit: 每页数量
+        cursor: 上一页返回的 next_cursor
+    """
+    limit = parse_limit(request.args.get('limit'), Config.TEST_RECORDS_PAGE_SIZE, Config.MAX_PAGE_SIZE)
+    try:
+        records, next_cursor = test_record_store.query(
+            product_name=request.args.get('product_name'),
+            version=request.args.get('version'),
+            operator=request.args.get('operator'),
+            status=request.args.get('status'),
+            limit=limit,
+            cursor=request.args.get('cursor')
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    return jsonify({
+        'success': True,
+        'records': records,
+        'next_cursor': next_cursor
+    })
+
+
+@app.route('/api/search/messages', methods=['GET'])
+@login_required
+def search_messages():
+    """
+    全文检索本人的对话消息：在最近 SEARCH_MAX_CANDIDATES 条命中内按相关度排序
+
+    Query参数:
+        q: 关键词，多个关键词以空格分隔（同时包含）
+        limit: 每页数量
+        offset: 上一页返回的 next_offset
+
+    truncated 为 true 时命中超过 SEARCH_MAX_CANDIDATES 条，更早的命中不参与排序，翻页也到此为止。
+    """
+    q = (request.args.get('q') or '').strip()
+    if not q:
+        return jsonify({'success': False, 'message': '请输入检索关键词'}), 400
+    limit = parse_limit(request.args.get('limit'), Config.SEARCH_PAGE_SIZE, Config.MAX_PAGE_SIZE)
+    offset = parse_offset(request.args.get('offset'))
+
+    results, next_offset, truncated = search_index.search_messages(current_user.id, q, limit=limit, offset=offset)
+    return jsonify({
+        'success': True,
+        'results': results,
+        'next_offset': next_offset,
+        'truncated': truncated
+    })
+
+
+@app.route('/api/search/test-records', methods=['GET'])
+@login_required
+def search_test_records():
+    """
+    全文检索测试记录（记录编号、产品、版本、设备IP、操作人、结果说明、标签），
+    在最近 SEARCH_MAX_CANDIDATES 条命中内按相关度排序
+
+    Query参数:
+        q: 关键词，多个关键词以空格分隔（同时包含）
+        limit: 每页数量
+        offset: 上一页返回的 next_offset
+
+    truncated 含义同消息检索。
+    """
+    q = (request.args.get('q') or '').strip()
+    if not q:
+        return jsonify({'success': False, 'message': '请输入检索关键词'}), 400
+    limit = parse_limit(request.args.get('limit'), Config.SEARCH_PAGE_SIZE, Config.MAX_PAGE_SIZE)
+    offset = parse_offset(request.args.get('offset'))
+
+    records, next_offset, truncated = search_index.search_records(q, limit=limit, offset=offset)
+    return jsonify({
+        'success': True,
+        'records': records,
+        'next_offset': next_offset,
+        'truncated': truncated
+    })
+
+
+@app.route('/api/test-records/<record_id>', methods=['GET'])
+@login_required
+def get_test_record(record_id):
+    """查询单条测试记录（含步骤明细）"""
+    record = test_record_store.get(record_id)
+    if not record:
+        return jsonify({'success': False, 'message': '测试记录不存在'}), 404
+
+    return jsonify({
+        'success': True,
+        'record': record
+    })
+
+
+@app.route('/api/system/llm-pool', methods=['GET'])
+@login_required
+def get_llm_pool_stats():
+    """查询本进程LLM后端连接池的占用情况（queue 分发模式下对话在工作进程执行，本进程无连接池）"""
+    service = agent_service.current() if agent_service is not None else None
+    if service is None or service.http_client is None:
+        return jsonify({'success': False, 'message': '当前进程未创建LLM客户端'}), 404
+
+    return jsonify({
+        'success': True,
+        'pool': service.http_client.pool_stats.snapshot()
+    })
+
+
+@app.route('/api/system/llm-cache', methods=['GET'])
+@login_required
+def get_llm_cache_stats():
+    """查询本进程LLM响应缓存的命中率与节省的调用耗时"""
+    service = agent_service.current() if agent_service is not None else None
+    if service is None or service.llm_cache is None:
+        return jsonify({'success': False, 'message': '当前进程未启用LLM响应缓存'}), 404
+
+    return jsonify({
+        'success': True,
+        'cache': service.llm_cache.stats()
+    })
+
+
+@app.route('/api/system/device-cache', methods=['GET'])
+@login_required
+def get_device_cache_stats():
+    """查询本进程设备连通性检查缓存的命中与合并情况"""
+    return jsonify({
+        'success': True,
+        'cache': device_check_cache.stats()
+    })
+
+
+@app.route('/api/system/admission', methods=['GET'])
+@login_required
+def get_admission_stats():
+    """查询本进程准入控制的排队与拒绝情况（queue 模式下排队发生在工作进程中）"""
+    queue = getattr(agent_dispatcher, 'queue', None)
+    return jsonify({
+        'success': True,
+        'rate_limited': dict(rate_limiter.rejected),
+        'queue': queue.stats() if queue is not None else None
+    })
+
+
+@app.route('/api/system/persistence', methods=['GET'])
+@login_required
+def get_persistence_stats():
+    """查询本进程后写式持久化队列的积压与组提交情况"""
+    return jsonify({
+        'success': True,
+        'persistence': persistence.stats()
     })
 
 
@@ -195,23 +666,33 @@ def handle_connect():
     if not current_user.is_authenticated:
         disconnect()
         return False
-    print(f"✅ 用户 {current_user.username} 已连接")
+    # 绑定连接所属用户，后续事件经用户身份缓存取当前角色，不再经过 load_user
+    user = current_user._get_current_object()
+    user_cache.bind_socket(request.sid, user)
+    # 加入用户专属房间，接收后台任务进度推送
+    join_room(user_room(user.id))
+    SOCKETIO_SESSIONS_ACTIVE.inc()
+    print(f"✅ 用户 {user.username} 已连接")
 
 
 @socketio.on('disconnect')
 def handle_disconnect():
     """客户端断开连接"""
-    if current_user.is_authenticated:
-        print(f"❌ 用户 {current_user.username} 已断开连接")
+    user = user_cache.unbind_socket(request.sid)
+    if user is not None:
+        SOCKETIO_SESSIONS_ACTIVE.dec()
+        print(f"❌ 用户 {user.username} 已断开连接")
 
 
 @socketio.on('send_message')
 def handle_message(data):
     """处理用户发送的消息"""
-    if not current_user.is_authenticated:
+    user = user_cache.socket_user(request.sid)
+    if user is None:
         emit('error', {'message': '未登录'})
         return
 
+    user_id = user.id
     conversation_id = data.get('conversation_id')
     user_message = data.get('message')
 
@@ -221,83 +702,58 @@ def handle_message(data):
 
     # 验证对话是否属于当前用户
     conversation = Conversation.query.get(conversation_id)
-    if not conversation or conversation.user_id != current_user.id:
+    if not conversation or conversation.user_id != user_id:
         emit('error', {'message': '对话不存在'})
         return
 
-    # 保存用户消息到数据库
-    user_msg = Message(
-        conversation_id=conversation_id,
-        role='user',
-        content=user_message
-    )
-    db.session.add(user_msg)
-    db.session.commit()
-
-    # 向客户端发送确认
-    emit('message_saved', {
-        'message': user_msg.to_dict()
-    })
-
-    # 调用智能体处理消息（流式输出）
-    assistant_content = ""
-
-    def stream_callback(event):
-        """流式回调函数"""
-        nonlocal assistant_content
-
-        event_type = event.get('type')
-        event_data = event.get('data', {})
-
-        if event_type == 'tool_call':
-            # 工具调用
-            emit('tool_call', {
-                'tool_name': event_data.get('tool_name'),
-                'parameters': event_data.get('parameters')
-            })
-
-        elif event_type == 'assistant_message':
-            # AI回复
-            content = event_data.get('content', '')
-            is_complete = event_data.get('is_complete', False)
-
-            assistant_content = content
-
-            emit('agent_response', {
-                'content': content,
-                'is_complete': is_complete
-            })
-
-            if is_complete:
-                # 保存AI消息到数据库
-                assistant_msg = Message(
-                    conversation_id=conversation_id,
-                    role='assistant',
-                    content=content
-                )
-                db.session.add(assistant_msg)
-
-                # 更新对话的更新时间
-                conversation.updated_at = db.func.now()
-
-                db.session.commit()
-
-                emit('message_complete', {
-                    'message': assistant_msg.to_dict()
-                })
-
-        elif event_type == 'error':
-            # 错误
-            emit('error', {
-                'message': event_data.get('message', '处理消息时发生错误')
-            })
+    # 准入控制：超出用户或角色的速率限制、或排队已满时拒绝，不保存消息
+    try:
+        with observe(MESSAGE_STAGE_SECONDS, stage='rate_limit'):
+            rate_limiter.check(user_id, user.role)
+            agent_dispatcher.check(user_id)
+    except AdmissionRejected as e:
+        emit('rejected', e.to_dict())
+        return
 
-        elif event_type == 'complete':
-            # 完成
-            print(f"✅ 消息处理完成")
+    # 保存用户消息（后写式：与其他会话的写入合并提交，落库后再向客户端确认）
+    sid = request.sid
+    save_started = time.perf_counter()
+    try:
+        saving = persistence.add_message(conversation_id, 'user', user_message)
+    except PersistenceFullError as e:
+        emit('error', {'message': str(e)})
+        return
 
-    # 使用智能体服务处理消息
-    agent_service.chat_stream(user_message, stream_callback)
+    def on_saved(future):
+        MESSAGE_STAGE_SECONDS.labels(stage='save').observe(time.perf_counter() - save_started)
+        if future.exception() is not None:
+            # 用户消息没有保存时不执行本轮，避免智能体记忆中有而消息记录中没有的对话
+            socketio.emit('error', {'message': f'消息保存失败: {future.exception()}'}, to=sid)
+            return
+        saved = future.result()
+        socketio.emit('message_saved', {'message': saved}, to=sid)
+
+        # 智能体运行可能持续数秒到数分钟，交给分发器执行（本进程线程池或独立工作进程），
+        # 事件按连接ID推送回当前客户端。并发已满时按用户公平排队，排队已满或排队超时时拒绝并撤回消息
+        task = {
+            'user_id': user_id,
+            'role': user.role,
+            'conversation_id': conversation_id,
+            'message': user_message,
+            'message_id': saved['id'],
+            'sid': sid
+        }
+        try:
+            with observe(MESSAGE_STAGE_SECONDS, stage='dispatch'):
+                position = agent_dispatcher.submit(task)
+        except AdmissionRejected as e:
+            reject_turn(socketio, task, e.to_dict())
+            return
+        if position:
+            socketio.emit('queued', {'position': position}, to=sid)
+
+    # 落库后在持久化回调线程中分发，当前事件处理立即返回并归还数据库连接
+    persistence.on_done(saving, on_saved)
 
 
 # ==================== 主函数 ====================
@@ -306,7 +762,15 @@ if __name__ == '__main__':
     print("\n" + "="*60)
     print("🚀 智能体授权测试系统 - Web版本")
     print("="*60)
-    print("\n访问地址: http://localhost:5000")
+    print(f"\n访问地址: http://localhost:{Config.SERVER_PORT}")
+    print(f"运行模式: {Config.SOCKETIO_ASYNC_MODE}，智能体分发: {Config.AGENT_DISPATCH}")
     print("测试账号: test / test123\n")
 
-    socketio.run(app, debug=True, host='0.0.0.0', port=5000)
+    socketio.run(
+        app,
+        debug=Config.DEBUG,
+        host=Config.SERVER_HOST,
+        port=Config.SERVER_PORT,
+        # threading模式使用Werkzeug服务器，仅建议开发和压测对比时使用
+        allow_unsafe_werkzeug=True
+    )
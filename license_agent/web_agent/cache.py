@@ -0,0 +1,180 @@
+"""
+通用缓存 - LRU + TTL 淘汰，支持内存与SQLite两种后端
+
+两种后端接口一致：get / set / delete / clear / len()。
+SQLite后端保存字符串值，可跨进程重启保留；内存后端可保存任意对象。
+SingleFlight 用于合并并发的相同请求。
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional, Tuple
+
+
+class TTLCache:
+    """线程安全的内存LRU缓存，条目超过TTL后失效"""
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 600):
+        """
+        Args:
+            max_entries: 最大条目数，超出后淘汰最久未使用的条目
+            ttl: 默认过期时间（秒）
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (过期时间, 值)
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+class SQLiteCache:
+    """基于SQLite文件的LRU缓存（值为字符串），服务重启后仍然有效"""
+
+    def __init__(self, path: str, max_entries: int = 10000, ttl: float = 600):
+        """
+        Args:
+            path: 缓存数据库文件路径
+            max_entries: 最大条目数，超出后按最近访问时间淘汰
+            ttl: 默认过期时间（秒）
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_entries ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_cache_entries_accessed ON cache_entries (accessed_at)"
+        )
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM cache_entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self._conn.execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE cache_entries SET accessed_at = ? WHERE key = ?", (now, key))
+            return row[0]
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        now = time.time()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache_entries (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, expires_at, now)
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM cache_entries").fetchone()[0]
+            if count > self.max_entries:
+                # 先清理过期条目，仍超出时淘汰最久未访问的条目
+                self._conn.execute("DELETE FROM cache_entries WHERE expires_at <= ?", (now,))
+                self._conn.execute(
+                    "DELETE FROM cache_entries WHERE key IN ("
+                    " SELECT key FROM cache_entries ORDER BY accessed_at LIMIT"
+                    " max(0, (SELECT COUNT(*) FROM cache_entries) - ?))",
+                    (self.max_entries,)
+                )
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache_entries")
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM cache_entries").fetchone()[0]
+
+
+class SingleFlight:
+    """
+    请求合并：同一键同时只执行一次，并发的调用方等待并共享同一个结果
+
+    执行结束后立即移除记录，不负责缓存结果（与 TTLCache 搭配使用）。
+    """
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Returns:
+            (结果, 是否与其他调用方共享了结果)；fn 抛出的异常会传递给所有等待方
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
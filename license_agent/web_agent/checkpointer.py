@@ -0,0 +1,356 @@
+"""
+基于应用SQLAlchemy数据库的LangGraph检查点存储 - 为每个对话保存智能体记忆
+"""
+import json
+from typing import Any, Dict, Iterator, Optional, Sequence
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from sqlalchemy import and_, delete, insert, select, tuple_, update
+
+from web_agent.models import db, AgentCheckpoint, AgentCheckpointBlob, AgentCheckpointWrite, Conversation
+
+checkpoints_table = AgentCheckpoint.__table__
+blobs_table = AgentCheckpointBlob.__table__
+writes_table = AgentCheckpointWrite.__table__
+conversations_table = Conversation.__table__
+
+
+class CheckpointConflict(Exception):
+    """同一对话的检查点已被另一轮对话更新（多个进程同时处理同一对话）"""
+
+
+class SQLAlchemyCheckpointSaver(BaseCheckpointSaver):
+    """
+    SQLAlchemy检查点存储
+
+    - 以 Conversation.id 作为 thread_id，每轮对话只读取最新一条检查点，不回放历史消息表
+    - 使用独立的Core连接读写，不干扰请求线程中的 db.session 事务
+    - 通道值按 (通道, 版本) 单独保存，每次写入只保存 new_versions 中变化的通道，未变化的通道在检查点间共用
+    - 写入时检查父检查点仍是该对话的最新检查点，其他进程已写入时抛出 CheckpointConflict
+    - 每次写入后只保留最近 retention 个检查点，避免长对话的检查点无限增长
+    """
+
+    def __init__(self, app=None, retention: int = 3, **kwargs):
+        super().__init__(**kwargs)
+        self.retention = max(2, retention)
+        self.engine = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """绑定Flask应用，获取数据库引擎"""
+        with app.app_context():
+            self.engine = db.engine
+
+    # ==================== 读取 ====================
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        """读取指定检查点，未指定 checkpoint_id 时读取最新检查点"""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+
+        query = select(checkpoints_table).where(
+            checkpoints_table.c.thread_id == thread_id,
+            checkpoints_table.c.checkpoint_ns == checkpoint_ns
+        )
+        if checkpoint_id:
+            query = query.where(checkpoints_table.c.checkpoint_id == checkpoint_id)
+        query = query.order_by(checkpoints_table.c.checkpoint_id.desc()).limit(1)
+
+        with self.engine.connect() as conn:
+            row = conn.execute(query).first()
+            if row is None:
+                return None
+            pending_writes = self._load_writes(conn, thread_id, checkpoint_ns, row.checkpoint_id)
+            return self._to_tuple(conn, row, pending_writes)
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        """按检查点ID倒序列出检查点"""
+        query = select(checkpoints_table)
+        if config:
+            query = query.where(checkpoints_table.c.thread_id == config["configurable"]["thread_id"])
+            checkpoint_ns = config["configurable"].get("checkpoint_ns")
+            if checkpoint_ns is not None:
+                query = query.where(checkpoints_table.c.checkpoint_ns == checkpoint_ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                query = query.where(checkpoints_table.c.checkpoint_id == checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            query = query.where(checkpoints_table.c.checkpoint_id < before_id)
+        query = query.order_by(checkpoints_table.c.checkpoint_id.desc())
+        # 元数据过滤在Python侧完成，此时不能在SQL中截断
+        if limit is not None and not filter:
+            query = query.limit(limit)
+
+        with self.engine.connect() as conn:
+            rows = conn.execute(query).fetchall()
+            results = []
+            for row in rows:
+                if filter:
+                    metadata = json.loads(row.checkpoint_metadata or '{}')
+                    if not all(metadata.get(k) == v for k, v in filter.items()):
+                        continue
+                if limit is not None and len(results) >= limit:
+                    break
+                pending_writes = self._load_writes(conn, row.thread_id, row.checkpoint_ns, row.checkpoint_id)
+                results.append(self._to_tuple(conn, row, pending_writes))
+
+        yield from results
+
+    # ==================== 写入 ====================
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        """保存检查点（只保存变化的通道值），并清理超出保留数量的旧检查点"""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        parent_id = config["configurable"].get("checkpoint_id")
+        channel_values = checkpoint.get("channel_values", {})
+        checkpoint_type, checkpoint_blob = self.serde.dumps_typed({**checkpoint, "channel_values": {}})
+        metadata_json = json.dumps(
+            get_checkpoint_metadata(config, metadata), ensure_ascii=False, default=str
+        )
+
+        with self.engine.begin() as conn:
+            self._lock_thread(conn, thread_id)
+            conn.execute(delete(checkpoints_table).where(
+                checkpoints_table.c.thread_id == thread_id,
+                checkpoints_table.c.checkpoint_ns == checkpoint_ns,
+                checkpoints_table.c.checkpoint_id == checkpoint["id"]
+            ))
+            latest_id = conn.execute(
+                select(checkpoints_table.c.checkpoint_id)
+                .where(checkpoints_table.c.thread_id == thread_id,
+                       checkpoints_table.c.checkpoint_ns == checkpoint_ns)
+                .order_by(checkpoints_table.c.checkpoint_id.desc()).limit(1)
+            ).scalar()
+            if latest_id is not None and latest_id != parent_id:
+                raise CheckpointConflict(f"对话 {thread_id} 正在另一处处理，请稍后重试")
+
+            for channel, version in new_versions.items():
+                if channel in channel_values:
+                    value_type, value_blob = self.serde.dumps_typed(channel_values[channel])
+                else:
+                    value_type, value_blob = "empty", None
+                key = and_(
+                    blobs_table.c.thread_id == thread_id,
+                    blobs_table.c.checkpoint_ns == checkpoint_ns,
+                    blobs_table.c.channel == channel,
+                    blobs_table.c.version == str(version)
+                )
+                conn.execute(delete(blobs_table).where(key))
+                conn.execute(insert(blobs_table).values(
+                    thread_id=thread_id,
+                    checkpoint_ns=checkpoint_ns,
+                    channel=channel,
+                    version=str(version),
+                    value_type=value_type,
+                    value=value_blob
+                ))
+
+            conn.execute(insert(checkpoints_table).values(
+                thread_id=thread_id,
+                checkpoint_ns=checkpoint_ns,
+                checkpoint_id=checkpoint["id"],
+                parent_checkpoint_id=parent_id,
+                checkpoint_type=checkpoint_type,
+                checkpoint=checkpoint_blob,
+                checkpoint_metadata=metadata_json
+            ))
+            self._prune(conn, thread_id, checkpoint_ns)
+
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        """保存节点的中间写入；特殊通道（错误、中断等）按覆盖语义写入"""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        key = and_(
+            writes_table.c.thread_id == thread_id,
+            writes_table.c.checkpoint_ns == checkpoint_ns,
+            writes_table.c.checkpoint_id == checkpoint_id,
+            writes_table.c.task_id == task_id
+        )
+
+        with self.engine.begin() as conn:
+            existing = set(conn.execute(select(writes_table.c.idx).where(key)).scalars())
+            for idx, (channel, value) in enumerate(writes):
+                idx = WRITES_IDX_MAP.get(channel, idx)
+                value_type, value_blob = self.serde.dumps_typed(value)
+                if idx in existing:
+                    if idx >= 0:
+                        continue
+                    conn.execute(update(writes_table).where(key, writes_table.c.idx == idx).values(
+                        channel=channel, value_type=value_type, value=value_blob, task_path=task_path
+                    ))
+                    continue
+                conn.execute(insert(writes_table).values(
+                    thread_id=thread_id,
+                    checkpoint_ns=checkpoint_ns,
+                    checkpoint_id=checkpoint_id,
+                    task_id=task_id,
+                    task_path=task_path,
+                    idx=idx,
+                    channel=channel,
+                    value_type=value_type,
+                    value=value_blob
+                ))
+
+    def delete_thread(self, thread_id: str) -> None:
+        """删除对话的全部检查点（对话被删除时调用）"""
+        thread_id = str(thread_id)
+        with self.engine.begin() as conn:
+            conn.execute(delete(writes_table).where(writes_table.c.thread_id == thread_id))
+            conn.execute(delete(blobs_table).where(blobs_table.c.thread_id == thread_id))
+            conn.execute(delete(checkpoints_table).where(checkpoints_table.c.thread_id == thread_id))
+
+    # ==================== 内部方法 ====================
+
+    def _lock_thread(self, conn, thread_id: str):
+        """
+        串行化同一对话的检查点写入
+
+        PostgreSQL 锁定对话行（SELECT ... FOR UPDATE）；SQLite 不支持行锁，
+        随后的 DELETE 会取得数据库写锁，效果相同。没有对应对话（临时会话）时不加锁。
+        """
+        if thread_id.isdigit():
+            conn.execute(
+                select(conversations_table.c.id)
+                .where(conversations_table.c.id == int(thread_id))
+                .with_for_update()
+            )
+
+    def _prune(self, conn, thread_id: str, checkpoint_ns: str):
+        """只保留最近 retention 个检查点及其写入，并删除不再被任何检查点引用的通道值"""
+        stale_ids = conn.execute(
+            select(checkpoints_table.c.checkpoint_id)
+            .where(checkpoints_table.c.thread_id == thread_id,
+                   checkpoints_table.c.checkpoint_ns == checkpoint_ns)
+            .order_by(checkpoints_table.c.checkpoint_id.desc())
+            .offset(self.retention)
+        ).scalars().all()
+        if not stale_ids:
+            return
+
+        conn.execute(delete(writes_table).where(
+            writes_table.c.thread_id == thread_id,
+            writes_table.c.checkpoint_ns == checkpoint_ns,
+            writes_table.c.checkpoint_id.in_(stale_ids)
+        ))
+        conn.execute(delete(checkpoints_table).where(
+            checkpoints_table.c.thread_id == thread_id,
+            checkpoints_table.c.checkpoint_ns == checkpoint_ns,
+            checkpoints_table.c.checkpoint_id.in_(stale_ids)
+        ))
+
+        referenced = set()
+        for row in conn.execute(
+            select(checkpoints_table.c.checkpoint_type, checkpoints_table.c.checkpoint)
+            .where(checkpoints_table.c.thread_id == thread_id,
+                   checkpoints_table.c.checkpoint_ns == checkpoint_ns)
+        ):
+            checkpoint = self.serde.loads_typed((row.checkpoint_type, row.checkpoint))
+            referenced.update((channel, str(version)) for channel, version in checkpoint["channel_versions"].items())
+        unused = [
+            row.id for row in conn.execute(
+                select(blobs_table.c.id, blobs_table.c.channel, blobs_table.c.version)
+                .where(blobs_table.c.thread_id == thread_id,
+                       blobs_table.c.checkpoint_ns == checkpoint_ns)
+            )
+            if (row.channel, row.version) not in referenced
+        ]
+        if unused:
+            conn.execute(delete(blobs_table).where(blobs_table.c.id.in_(unused)))
+
+    def _load_blobs(self, conn, thread_id: str, checkpoint_ns: str, channel_versions: dict) -> dict:
+        """按检查点的通道版本读取通道值（不存在的通道以 empty 记录，跳过）"""
+        if not channel_versions:
+            return {}
+        rows = conn.execute(
+            select(blobs_table.c.channel, blobs_table.c.value_type, blobs_table.c.value)
+            .where(blobs_table.c.thread_id == thread_id,
+                   blobs_table.c.checkpoint_ns == checkpoint_ns,
+                   tuple_(blobs_table.c.channel, blobs_table.c.version).in_(
+                       [(channel, str(version)) for channel, version in channel_versions.items()]),
+                   blobs_table.c.value_type != "empty")
+        ).fetchall()
+        return {row.channel: self.serde.loads_typed((row.value_type, row.value)) for row in rows}
+
+    def _load_writes(self, conn, thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> list:
+        """读取检查点的待应用写入（按 task_path, task_id, idx 排序）"""
+        rows = conn.execute(
+            select(writes_table)
+            .where(writes_table.c.thread_id == thread_id,
+                   writes_table.c.checkpoint_ns == checkpoint_ns,
+                   writes_table.c.checkpoint_id == checkpoint_id)
+            .order_by(writes_table.c.task_path, writes_table.c.task_id, writes_table.c.idx)
+        ).fetchall()
+        return [
+            (row.task_id, row.channel, self.serde.loads_typed((row.value_type, row.value)))
+            for row in rows
+        ]
+
+    def _to_tuple(self, conn, row, pending_writes: list) -> CheckpointTuple:
+        """数据库行转换为CheckpointTuple（通道值按版本从 agent_checkpoint_blobs 读取）"""
+        checkpoint = self.serde.loads_typed((row.checkpoint_type, row.checkpoint))
+        checkpoint["channel_values"] = self._load_blobs(
+            conn, row.thread_id, row.checkpoint_ns, checkpoint["channel_versions"]
+        )
+        return CheckpointTuple(
+            config={
+                "configurable": {
+                    "thread_id": row.thread_id,
+                    "checkpoint_ns": row.checkpoint_ns,
+                    "checkpoint_id": row.checkpoint_id,
+                }
+            },
+            checkpoint=checkpoint,
+            metadata=json.loads(row.checkpoint_metadata or '{}'),
+            parent_config=(
+                {
+                    "configurable": {
+                        "thread_id": row.thread_id,
+                        "checkpoint_ns": row.checkpoint_ns,
+                        "checkpoint_id": row.parent_checkpoint_id,
+                    }
+                }
+                if row.parent_checkpoint_id
+                else None
+            ),
+            pending_writes=pending_writes,
+        )
@@ -3,15 +3,101 @@
 """
 import os
 
+
+def normalize_database_url(url: str) -> str:
+    """兼容部分平台提供的 postgres:// 写法（SQLAlchemy 只识别 postgresql://）"""
+    if url.startswith('postgres://'):
+        return 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def build_engine_options(url: str) -> dict:
+    """
+    按数据库后端生成 SQLALCHEMY_ENGINE_OPTIONS
+
+    SQLite 的 PRAGMA 在每个新连接上执行（见 models.init_db），这里只配置连接池；
+    PostgreSQL 额外开启连接预检与定期回收，避免使用被服务端断开的连接。
+    """
+    if url.startswith('sqlite'):
+        if ':memory:' in url or url in ('sqlite://', 'sqlite:///'):
+            return {}
+        return {
+            'pool_size': int(os.environ.get('DB_POOL_SIZE') or 20),
+            'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW') or 20),
+            'pool_timeout': float(os.environ.get('DB_POOL_TIMEOUT') or 30),
+            # 连接在线程池间传递；写锁冲突时等待 busy_timeout 而不是立即报 database is locked
+            'connect_args': {
+                'check_same_thread': False,
+                'timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT') or 5000) / 1000
+            }
+        }
+    return {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE') or 10),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW') or 20),
+        'pool_timeout': float(os.environ.get('DB_POOL_TIMEOUT') or 30),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE') or 1800),
+        'pool_pre_ping': True
+    }
+
+
 class Config:
     """配置类"""
 
     # Flask配置
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
 
-    # 数据库配置
-    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///database.db'
+    # 服务运行配置
+    SERVER_HOST = os.environ.get('SERVER_HOST') or '0.0.0.0'
+    SERVER_PORT = int(os.environ.get('SERVER_PORT') or 5000)
+    DEBUG = os.environ.get('FLASK_DEBUG', 'true').lower() != 'false'
+
+    # Socket.IO并发模式：threading（每个连接一个系统线程）/ eventlet / gevent（协程，适合大量并发会话）
+    SOCKETIO_ASYNC_MODE = os.environ.get('SOCKETIO_ASYNC_MODE') or 'threading'
+
+    # 多进程部署：各进程通过消息队列（如 redis://localhost:6379/0）互相转发Socket.IO事件。
+    # 所有进程须使用相同的 SECRET_KEY（登录会话保存在签名Cookie中），
+    # 负载均衡需开启会话粘滞（长轮询传输的同一会话必须落在同一进程）
+    SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE') or None
+
+    # 智能体任务分发：local（本进程线程池执行）/ queue（推送到消息队列，由 agent_worker.py 进程执行）
+    AGENT_DISPATCH = os.environ.get('AGENT_DISPATCH') or 'local'
+    AGENT_TASK_QUEUE = os.environ.get('AGENT_TASK_QUEUE') or 'license_agent:agent_tasks'
+    # 每个进程同时执行的智能体对话轮次上限（准入控制的全局并发上限）
+    AGENT_MAX_WORKERS = int(os.environ.get('AGENT_MAX_WORKERS') or 32)
+    # 智能体服务加载时机（导入 langchain/langgraph 并编译流程图需要数秒）：
+    # background（启动后在后台线程预热）/ lazy（第一条消息到来时加载）/ eager（启动时同步加载）
+    AGENT_STARTUP_MODE = os.environ.get('AGENT_STARTUP_MODE') or 'background'
+
+    # 准入控制：每用户令牌桶（按角色取速率，单位 条/秒）与每角色总量令牌桶，超出直接拒绝；
+    # 并发占满后按用户加权公平排队，权重大的角色出队更快
+    ADMISSION_RATE_LIMIT_ENABLED = os.environ.get('ADMISSION_RATE_LIMIT_ENABLED', 'true').lower() != 'false'
+    ADMISSION_USER_LIMITS = {
+        'developer': {'rate': 0.2, 'burst': 5},
+        'admin': {'rate': 0.5, 'burst': 10}
+    }
+    ADMISSION_ROLE_LIMITS = {
+        'developer': {'rate': 20, 'burst': 100},
+        'admin': {'rate': 10, 'burst': 50}
+    }
+    ADMISSION_WEIGHTS = {'developer': 1, 'admin': 2}
+    ADMISSION_MAX_QUEUED = int(os.environ.get('ADMISSION_MAX_QUEUED') or 200)
+    ADMISSION_MAX_QUEUED_PER_USER = int(os.environ.get('ADMISSION_MAX_QUEUED_PER_USER') or 3)
+    ADMISSION_QUEUE_TIMEOUT = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT') or 60)  # 排队超时（秒）
+    ADMISSION_WORKER_PREFETCH = int(os.environ.get('ADMISSION_WORKER_PREFETCH') or 8)  # 每个工作进程最多预取的排队任务
+
+    # 数据库配置（切换后端时用 web_agent/migrate_db.py 迁移已有数据）
+    SQLALCHEMY_DATABASE_URI = normalize_database_url(os.environ.get('DATABASE_URL') or 'sqlite:///database.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = build_engine_options(SQLALCHEMY_DATABASE_URI)
+    # SQLite 连接参数：WAL 模式下读写互不阻塞；NORMAL 同步级别在 WAL 下断电只可能丢失最近的事务，不会损坏数据库
+    SQLITE_PRAGMAS = {
+        'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE') or 'WAL',
+        'synchronous': os.environ.get('SQLITE_SYNCHRONOUS') or 'NORMAL',
+        'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT') or 5000),  # 毫秒
+        'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE') or 256 * 1024 * 1024),
+        'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE') or -64000),  # 负数表示KB，约64MB
+        'temp_store': 'MEMORY'
+    }
 
     # Session配置
     SESSION_COOKIE_HTTPONLY = True
@@ -22,6 +108,111 @@ class Config:
     DEEPSEEK_API_KEY = os.environ.get('DEEPSEEK_API_KEY') or 'sk-79371d9e1dd444ca92d8fbe37c2ebd25'
     DEEPSEEK_BASE_URL = os.environ.get('DEEPSEEK_BASE_URL') or 'https://api.deepseek.com/v1/'
     DEEPSEEK_MODEL = os.environ.get('DEEPSEEK_MODEL') or 'deepseek-chat'
+    # 是否逐token流式推送回复（关闭后退回整段返回）
+    LLM_STREAMING = os.environ.get('LLM_STREAMING', 'true').lower() != 'false'
+
+    # LLM后端HTTP连接池（进程内所有会话共享，保持长连接避免重复TLS握手）
+    LLM_HTTP_MAX_CONNECTIONS = int(os.environ.get('LLM_HTTP_MAX_CONNECTIONS') or 100)
+    LLM_HTTP_MAX_KEEPALIVE = int(os.environ.get('LLM_HTTP_MAX_KEEPALIVE') or 20)
+    LLM_HTTP_KEEPALIVE_EXPIRY = float(os.environ.get('LLM_HTTP_KEEPALIVE_EXPIRY') or 30)
+    LLM_HTTP2 = os.environ.get('LLM_HTTP2', 'false').lower() == 'true'  # 需要安装 h2
+    LLM_CONNECT_TIMEOUT = float(os.environ.get('LLM_CONNECT_TIMEOUT') or 5)
+    LLM_READ_TIMEOUT = float(os.environ.get('LLM_READ_TIMEOUT') or 120)
+    LLM_POOL_TIMEOUT = float(os.environ.get('LLM_POOL_TIMEOUT') or 10)
+    # 连接失败、429、5xx 时按全抖动指数退避重试
+    LLM_MAX_RETRIES = int(os.environ.get('LLM_MAX_RETRIES') or 3)
+    LLM_RETRY_BACKOFF = float(os.environ.get('LLM_RETRY_BACKOFF') or 0.5)
+    LLM_RETRY_MAX_BACKOFF = float(os.environ.get('LLM_RETRY_MAX_BACKOFF') or 8)
+
+    # LLM响应缓存（重复的只读提问直接返回缓存回复；调用有副作用工具的回复不缓存）
+    LLM_CACHE_ENABLED = os.environ.get('LLM_CACHE_ENABLED', 'true').lower() != 'false'
+    LLM_CACHE_BACKEND = os.environ.get('LLM_CACHE_BACKEND') or 'memory'  # memory / sqlite（重启后保留）
+    LLM_CACHE_PATH = os.environ.get('LLM_CACHE_PATH') or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'instance', 'llm_cache.db'
+    )
+    LLM_CACHE_TTL = float(os.environ.get('LLM_CACHE_TTL') or 600)
+    LLM_CACHE_MAX_ENTRIES = int(os.environ.get('LLM_CACHE_MAX_ENTRIES') or 1000)
+
+    # 工具执行配置（同一轮的多个工具调用在共享线程池中并行执行）
+    TOOL_MAX_WORKERS = int(os.environ.get('TOOL_MAX_WORKERS') or 16)
+    TOOL_TIMEOUT = float(os.environ.get('TOOL_TIMEOUT') or 60)
+    TOOL_TIMEOUTS = {}  # 按工具名覆盖超时时间，如 {'query_test_history': 10}
+
+    # 设备连通性检查缓存（不可达/认证失败的结果使用更短的负缓存时间）
+    DEVICE_CHECK_TTL = float(os.environ.get('DEVICE_CHECK_TTL') or 30)
+    DEVICE_CHECK_NEGATIVE_TTL = float(os.environ.get('DEVICE_CHECK_NEGATIVE_TTL') or 10)
+    DEVICE_CHECK_CACHE_SIZE = 1000
+
+    # 用户身份缓存：load_user 与 Socket.IO 事件使用缓存的用户身份；
+    # 本进程更新用户后立即失效，其他进程最长 USER_CACHE_TTL 秒后生效
+    USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL') or 60)
+    USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE') or 10000)
+
+    # 密码哈希：bcrypt cost（修改后用户下次登录时自动按新 cost 重新哈希）；
+    # 计算在独立进程池中执行（PASSWORD_HASH_WORKERS=0 时在请求线程中计算），工作进程的调度优先级降低 PASSWORD_HASH_NICE
+    BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS') or 12)
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS') or 2)
+    PASSWORD_HASH_NICE = int(os.environ.get('PASSWORD_HASH_NICE') or 10)
+
+    # 导入应用时自动建表并创建测试用户（直接运行 app.py 时总会执行）；
+    # 关闭时由部署流程执行 flask --app web_agent.app init-db，进程启动不再承担建表与密码哈希
+    DB_AUTO_INIT = os.environ.get('DB_AUTO_INIT', 'false').lower() == 'true'
+
+    # 后台任务配置（授权测试在独立线程池中执行，不占用Socket.IO处理线程）
+    JOB_MAX_WORKERS = int(os.environ.get('JOB_MAX_WORKERS') or 32)
+    # 启动时把已中断的任务（执行进程已退出、租约过期）标记为失败并清除过期租约；
+    # 默认关闭，单进程部署或部署流程中确认需要时开启
+    JOB_RECOVER_ON_STARTUP = os.environ.get('JOB_RECOVER_ON_STARTUP', 'false').lower() == 'true'
+
+    # 设备租约：同一设备同时只执行一个授权测试，相同请求关联到进行中的测试，不同请求排队
+    # memory（单进程）/ database（多进程部署时使用，租约保存在 device_leases 表）
+    DEVICE_LEASE_BACKEND = os.environ.get('DEVICE_LEASE_BACKEND') or 'memory'
+    DEVICE_LEASE_TTL = float(os.environ.get('DEVICE_LEASE_TTL') or 600)  # 执行中每个步骤续期
+    DEVICE_LEASE_POLL_INTERVAL = float(os.environ.get('DEVICE_LEASE_POLL_INTERVAL') or 1)
+
+    # 批量授权测试（并发上限按进程计算；超时类失败按指数退避重试）
+    FLEET_MAX_CONCURRENCY = int(os.environ.get('FLEET_MAX_CONCURRENCY') or 16)
+    FLEET_PER_PRODUCT_CONCURRENCY = int(os.environ.get('FLEET_PER_PRODUCT_CONCURRENCY') or 4)
+    FLEET_MAX_RETRIES = int(os.environ.get('FLEET_MAX_RETRIES') or 2)
+    FLEET_RETRY_BACKOFF = float(os.environ.get('FLEET_RETRY_BACKOFF') or 2)
+    FLEET_MAX_DEVICES = int(os.environ.get('FLEET_MAX_DEVICES') or 1000)
+    FLEET_DISPATCH_INTERVAL = float(os.environ.get('FLEET_DISPATCH_INTERVAL') or 1)  # 重新调度被占用设备的间隔（秒）
+    FLEET_PERSIST_INTERVAL = float(os.environ.get('FLEET_PERSIST_INTERVAL') or 1)  # 执行中保存批次进度的最短间隔（秒）
+
+    # 对话记忆配置（LangGraph检查点保存在应用数据库中）
+    AGENT_MEMORY_MAX_MESSAGES = int(os.environ.get('AGENT_MEMORY_MAX_MESSAGES') or 100)
+    CHECKPOINT_RETENTION = int(os.environ.get('CHECKPOINT_RETENTION') or 3)
+    # 每轮提示词的token预算，超出后早期轮次被压缩为摘要
+    CONTEXT_TOKEN_BUDGET = int(os.environ.get('CONTEXT_TOKEN_BUDGET') or 6000)
+
+    # 后写式持久化（消息与测试记录合并为组提交）
+    PERSIST_FLUSH_INTERVAL = float(os.environ.get('PERSIST_FLUSH_INTERVAL') or 0.005)  # 每批收集窗口（秒）
+    PERSIST_MAX_BATCH = int(os.environ.get('PERSIST_MAX_BATCH') or 200)
+    PERSIST_QUEUE_SIZE = int(os.environ.get('PERSIST_QUEUE_SIZE') or 10000)
+    PERSIST_PUT_TIMEOUT = float(os.environ.get('PERSIST_PUT_TIMEOUT') or 5)  # 队列满时的最长等待（秒）
+    PERSIST_CALLBACK_WORKERS = int(os.environ.get('PERSIST_CALLBACK_WORKERS') or 4)  # 执行落库回调（推送、分发）的线程数
+
+    # 运行指标：/metrics 访问令牌（为空时不校验）；工作进程在 WORKER_METRICS_PORT 上单独导出指标
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN') or None
+    WORKER_METRICS_PORT = int(os.environ.get('WORKER_METRICS_PORT') or 0)
+    # span日志输出位置：文件路径，'-' 为标准输出，为空时关闭
+    TRACE_SPANS_LOG = os.environ.get('TRACE_SPANS_LOG') or None
+
+    # 工具调用记录：超过该长度（字符）的工具结果拆出保存到 tool_payloads 表
+    TOOL_LOG_INLINE_LIMIT = int(os.environ.get('TOOL_LOG_INLINE_LIMIT') or 2048)
+
+    # 分页配置
+    CONVERSATIONS_PAGE_SIZE = 30
+    MESSAGES_PAGE_SIZE = 50
+    TEST_RECORDS_PAGE_SIZE = 20
+    SEARCH_PAGE_SIZE = 20
+    MAX_PAGE_SIZE = 200
+
+    # 全文检索：每次最多取出的命中行数（按时间倒序，只在其中打分排序与分页，超出时结果带 truncated）与结果片段长度
+    SEARCH_MAX_CANDIDATES = int(os.environ.get('SEARCH_MAX_CANDIDATES') or 1000)
+    SEARCH_SNIPPET_CHARS = int(os.environ.get('SEARCH_SNIPPET_CHARS') or 80)
+    # 消息数不超过该值的用户直接扫描本人消息，超过时使用全文检索索引
+    SEARCH_SCAN_LIMIT = int(os.environ.get('SEARCH_SCAN_LIMIT') or 5000)
 
     # 其他配置
     MAX_MESSAGE_LENGTH = 2000
@@ -0,0 +1,188 @@
+"""
+上下文压缩 - 控制每轮发送给LLM的提示词长度
+
+长对话中，早期轮次被压缩为滚动摘要，历史工具结果只保留关键字段，
+使提示词大小在对话持续进行时保持基本稳定。
+"""
+import json
+import re
+from typing import List, Optional, Tuple
+
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    HumanMessage,
+    SystemMessage,
+    ToolMessage,
+)
+
+# 历史工具结果中保留的字段
+TOOL_RESULT_KEEP_FIELDS = ("success", "test_id", "message")
+
+_CJK_PATTERN = re.compile(r'[　-〿㐀-䶿一-鿿＀-￯]')
+
+SUMMARY_PROMPT = """你负责压缩设备授权测试助手的对话历史。请把下面的对话整理为简洁的中文摘要，供后续对话继续使用。
+
+必须保留：设备IP、产品名称、版本、登录用户名（不要保留密码）、测试ID、测试结论与失败原因、报告链接、用户尚未完成的诉求。
+省略寒暄和重复内容，不超过300字。"""
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算token数：中文按每字1个token，其余按每4个字符1个token"""
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def message_tokens(message: BaseMessage) -> int:
+    """估算单条消息的token数（含工具调用参数与固定开销）"""
+    content = message.content if isinstance(message.content, str) else json.dumps(message.content, ensure_ascii=False)
+    tokens = estimate_tokens(content) + 4
+    if isinstance(message, AIMessage) and message.tool_calls:
+        tokens += estimate_tokens(json.dumps(message.tool_calls, ensure_ascii=False))
+    return tokens
+
+
+def shrink_tool_message(message: ToolMessage) -> ToolMessage:
+    """历史工具结果只保留 success/test_id/message 字段"""
+    try:
+        payload = json.loads(message.content)
+    except (TypeError, ValueError):
+        return message
+    if not isinstance(payload, dict):
+        return message
+
+    compact = {k: payload[k] for k in TOOL_RESULT_KEEP_FIELDS if k in payload}
+    return message.model_copy(update={"content": json.dumps(compact, ensure_ascii=False)})
+
+
+class ContextCompactor:
+    """按token预算压缩对话上下文"""
+
+    def __init__(self, llm, token_budget: int = 6000, summary_max_tokens: int = 600):
+        """
+        Args:
+            llm: 用于生成摘要的模型（不绑定工具）
+            token_budget: 提示词token预算（含系统提示词与摘要）
+            summary_max_tokens: 摘要本身的token上限
+        """
+        self.llm = llm
+        self.token_budget = token_budget
+        self.summary_max_tokens = summary_max_tokens
+
+    def compact(
+        self,
+        messages: List[BaseMessage],
+        system_prompt: str,
+        summary: str = "",
+        summary_upto: Optional[str] = None,
+        min_cut: int = 0
+    ) -> Tuple[List[BaseMessage], str, Optional[str]]:
+        """
+        生成本轮发送给LLM的消息列表
+
+        Args:
+            messages: 对话记忆中的全部消息
+            system_prompt: 系统提示词
+            summary: 已有的滚动摘要
+            summary_upto: 已有摘要覆盖到的最后一条消息ID
+            min_cut: 至少需要纳入摘要的消息数（即将被移出记忆的旧消息）
+
+        Returns:
+            (提示词消息列表, 新摘要, 新摘要覆盖到的消息ID)
+        """
+        messages = self._shrink_old_tool_results(messages)
+
+        covered = self._covered_count(messages, summary_upto)
+        cut = max(covered, min_cut)
+        if self._prompt_tokens(system_prompt, summary, messages[cut:]) > self.token_budget:
+            # 超出预算时，把较早的轮次压缩到只剩一半预算，避免每轮都重新摘要
+            cut = max(cut, self._find_cut(messages, system_prompt, summary, self.token_budget // 2))
+
+        if cut > covered:
+            summary = self._summarize(summary, messages[covered:cut])
+            summary_upto = messages[cut - 1].id
+
+        prompt = [SystemMessage(content=self._system_content(system_prompt, summary))] + messages[cut:]
+        return prompt, summary, summary_upto
+
+    def _shrink_old_tool_results(self, messages: List[BaseMessage]) -> List[BaseMessage]:
+        """压缩最后一条用户消息之前的工具结果，本轮工具结果保持完整"""
+        last_human = max(
+            (i for i, m in enumerate(messages) if isinstance(m, HumanMessage)),
+            default=0
+        )
+        return [
+            shrink_tool_message(m) if i < last_human and isinstance(m, ToolMessage) else m
+            for i, m in enumerate(messages)
+        ]
+
+    @staticmethod
+    def _covered_count(messages: List[BaseMessage], summary_upto: Optional[str]) -> int:
+        """已被摘要覆盖的消息数；覆盖的消息可能已被移出记忆，此时返回0"""
+        if not summary_upto:
+            return 0
+        for i, m in enumerate(messages):
+            if m.id == summary_upto:
+                return i + 1
+        return 0
+
+    def _find_cut(self, messages: List[BaseMessage], system_prompt: str, summary: str, target: int) -> int:
+        """找到最靠前的用户消息位置，使其后的消息满足token目标"""
+        base = estimate_tokens(system_prompt) + self.summary_max_tokens
+        tokens = base
+        cut = len(messages)
+        for i in range(len(messages) - 1, -1, -1):
+            tokens += message_tokens(messages[i])
+            if tokens > target and cut < len(messages):
+                break
+            if isinstance(messages[i], HumanMessage):
+                cut = i
+        # 至少保留最后一个完整轮次
+        return cut if cut < len(messages) else self._last_human_index(messages)
+
+    @staticmethod
+    def _last_human_index(messages: List[BaseMessage]) -> int:
+        for i in range(len(messages) - 1, -1, -1):
+            if isinstance(messages[i], HumanMessage):
+                return i
+        return 0
+
+    def _prompt_tokens(self, system_prompt: str, summary: str, messages: List[BaseMessage]) -> int:
+        return estimate_tokens(self._system_content(system_prompt, summary)) + sum(
+            message_tokens(m) for m in messages
+        )
+
+    @staticmethod
+    def _system_content(system_prompt: str, summary: str) -> str:
+        if not summary:
+            return system_prompt
+        return f"{system_prompt}\n\n之前的对话摘要：\n{summary}"
+
+    def _summarize(self, summary: str, messages: List[BaseMessage]) -> str:
+        """把新移出窗口的消息合并进滚动摘要"""
+        lines = []
+        for m in messages:
+            if isinstance(m, HumanMessage):
+                lines.append(f"用户: {m.content}")
+            elif isinstance(m, AIMessage):
+                if m.content:
+                    lines.append(f"助手: {m.content}")
+                for call in m.tool_calls or []:
+                    args = {k: v for k, v in call.get('args', {}).items() if k != 'password'}
+                    lines.append(f"助手调用工具 {call.get('name')}: {json.dumps(args, ensure_ascii=False)}")
+            elif isinstance(m, ToolMessage):
+                lines.append(f"工具 {m.name} 返回: {m.content}")
+
+        request = ""
+        if summary:
+            request += f"已有摘要：\n{summary}\n\n"
+        request += "新增对话：\n" + "\n".join(lines)
+
+        # nostream：摘要调用不应作为回复token推送给前端
+        response = self.llm.invoke(
+            [SystemMessage(content=SUMMARY_PROMPT), HumanMessage(content=request)],
+            config={"tags": ["nostream"]}
+        )
+        return response.content.strip()
@@ -0,0 +1,100 @@
+"""
+设备连通性检查缓存 - 短TTL结果缓存、不可达设备的负缓存，以及并发检查合并
+
+同一设备（IP + 用户名 + 密码）在TTL内重复检查直接返回缓存结果；
+多个会话同时检查同一设备时只发起一次探测，其余调用方共享结果。
+缓存键使用进程内随机密钥对凭证做HMAC，不保存明文或可离线比对的密码摘要。
+"""
+import copy
+import hashlib
+import hmac
+import secrets
+import threading
+from typing import Any, Callable, Dict
+
+from web_agent.cache import SingleFlight, TTLCache
+
+
+class DeviceCheckCache:
+    """设备连通性检查结果缓存（Flask扩展风格，通过 init_app 读取配置）"""
+
+    def __init__(self, ttl: float = 30, negative_ttl: float = 10, max_entries: int = 1000):
+        """
+        Args:
+            ttl: 检查成功结果的缓存时间（秒）
+            negative_ttl: 设备不可达、认证失败等结果的缓存时间（秒）
+            max_entries: 最大缓存设备数
+        """
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.cache = TTLCache(max_entries=max_entries, ttl=ttl)
+        self.flight = SingleFlight()
+        self._key_secret = secrets.token_bytes(32)
+
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def init_app(self, app):
+        self.ttl = app.config.get('DEVICE_CHECK_TTL', self.ttl)
+        self.negative_ttl = app.config.get('DEVICE_CHECK_NEGATIVE_TTL', self.negative_ttl)
+        self.cache = TTLCache(max_entries=app.config.get('DEVICE_CHECK_CACHE_SIZE', 1000), ttl=self.ttl)
+
+    def make_key(self, device_ip: str, username: str, password: str) -> str:
+        """设备IP + 凭证的HMAC，密钥只存在于当前进程内存"""
+        credential = hmac.new(
+            self._key_secret,
+            f"{username}\0{password}".encode('utf-8'),
+            hashlib.sha256
+        ).hexdigest()
+        return f"{device_ip.strip().lower()}|{credential}"
+
+    def check(
+        self,
+        device_ip: str,
+        username: str,
+        password: str,
+        probe: Callable[[str, str, str], Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """
+        返回设备检查结果，必要时调用 probe 实际探测
+
+        Args:
+            probe: 实际执行探测的函数 probe(device_ip, username, password)
+        """
+        key = self.make_key(device_ip, username, password)
+        cached = self.cache.get(key)
+        if cached is not None:
+            with self._lock:
+                self.hits += 1
+            return copy.deepcopy(cached)
+
+        def run_probe():
+            result = probe(device_ip, username, password)
+            self.cache.set(key, result, ttl=self.ttl if result.get("success") else self.negative_ttl)
+            return result
+
+        result, shared = self.flight.do(key, run_probe)
+        with self._lock:
+            if shared:
+                self.coalesced += 1
+            else:
+                self.misses += 1
+        return copy.deepcopy(result)
+
+    def invalidate(self, device_ip: str, username: str, password: str):
+        self.cache.delete(self.make_key(device_ip, username, password))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self.cache),
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced
+            }
+
+
+# 全局设备检查缓存，在 create_agent_service 中通过 init_app 读取配置
+device_check_cache = DeviceCheckCache()
@@ -0,0 +1,398 @@
+"""
+设备租约 - 同一设备同时只执行一个授权测试
+
+- 相同请求（设备、产品、版本、凭证均一致）关联到正在执行或排队中的测试，返回同一个 test_id
+- 不同请求在该设备的队列中排队，可查询排队位置；当前测试结束后按顺序执行
+- 租约有两种后端：memory（单进程）与 database（多进程共享 device_leases 表）；
+  租约在执行过程中续期，执行进程异常退出时到期自动失效
+- 排队只在本进程内存中：相同请求只与本进程的排队请求以及（任意进程的）租约持有者去重。
+  另一进程中排队、尚未执行的相同请求不可见，此时会新建一个测试排在后面（依次执行，不会并发占用设备）
+- 数据库读写（新建任务、查询与获取租约）都在锁外进行，锁只保护排队与执行中的请求表
+"""
+import hashlib
+import hmac
+import threading
+from collections import defaultdict, deque
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy.exc import IntegrityError
+
+from web_agent.models import db, DeviceLease
+
+
+class MemoryLeaseBackend:
+    """进程内租约表"""
+
+    def __init__(self):
+        self._leases = {}  # device_ip -> (test_id, fingerprint, expires_at)
+        self._lock = threading.Lock()
+
+    def acquire(self, device_ip: str, test_id: str, fingerprint: str, ttl: float) -> bool:
+        now = datetime.utcnow()
+        with self._lock:
+            lease = self._leases.get(device_ip)
+            if lease is not None and lease[2] > now:
+                return False
+            self._leases[device_ip] = (test_id, fingerprint, now + timedelta(seconds=ttl))
+            return True
+
+    def renew(self, device_ip: str, test_id: str, ttl: float):
+        with self._lock:
+            lease = self._leases.get(device_ip)
+            if lease is not None and lease[0] == test_id:
+                self._leases[device_ip] = (test_id, lease[1], datetime.utcnow() + timedelta(seconds=ttl))
+
+    def release(self, device_ip: str, test_id: str):
+        with self._lock:
+            lease = self._leases.get(device_ip)
+            if lease is not None and lease[0] == test_id:
+                del self._leases[device_ip]
+
+    def holder(self, device_ip: str) -> Optional[Tuple[str, str]]:
+        """返回 (test_id, fingerprint)，租约不存在或已过期时返回 None"""
+        with self._lock:
+            lease = self._leases.get(device_ip)
+            if lease is None or lease[2] <= datetime.utcnow():
+                return None
+            return lease[0], lease[1]
+
+    def leased(self, device_ips: List[str]) -> Set[str]:
+        """其中持有有效租约的设备"""
+        now = datetime.utcnow()
+        with self._lock:
+            return {ip for ip in device_ips if ip in self._leases and self._leases[ip][2] > now}
+
+    def clear_expired(self):
+        now = datetime.utcnow()
+        with self._lock:
+            for device_ip in [ip for ip, lease in self._leases.items() if lease[2] <= now]:
+                del self._leases[device_ip]
+
+
+class DatabaseLeaseBackend:
+    """基于 device_leases 表的租约：主键冲突即被占用，过期租约通过条件更新接管"""
+
+    def __init__(self, app):
+        self.app = app
+
+    def acquire(self, device_ip: str, test_id: str, fingerprint: str, ttl: float) -> bool:
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=ttl)
+        with self.app.app_context():
+            try:
+                db.session.add(DeviceLease(
+                    device_ip=device_ip,
+                    test_id=test_id,
+                    fingerprint=fingerprint,
+                    acquired_at=now,
+                    expires_at=expires_at
+                ))
+                db.session.commit()
+                return True
+            except IntegrityError:
+                db.session.rollback()
+
+            taken = DeviceLease.query.filter(
+                DeviceLease.device_ip == device_ip,
+                DeviceLease.expires_at <= now
+            ).update({
+                'test_id': test_id,
+                'fingerprint': fingerprint,
+                'acquired_at': now,
+                'expires_at': expires_at
+            })
+            db.session.commit()
+            return taken == 1
+
+    def renew(self, device_ip: str, test_id: str, ttl: float):
+        with self.app.app_context():
+            DeviceLease.query.filter_by(device_ip=device_ip, test_id=test_id)\
+                .update({'expires_at': datetime.utcnow() + timedelta(seconds=ttl)})
+            db.session.commit()
+
+    def release(self, device_ip: str, test_id: str):
+        with self.app.app_context():
+            DeviceLease.query.filter_by(device_ip=device_ip, test_id=test_id).delete()
+            db.session.commit()
+
+    def holder(self, device_ip: str) -> Optional[Tuple[str, str]]:
+        with self.app.app_context():
+            lease = DeviceLease.query.filter(
+                DeviceLease.device_ip == device_ip,
+                DeviceLease.expires_at > datetime.utcnow()
+            ).first()
+            return (lease.test_id, lease.fingerprint) if lease else None
+
+    def leased(self, device_ips: List[str]) -> Set[str]:
+        if not device_ips:
+            return set()
+        with self.app.app_context():
+            return set(db.session.scalars(
+                db.select(DeviceLease.device_ip).where(
+                    DeviceLease.device_ip.in_(device_ips),
+                    DeviceLease.expires_at > datetime.utcnow()
+                )
+            ))
+
+    def clear_expired(self):
+        with self.app.app_context():
+            DeviceLease.query.filter(DeviceLease.expires_at <= datetime.utcnow()).delete()
+            db.session.commit()
+
+
+class _Request:
+    """排队中的请求；test_id 为 None 时任务记录仍在创建中（created 在创建结束后置位）"""
+    __slots__ = ('test_id', 'fingerprint', 'start', 'created')
+
+    def __init__(self, test_id: Optional[str], fingerprint: str, start: Optional[Callable[[], None]] = None):
+        self.test_id = test_id
+        self.fingerprint = fingerprint
+        self.start = start
+        self.created = threading.Event()
+
+
+class DeviceLeaseRegistry:
+    """设备租约与排队（Flask扩展风格，通过 init_app 按配置选择后端）"""
+
+    def __init__(self):
+        self.backend = MemoryLeaseBackend()
+        self.ttl = 600
+        self.poll_interval = 1.0
+        self._key_secret = b''
+        self._running = {}  # device_ip -> 本进程持有租约的请求
+        self._queues = defaultdict(deque)  # device_ip -> 本进程排队中的请求
+        self._acquiring = set()  # 正在（锁外）为队首请求获取租约的设备
+        self._watchers = defaultdict(set)  # test_id -> 关联到该测试的其他用户
+        self._lock = threading.RLock()
+        self._poller = None
+
+    def init_app(self, app):
+        self.ttl = app.config.get('DEVICE_LEASE_TTL', 600)
+        self.poll_interval = app.config.get('DEVICE_LEASE_POLL_INTERVAL', 1.0)
+        # 多进程共用 SECRET_KEY，相同请求在各进程中得到相同的指纹
+        self._key_secret = app.config['SECRET_KEY'].encode('utf-8')
+        if app.config.get('DEVICE_LEASE_BACKEND', 'memory') == 'database':
+            self.backend = DatabaseLeaseBackend(app)
+        else:
+            self.backend = MemoryLeaseBackend()
+        if self._poller is None:
+            # 租约可能由其他进程持有或到期失效，定期尝试让队首请求获取租约
+            self._poller = threading.Thread(target=self._poll, name='device-lease-poller', daemon=True)
+            self._poller.start()
+
+    def fingerprint(self, device_ip: str, product_name: str, version: str,
+                    username: str, password: str) -> str:
+        """相同请求的指纹（HMAC，不保存可离线比对的凭证摘要）"""
+        payload = '\0'.join([device_ip, product_name, version, username, password])
+        return hmac.new(self._key_secret, payload.encode('utf-8'), hashlib.sha256).hexdigest()
+
+    # ==================== 请求与释放 ====================
+
+    def request(
+        self,
+        device_ip: str,
+        fingerprint: str,
+        create: Callable[[], str],
+        start: Callable[[str], None]
+    ) -> Dict[str, Any]:
+        """
+        为设备上的一次授权测试申请租约
+
+        Args:
+            create: 需要新建测试时调用，返回新的 test_id
+            start: 获得租约时调用（参数为 test_id），负责开始执行
+
+        Returns:
+            {"test_id", "state": attached / running / queued, "queue_position"}
+        """
+        device_ip = device_ip.strip()
+        while True:
+            with self._lock:
+                existing = self._find_identical(device_ip, fingerprint)
+                if existing is None:
+                    # 先占住队列中的位置，相同请求在任务记录创建期间关联到这里
+                    request = _Request(None, fingerprint)
+                    self._queues[device_ip].append(request)
+                    break
+                if existing.test_id is not None:
+                    return {"test_id": existing.test_id, "state": "attached",
+                            "queue_position": self.position(existing.test_id)}
+            # 相同请求的任务记录正在另一线程中创建，等待后重新查找
+            existing.created.wait()
+
+        try:
+            # 其他进程正在执行的相同测试
+            holder = self.backend.holder(device_ip)
+            test_id = None if holder is not None and holder[1] == fingerprint else create()
+        except Exception:
+            self._withdraw(device_ip, request)
+            raise
+        if test_id is None:
+            self._withdraw(device_ip, request)
+            return {"test_id": holder[0], "state": "attached", "queue_position": None}
+
+        with self._lock:
+            request.test_id = test_id
+            request.start = lambda: start(test_id)
+        request.created.set()
+
+        self._promote(device_ip)
+        with self._lock:
+            position = self.position(test_id)
+            running = self._running.get(device_ip) is request
+        return {"test_id": test_id, "state": "running" if running else "queued", "queue_position": position}
+
+    def cancel(self, device_ip: str, test_id: str) -> bool:
+        """
+        撤回仍在排队的请求（等待租约超时时调用）
+
+        Returns:
+            False 表示请求已获得租约、即将开始执行（调用方应继续等待）；其他情况返回 True
+        """
+        device_ip = device_ip.strip()
+        with self._lock:
+            running = self._running.get(device_ip)
+            if running is not None and running.test_id == test_id:
+                return False
+            queue = self._queues.get(device_ip)
+            for request in list(queue or ()):
+                if request.test_id == test_id:
+                    queue.remove(request)
+                    if not queue:
+                        del self._queues[device_ip]
+            self._watchers.pop(test_id, None)
+        self._promote(device_ip)
+        return True
+
+    def watch(self, test_id: str, user_id: int):
+        """关联到已有测试的用户，同样接收进度推送"""
+        with self._lock:
+            self._watchers[test_id].add(user_id)
+
+    def watchers(self, test_id: str) -> List[int]:
+        with self._lock:
+            return list(self._watchers.get(test_id, ()))
+
+    def renew(self, device_ip: str, test_id: str):
+        self.backend.renew(device_ip.strip(), test_id, self.ttl)
+
+    def release(self, device_ip: str, test_id: str) -> List[Tuple[str, int]]:
+        """
+        测试结束后释放租约并启动该设备的下一个请求
+
+        Returns:
+            该设备仍在排队的 [(test_id, 新的排队位置)]
+        """
+        device_ip = device_ip.strip()
+        self.backend.release(device_ip, test_id)
+        with self._lock:
+            if self._running.get(device_ip) and self._running[device_ip].test_id == test_id:
+                del self._running[device_ip]
+            self._watchers.pop(test_id, None)
+        self._promote(device_ip)
+        return self.queued(device_ip)
+
+    def position(self, test_id: str) -> Optional[int]:
+        """排队位置（从1开始），未在排队时返回 None"""
+        with self._lock:
+            for queue in self._queues.values():
+                for index, request in enumerate(queue):
+                    if request.test_id == test_id:
+                        return index + 1
+        return None
+
+    def queued(self, device_ip: str) -> List[Tuple[str, int]]:
+        with self._lock:
+            return [(request.test_id, index + 1) for index, request in enumerate(self._queues.get(device_ip, ()))
+                    if request.test_id is not None]
+
+    def holder(self, device_ip: str) -> Optional[Tuple[str, str]]:
+        """设备当前的有效租约 (test_id, fingerprint)，可能由其他进程持有"""
+        return self.backend.holder(device_ip.strip())
+
+    def leased(self, device_ips: List[str]) -> Set[str]:
+        """其中当前有有效租约的设备（一次查询，供批量调度跳过被占用的设备）"""
+        return self.backend.leased([ip.strip() for ip in device_ips])
+
+    @property
+    def shared(self) -> bool:
+        """租约是否在多个进程间共享（database 后端）"""
+        return isinstance(self.backend, DatabaseLeaseBackend)
+
+    def clear_expired(self):
+        """清除已过期的租约（其他进程仍持有的有效租约保留）"""
+        self.backend.clear_expired()
+
+    # ==================== 内部实现 ====================
+
+    def _find_identical(self, device_ip: str, fingerprint: str) -> Optional[_Request]:
+        """本进程中执行或排队的相同请求（需持有锁，不访问后端）"""
+        running = self._running.get(device_ip)
+        if running is not None and running.fingerprint == fingerprint:
+            return running
+        for request in self._queues.get(device_ip, ()):
+            if request.fingerprint == fingerprint:
+                return request
+        return None
+
+    def _withdraw(self, device_ip: str, request: _Request):
+        """撤回未创建任务的占位请求，等待它的相同请求重新查找"""
+        with self._lock:
+            queue = self._queues.get(device_ip)
+            if queue is not None and request in queue:
+                queue.remove(request)
+                if not queue:
+                    del self._queues[device_ip]
+        request.created.set()
+        self._promote(device_ip)
+
+    def _promote(self, device_ip: str):
+        """队首请求获取租约后开始执行（获取租约在锁外进行，同一设备同时只有一个线程在获取）"""
+        with self._lock:
+            queue = self._queues.get(device_ip)
+            if not queue or device_ip in self._running or device_ip in self._acquiring:
+                return
+            head = queue[0]
+            if head.test_id is None:
+                return
+            self._acquiring.add(device_ip)
+
+        try:
+            acquired = self.backend.acquire(device_ip, head.test_id, head.fingerprint, self.ttl)
+        finally:
+            with self._lock:
+                self._acquiring.discard(device_ip)
+        if not acquired:
+            return
+
+        with self._lock:
+            # 获取期间只会在队尾追加请求，队首仍是 head
+            queue = self._queues[device_ip]
+            queue.popleft()
+            if not queue:
+                del self._queues[device_ip]
+            self._running[device_ip] = head
+        head.start()
+
+    def _poll(self):
+        event = threading.Event()
+        while not event.wait(self.poll_interval):
+            with self._lock:
+                devices = [ip for ip in self._queues if ip not in self._running and ip not in self._acquiring]
+            for device_ip in devices:
+                try:
+                    self._promote(device_ip)
+                except Exception as e:
+                    print(f"⚠️ 设备租约获取失败 {device_ip}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "running": len(self._running),
+                "queued": sum(len(queue) for queue in self._queues.values())
+            }
+
+
+# 全局设备租约表，在 JobManager.init_app 中初始化
+device_lease = DeviceLeaseRegistry()
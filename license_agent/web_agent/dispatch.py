@@ -0,0 +1,98 @@
+"""
+智能体任务分发 - 决定对话轮次在哪里执行
+
+- LocalAgentDispatcher: 在当前Web进程的线程池中执行（单进程部署），并发占满时按用户公平排队
+- QueueAgentDispatcher: 推送到Redis列表，由独立的 agent_worker.py 进程消费（多进程部署）
+"""
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from web_agent.admission import create_fair_queue
+
+
+class LocalAgentDispatcher:
+    """在本进程线程池中执行对话轮次，不阻塞Socket.IO事件处理线程"""
+
+    def __init__(self, runner: Callable[[Dict[str, Any]], None], config, notify=None):
+        """
+        Args:
+            runner: 执行单个对话任务的函数
+            config: 应用配置（AGENT_MAX_WORKERS 为同时执行的对话轮次上限，ADMISSION_* 为排队参数）
+            notify: 推送排队超时等事件的回调 (task, event, data)
+        """
+        self.executor = ThreadPoolExecutor(
+            max_workers=config.get('AGENT_MAX_WORKERS', 32),
+            thread_name_prefix='agent-turn'
+        )
+        self.queue = create_fair_queue(config, runner, self.executor, notify=notify)
+
+    def check(self, user_id: int):
+        """
+        保存用户消息前检查排队容量
+
+        Raises:
+            AdmissionRejected: 排队已满
+        """
+        self.queue.check(user_id)
+
+    def submit(self, task: Dict[str, Any]) -> Optional[int]:
+        """
+        Returns:
+            排队位置，立即执行时为 None
+
+        Raises:
+            AdmissionRejected: 排队已满
+        """
+        return self.queue.submit(task)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class QueueAgentDispatcher:
+    """把对话任务推送到Redis列表，由任意一个 agent_worker 进程取出执行"""
+
+    def __init__(self, url: str, queue_name: str):
+        """
+        Args:
+            url: Redis连接地址（通常与 SOCKETIO_MESSAGE_QUEUE 相同）
+            queue_name: 任务列表的键名
+        """
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("AGENT_DISPATCH=queue 需要安装 redis 包") from e
+
+        self.redis = redis.Redis.from_url(url)
+        self.queue_name = queue_name
+
+    def check(self, user_id: int):
+        """排队容量由 agent_worker 进程判断，拒绝时由其撤回已保存的消息"""
+
+    def submit(self, task: Dict[str, Any]) -> Optional[int]:
+        """排队与公平调度由 agent_worker 进程负责"""
+        self.redis.lpush(self.queue_name, json.dumps(task, ensure_ascii=False))
+        return None
+
+    def shutdown(self):
+        self.redis.close()
+
+
+def create_dispatcher(config, runner: Callable[[Dict[str, Any]], None], notify=None):
+    """
+    按配置创建任务分发器
+
+    Args:
+        config: 应用配置（app.config）
+        runner: 本地执行对话任务的函数（仅 local 模式使用）
+        notify: 本地排队事件的推送回调 (task, event, data)（仅 local 模式使用）
+    """
+    mode = config.get('AGENT_DISPATCH', 'local')
+    if mode == 'local':
+        return LocalAgentDispatcher(runner, config, notify=notify)
+    if mode == 'queue':
+        if not config.get('SOCKETIO_MESSAGE_QUEUE'):
+            raise RuntimeError("AGENT_DISPATCH=queue 需要同时配置 SOCKETIO_MESSAGE_QUEUE")
+        return QueueAgentDispatcher(config['SOCKETIO_MESSAGE_QUEUE'], config['AGENT_TASK_QUEUE'])
+    raise ValueError(f"未知的 AGENT_DISPATCH: {mode}")
@@ -0,0 +1,403 @@
+"""
+批量授权测试调度 - 一次提交一组设备（列表或CSV），在全局与按产品的并发上限内执行
+
+- 调度器从待执行队列中挑选所属产品未达上限的设备，避免一个产品占满全部执行槽位
+- 正在执行或已被其他测试占用租约的设备暂不调度，执行槽位不会耗在等待设备租约上；
+  设备空闲后由定期调度补上
+- 超时类失败按指数退避重试，重试次数用完后记为失败
+- 每台设备状态变化时向用户房间推送 fleet_progress 聚合进度，全部完成后推送 fleet_complete 合并报告
+- 并发上限按进程计算；凭证只保存在内存中，不写入数据库
+"""
+import csv
+import io
+import json
+import random
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from web_agent.device_lease import device_lease
+from web_agent.jobs import job_manager, user_room
+from web_agent.models import db, TestBatch
+
+DEVICE_FIELDS = ('device_ip', 'product_name', 'version', 'username', 'password')
+
+# 可重试的失败（网络或超时类），其余失败重试也不会改变结果
+RETRYABLE_ERROR_CODES = ('NETWORK_TIMEOUT', 'TEST_TIMEOUT', 'LEASE_TIMEOUT', 'EXECUTION_ERROR')
+
+
+def parse_devices(devices: Optional[List[Dict[str, Any]]] = None,
+                  csv_text: Optional[str] = None) -> List[Dict[str, str]]:
+    """
+    解析设备清单，合并列表与CSV两种输入并按 (设备IP, 产品, 版本) 去重
+
+    CSV 首行为表头，需包含 device_ip, product_name, version, username, password 列。
+
+    Raises:
+        ValueError: 清单为空或缺少必填字段
+    """
+    rows = list(devices or [])
+    if csv_text:
+        reader = csv.DictReader(io.StringIO(csv_text.strip()))
+        missing = [field for field in DEVICE_FIELDS if field not in (reader.fieldnames or [])]
+        if missing:
+            raise ValueError(f"CSV缺少列: {', '.join(missing)}")
+        rows.extend(reader)
+
+    parsed, seen = [], set()
+    for line, row in enumerate(rows, start=1):
+        device = {field: str(row.get(field) or '').strip() for field in DEVICE_FIELDS}
+        missing = [field for field in DEVICE_FIELDS if not device[field]]
+        if missing:
+            raise ValueError(f"第{line}台设备缺少字段: {', '.join(missing)}")
+        key = (device['device_ip'], device['product_name'], device['version'])
+        if key in seen:
+            continue
+        seen.add(key)
+        parsed.append(device)
+
+    if not parsed:
+        raise ValueError("设备清单为空")
+    return parsed
+
+
+class _Batch:
+    """进行中的批量测试（仅存在于执行它的进程内存中）"""
+
+    def __init__(self, batch_id: str, user_id: int, devices: List[Dict[str, str]], timeout: int):
+        self.batch_id = batch_id
+        self.user_id = user_id
+        self.timeout = timeout
+        self.credentials = [(d['username'], d['password']) for d in devices]
+        self.items = [
+            {
+                'index': index,
+                'device_ip': d['device_ip'],
+                'product_name': d['product_name'],
+                'version': d['version'],
+                'status': 'queued',  # queued / running / retrying / success / failed
+                'attempts': 0,
+                'test_id': None,
+                'error_code': None,
+                'message': None
+            }
+            for index, d in enumerate(devices)
+        ]
+        self.started_at = time.monotonic()
+        self.persisted_at = 0.0
+
+    def counts(self) -> Counter:
+        return Counter(item['status'] for item in self.items)
+
+    def progress(self) -> Dict[str, Any]:
+        counts = self.counts()
+        return {
+            'batch_id': self.batch_id,
+            'total': len(self.items),
+            'completed': counts['success'] + counts['failed'],
+            'succeeded': counts['success'],
+            'failed': counts['failed'],
+            'running': counts['running'],
+            'queued': counts['queued'] + counts['retrying']
+        }
+
+    def report(self) -> Dict[str, Any]:
+        """合并报告：总体结果、产品×版本矩阵与失败明细"""
+        matrix = {}
+        for item in self.items:
+            cell = matrix.setdefault((item['product_name'], item['version']), Counter())
+            cell['total'] += 1
+            cell['succeeded' if item['status'] == 'success' else 'failed'] += 1
+
+        counts = self.counts()
+        return {
+            'batch_id': self.batch_id,
+            'total': len(self.items),
+            'succeeded': counts['success'],
+            'failed': counts['failed'],
+            'duration': round(time.monotonic() - self.started_at, 1),
+            'matrix': [
+                {'product_name': product, 'version': version,
+                 'total': cell['total'], 'succeeded': cell['succeeded'], 'failed': cell['failed']}
+                for (product, version), cell in sorted(matrix.items())
+            ],
+            'failures': [
+                {key: item[key] for key in
+                 ('device_ip', 'product_name', 'version', 'test_id', 'error_code', 'message', 'attempts')}
+                for item in self.items if item['status'] == 'failed'
+            ]
+        }
+
+
+class FleetScheduler:
+    """批量授权测试调度器（Flask扩展风格，通过 init_app 绑定应用）"""
+
+    def __init__(self, app=None, socketio=None):
+        self.app = None
+        self.socketio = None
+        self.executor = None
+        self._batches = {}  # batch_id -> _Batch
+        self._pending = deque()  # (batch_id, index)
+        self._running = 0
+        self._running_by_product = Counter()
+        self._running_devices = set()
+        self._lock = threading.Lock()
+        self._poller = None
+        if app is not None:
+            self.init_app(app, socketio)
+
+    def init_app(self, app, socketio):
+        """绑定Flask应用与SocketIO实例，并创建执行线程池"""
+        self.app = app
+        self.socketio = socketio
+        self.max_concurrency = app.config['FLEET_MAX_CONCURRENCY']
+        self.per_product_concurrency = app.config['FLEET_PER_PRODUCT_CONCURRENCY']
+        self.max_retries = app.config['FLEET_MAX_RETRIES']
+        self.retry_backoff = app.config['FLEET_RETRY_BACKOFF']
+        self.max_devices = app.config['FLEET_MAX_DEVICES']
+        self.persist_interval = app.config['FLEET_PERSIST_INTERVAL']
+        self.dispatch_interval = app.config['FLEET_DISPATCH_INTERVAL']
+        self.executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='fleet-test')
+        if self._poller is None:
+            # 被其他测试占用的设备释放租约时不会通知调度器，定期重新调度
+            self._poller = threading.Thread(target=self._poll, name='fleet-dispatch', daemon=True)
+            self._poller.start()
+
+    # ==================== 提交与查询 ====================
+
+    def submit(self, user_id: int, devices: List[Dict[str, str]], timeout: int = 300) -> Dict[str, Any]:
+        """
+        提交批量测试，立即返回批次信息
+
+        Raises:
+            ValueError: 设备数量超过上限
+        """
+        if self.app is None:
+            raise RuntimeError("批量测试调度器未初始化")
+        if len(devices) > self.max_devices:
+            raise ValueError(f"单批最多 {self.max_devices} 台设备，当前 {len(devices)} 台")
+
+        batch_id = f"BATCH-{datetime.now().strftime('%Y%m%d')}-{uuid.uuid4().hex[:8].upper()}"
+        batch = _Batch(batch_id, user_id, devices, timeout)
+
+        with self.app.app_context():
+            record = TestBatch(
+                batch_id=batch_id,
+                user_id=user_id,
+                status='running',
+                total=len(devices),
+                items=json.dumps(batch.items, ensure_ascii=False)
+            )
+            db.session.add(record)
+            db.session.commit()
+            batch_dict = record.to_dict(include_items=False)
+
+        with self._lock:
+            self._batches[batch_id] = batch
+            self._pending.extend((batch_id, index) for index in range(len(devices)))
+        self._schedule()
+
+        self._emit('fleet_progress', batch)
+        return batch_dict
+
+    def get(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        """查询批次状态（本进程执行中的批次返回实时进度）"""
+        with self.app.app_context():
+            record = TestBatch.query.filter_by(batch_id=batch_id).first()
+            if not record:
+                return None
+            batch_dict = record.to_dict()
+
+        with self._lock:
+            batch = self._batches.get(batch_id)
+            if batch is not None:
+                batch_dict.update(batch.progress())
+                batch_dict['items'] = [dict(item) for item in batch.items]
+        return batch_dict
+
+    def recover_interrupted(self):
+        """服务重启后，将未完成的批次标记为中断（需在应用上下文中调用）"""
+        interrupted = TestBatch.query.filter_by(status='running').all()
+        for record in interrupted:
+            record.status = 'interrupted'
+            record.finished_at = datetime.utcnow()
+        if interrupted:
+            db.session.commit()
+
+    # ==================== 调度 ====================
+
+    def _schedule(self):
+        """查询待执行设备的租约（不持有锁，database 后端为一次查询）后调度"""
+        with self._lock:
+            if not self._pending or self._running >= self.max_concurrency:
+                return
+            device_ips = list({self._batches[batch_id].items[index]['device_ip']
+                               for batch_id, index in self._pending} - self._running_devices)
+        leased = device_lease.leased(device_ips)
+        with self._lock:
+            self._dispatch(leased)
+
+    def _dispatch(self, leased: set):
+        """
+        按先进先出挑选可执行的设备（需持有锁）
+
+        全局与所属产品均未达到并发上限，且设备没有在本调度器中执行、没有被其他测试占用租约。
+        同一设备的多项测试依次执行，等待租约的测试不占用执行槽位。
+        """
+        skipped = deque()
+        while self._pending and self._running < self.max_concurrency:
+            batch_id, index = self._pending.popleft()
+            item = self._batches[batch_id].items[index]
+            product, device_ip = item['product_name'], item['device_ip']
+            if (self._running_by_product[product] >= self.per_product_concurrency
+                    or device_ip in self._running_devices or device_ip in leased):
+                skipped.append((batch_id, index))
+                continue
+            self._running += 1
+            self._running_by_product[product] += 1
+            self._running_devices.add(device_ip)
+            self.executor.submit(self._execute, batch_id, index)
+        skipped.extend(self._pending)
+        self._pending = skipped
+
+    def _requeue(self, batch_id: str, index: int):
+        with self._lock:
+            self._pending.append((batch_id, index))
+        self._schedule()
+
+    def _poll(self):
+        event = threading.Event()
+        while not event.wait(self.dispatch_interval):
+            try:
+                self._schedule()
+            except Exception as e:
+                print(f"⚠️ 批量测试调度失败: {e}")
+
+    def _execute(self, batch_id: str, index: int):
+        batch = self._batches[batch_id]
+        item = batch.items[index]
+        username, password = batch.credentials[index]
+        with self._lock:
+            item['status'] = 'running'
+            item['attempts'] += 1
+        self._emit('fleet_progress', batch)
+
+        try:
+            job = job_manager.run(
+                user_id=batch.user_id,
+                device_ip=item['device_ip'],
+                username=username,
+                password=password,
+                product_name=item['product_name'],
+                version=item['version'],
+                timeout=batch.timeout,
+                emit_progress=False
+            )
+            result = (job or {}).get('result') or {}
+            error_code = self._error_code(result)
+        except Exception as e:
+            job, result, error_code = None, {"message": f"授权测试执行异常: {e}"}, 'EXECUTION_ERROR'
+
+        retry_delay = None
+        with self._lock:
+            self._running -= 1
+            self._running_by_product[item['product_name']] -= 1
+            self._running_devices.discard(item['device_ip'])
+            item['test_id'] = (job or {}).get('test_id')
+            item['message'] = result.get('message')
+            item['error_code'] = error_code
+            if result.get('success'):
+                item['status'] = 'success'
+            elif error_code in RETRYABLE_ERROR_CODES and item['attempts'] <= self.max_retries:
+                item['status'] = 'retrying'
+                retry_delay = self.retry_backoff * (2 ** (item['attempts'] - 1)) * random.uniform(0.5, 1.0)
+            else:
+                item['status'] = 'failed'
+            finished = all(i['status'] in ('success', 'failed') for i in batch.items)
+        self._schedule()
+
+        if retry_delay is not None:
+            timer = threading.Timer(retry_delay, self._requeue, args=(batch_id, index))
+            timer.daemon = True
+            timer.start()
+
+        if finished:
+            self._finish(batch)
+        else:
+            self._persist(batch)
+            self._emit('fleet_progress', batch)
+
+    @staticmethod
+    def _error_code(result: Dict[str, Any]) -> Optional[str]:
+        """从失败结果中取出失败步骤的错误码"""
+        if result.get('success'):
+            return None
+        for step in (result.get('data') or {}).get('steps', []):
+            if step.get('status') == 'failed':
+                return (step.get('error') or {}).get('code')
+        return 'EXECUTION_ERROR'
+
+    # ==================== 持久化与推送 ====================
+
+    def _persist(self, batch: _Batch, **fields):
+        """保存批次进度（执行中按间隔节流，结束时强制保存）"""
+        now = time.monotonic()
+        if not fields and now - batch.persisted_at < self.persist_interval:
+            return
+        batch.persisted_at = now
+        with self._lock:
+            progress = batch.progress()
+            items = json.dumps(batch.items, ensure_ascii=False)
+        with self.app.app_context():
+            TestBatch.query.filter_by(batch_id=batch.batch_id).update(dict(
+                succeeded=progress['succeeded'],
+                failed=progress['failed'],
+                items=items,
+                **fields
+            ))
+            db.session.commit()
+
+    def _finish(self, batch: _Batch):
+        """保存完成状态与合并报告后才移出内存，查询不会落到数据库中的过期进度上"""
+        report = batch.report()
+        self._persist(
+            batch,
+            status='completed',
+            report=json.dumps(report, ensure_ascii=False),
+            finished_at=datetime.utcnow()
+        )
+        with self._lock:
+            self._batches.pop(batch.batch_id, None)
+        self._emit('fleet_progress', batch)
+        if self.socketio is not None:
+            self.socketio.emit('fleet_complete', report, to=user_room(batch.user_id))
+
+    def _emit(self, event: str, batch: _Batch):
+        if self.socketio is None:
+            return
+        with self._lock:
+            progress = batch.progress()
+        self.socketio.emit(event, progress, to=user_room(batch.user_id))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "batches": len(self._batches),
+                "pending": len(self._pending),
+                "running": self._running,
+                "running_devices": len(self._running_devices),
+                "running_by_product": {k: v for k, v in self._running_by_product.items() if v}
+            }
+
+    def shutdown(self):
+        """关闭执行线程池"""
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+# 全局批量测试调度器，在 app.py / agent_worker.py 中通过 init_app 初始化
+fleet_scheduler = FleetScheduler()
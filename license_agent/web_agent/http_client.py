@@ -0,0 +1,235 @@
+"""
+LLM后端HTTP客户端 - 进程内共享的连接池（保持长连接、可选HTTP/2）、超时与带抖动的退避重试
+
+所有对 DEEPSEEK_BASE_URL 的请求（对话、摘要）复用同一个 httpx.Client，
+并发会话不再各自建立TLS连接；连接池占用情况通过 client.pool_stats 暴露。
+"""
+import itertools
+import random
+import threading
+import time
+from typing import Any, Dict
+
+import httpx
+
+# 可重试的状态码：限流与网关/服务暂时不可用
+RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+# 可重试的异常：请求尚未发出或连接在收到响应前断开，重发是安全的
+RETRY_EXCEPTIONS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError)
+
+
+class PoolStats:
+    """
+    连接池使用统计（线程安全）
+
+    in_flight 包含正在等待空闲连接的请求，持续高于 max_connections 说明连接池已饱和；
+    saturated_requests 为发起时连接已全部占用、需要排队的请求数。
+    """
+
+    def __init__(self, max_connections: int):
+        self.max_connections = max_connections
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests = 0
+        self.saturated_requests = 0
+        self.retries = 0
+        self.errors = 0
+
+    def acquire(self):
+        with self._lock:
+            self.requests += 1
+            # 已占满所有连接时发起的请求需要排队等待空闲连接
+            if self.in_flight >= self.max_connections:
+                self.saturated_requests += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def record_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def record_error(self):
+        with self._lock:
+            self.errors += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "max_connections": self.max_connections,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "utilization": round(self.in_flight / self.max_connections, 3) if self.max_connections else None,
+                "requests": self.requests,
+                "saturated_requests": self.saturated_requests,
+                "retries": self.retries,
+                "errors": self.errors
+            }
+
+
+class _TrackedStream(httpx.SyncByteStream):
+    """包装响应体：流式响应读取完毕或关闭时才归还连接计数"""
+
+    def __init__(self, stream: httpx.SyncByteStream, on_close):
+        self._stream = stream
+        self._on_close = on_close
+        self._closed = False
+
+    def __iter__(self):
+        yield from self._stream
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._stream.close()
+        finally:
+            self._on_close()
+
+
+class RetryTransport(httpx.BaseTransport):
+    """在连接池传输层之上实现退避重试与占用统计"""
+
+    def __init__(
+        self,
+        transport: httpx.HTTPTransport,
+        stats: PoolStats,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0
+    ):
+        self.transport = transport
+        self.stats = stats
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        for attempt in itertools.count():
+            self.stats.acquire()
+            try:
+                response = self.transport.handle_request(request)
+            except RETRY_EXCEPTIONS:
+                self.stats.release()
+                if attempt >= self.max_retries:
+                    self.stats.record_error()
+                    raise
+                delay = 0.0
+            except Exception:
+                self.stats.release()
+                self.stats.record_error()
+                raise
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                    if response.status_code >= 500:
+                        self.stats.record_error()
+                    return httpx.Response(
+                        status_code=response.status_code,
+                        headers=response.headers,
+                        stream=_TrackedStream(response.stream, self.stats.release),
+                        extensions=response.extensions
+                    )
+                delay = self._retry_after(response)
+                response.close()
+                self.stats.release()
+
+            self.stats.record_retry()
+            self._sleep(attempt, minimum=delay)
+
+    def _sleep(self, attempt: int, minimum: float = 0.0):
+        """全抖动指数退避：在 [0, min(上限, 基数*2^n)] 内随机等待，避免大量会话同时重试"""
+        ceiling = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        time.sleep(max(minimum, random.uniform(0, ceiling)))
+
+    def _retry_after(self, response: httpx.Response) -> float:
+        """解析 Retry-After（秒数），超过退避上限时按上限等待"""
+        try:
+            return min(float(response.headers.get('Retry-After', 0)), self.backoff_max)
+        except ValueError:
+            return 0.0
+
+    def close(self):
+        self.transport.close()
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def create_llm_http_client(
+    max_connections: int = 100,
+    max_keepalive_connections: int = 20,
+    keepalive_expiry: float = 30.0,
+    connect_timeout: float = 5.0,
+    read_timeout: float = 120.0,
+    pool_timeout: float = 10.0,
+    max_retries: int = 3,
+    backoff_base: float = 0.5,
+    backoff_max: float = 8.0,
+    http2: bool = False
+) -> httpx.Client:
+    """
+    创建LLM后端共享的HTTP客户端
+
+    Args:
+        max_connections: 连接池最大连接数（HTTP/2 下为最大连接数，每个连接可多路复用）
+        max_keepalive_connections: 保持空闲的长连接数
+        keepalive_expiry: 空闲连接保留时间（秒）
+        connect_timeout: 建立连接超时（秒）
+        read_timeout: 两次读取之间的超时（秒），流式回复中为token间隔上限
+        pool_timeout: 等待空闲连接的超时（秒）
+        max_retries: 最大重试次数
+        backoff_base: 退避基数（秒）
+        backoff_max: 单次退避上限（秒）
+        http2: 是否启用HTTP/2（需要安装 h2，未安装时回退HTTP/1.1）
+
+    Returns:
+        httpx.Client，其 pool_stats 属性为连接池统计
+    """
+    if http2 and not _http2_available():
+        print("⚠️ 未安装 h2，LLM客户端回退为 HTTP/1.1（pip install httpx[http2]）")
+        http2 = False
+
+    limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_keepalive_connections,
+        keepalive_expiry=keepalive_expiry
+    )
+    timeout = httpx.Timeout(connect=connect_timeout, read=read_timeout, write=read_timeout, pool=pool_timeout)
+    stats = PoolStats(max_connections)
+    transport = RetryTransport(
+        httpx.HTTPTransport(limits=limits, http2=http2),
+        stats,
+        max_retries=max_retries,
+        backoff_base=backoff_base,
+        backoff_max=backoff_max
+    )
+
+    client = httpx.Client(transport=transport, timeout=timeout)
+    client.pool_stats = stats
+    return client
+
+
+def create_llm_http_client_from_config(config) -> httpx.Client:
+    """按应用配置（app.config）创建LLM后端HTTP客户端"""
+    return create_llm_http_client(
+        max_connections=config['LLM_HTTP_MAX_CONNECTIONS'],
+        max_keepalive_connections=config['LLM_HTTP_MAX_KEEPALIVE'],
+        keepalive_expiry=config['LLM_HTTP_KEEPALIVE_EXPIRY'],
+        connect_timeout=config['LLM_CONNECT_TIMEOUT'],
+        read_timeout=config['LLM_READ_TIMEOUT'],
+        pool_timeout=config['LLM_POOL_TIMEOUT'],
+        max_retries=config['LLM_MAX_RETRIES'],
+        backoff_base=config['LLM_RETRY_BACKOFF'],
+        backoff_max=config['LLM_RETRY_MAX_BACKOFF'],
+        http2=config['LLM_HTTP2']
+    )
@@ -0,0 +1,322 @@
+"""
+后台任务引擎 - 在独立线程池中执行授权测试，并通过Socket.IO推送进度
+"""
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from web_agent.auth_test import run_auth_test
+from web_agent.cache import TTLCache
+from web_agent.device_lease import device_lease
+from web_agent.models import db, TestJob
+
+
+def user_room(user_id: int) -> str:
+    """用户专属的Socket.IO房间名"""
+    return f"user_{user_id}"
+
+
+class JobManager:
+    """授权测试任务管理器（Flask扩展风格，通过 init_app 绑定应用）"""
+
+    def __init__(self, app=None, socketio=None):
+        self.app = None
+        self.socketio = None
+        self.executor = None
+        # test_id -> 关联到该测试的其他用户（测试结束、租约释放后仍可查询结果）
+        self._attached_users = TTLCache(max_entries=10000, ttl=86400)
+        if app is not None:
+            self.init_app(app, socketio)
+
+    def init_app(self, app, socketio):
+        """绑定Flask应用与SocketIO实例，并创建工作线程池"""
+        self.app = app
+        self.socketio = socketio
+        device_lease.init_app(app)
+        self.executor = ThreadPoolExecutor(
+            max_workers=app.config.get('JOB_MAX_WORKERS', 8),
+            thread_name_prefix='auth-test'
+        )
+
+    def submit(
+        self,
+        user_id: int,
+        device_ip: str,
+        username: str,
+        password: str,
+        product_name: str,
+        version: str,
+        timeout: int = 300
+    ) -> Dict[str, Any]:
+        """
+        提交授权测试任务，立即返回任务信息
+
+        凭证只保存在内存中随任务传递，不写入数据库。
+        同一设备上已有相同的测试时关联到该测试（attached=True）；
+        设备正在执行其他测试时排队，queue_position 为排队位置。
+        """
+        params = {
+            'device_ip': device_ip,
+            'username': username,
+            'password': password,
+            'product_name': product_name,
+            'version': version,
+            'timeout': timeout
+        }
+        lease = device_lease.request(
+            device_ip,
+            device_lease.fingerprint(device_ip, product_name, version, username, password),
+            create=lambda: self._create(user_id, device_ip, product_name, version)['test_id'],
+            start=lambda test_id: self.executor.submit(self._run, test_id, user_id, params)
+        )
+        return self._lease_result(lease, user_id)
+
+    def run(
+        self,
+        user_id: int,
+        device_ip: str,
+        username: str,
+        password: str,
+        product_name: str,
+        version: str,
+        timeout: int = 300,
+        emit_progress: bool = True
+    ) -> Dict[str, Any]:
+        """
+        在调用方线程中同步执行授权测试，返回完成后的任务信息（供批量调度使用）
+
+        设备被其他测试占用时在调用方线程中等待；关联到相同测试时等待该测试完成并返回其结果。
+        两种等待都最多 timeout 加一个租约时长（持有租约的进程异常退出时不会再释放或结束），
+        超时返回失败结果（等待租约超时的错误码为 LEASE_TIMEOUT，批量测试会重试）。
+
+        Args:
+            emit_progress: 是否推送逐步骤的 test_progress 事件（批量测试改为推送聚合进度）
+        """
+        params = {
+            'device_ip': device_ip,
+            'username': username,
+            'password': password,
+            'product_name': product_name,
+            'version': version,
+            'timeout': timeout
+        }
+        granted = threading.Event()
+        lease = device_lease.request(
+            device_ip,
+            device_lease.fingerprint(device_ip, product_name, version, username, password),
+            create=lambda: self._create(user_id, device_ip, product_name, version, emit_progress)['test_id'],
+            start=lambda test_id: granted.set()
+        )
+        test_id = lease['test_id']
+
+        if lease['state'] == 'attached':
+            deadline = time.monotonic() + timeout + device_lease.ttl
+            while time.monotonic() < deadline:
+                job = self.get(test_id)
+                if job is None or job['status'] in ('success', 'failed'):
+                    return job
+                time.sleep(device_lease.poll_interval)
+            return {
+                **(self.get(test_id) or {'test_id': test_id}),
+                'status': 'failed',
+                'result': {
+                    "success": False,
+                    "test_id": test_id,
+                    "message": "等待关联的授权测试结束超时，执行该测试的进程可能已退出"
+                }
+            }
+
+        # 租约持有进程异常退出或排队请求丢失时不无限等待，超时后撤回请求并以可重试的错误结束
+        if not granted.wait(timeout + device_lease.ttl) and device_lease.cancel(device_ip, test_id):
+            return self._update(
+                test_id,
+                emit_progress,
+                status='failed',
+                result=self._lease_timeout_result(test_id, timeout + device_lease.ttl),
+                finished_at=datetime.utcnow()
+            )
+        granted.wait()
+        return self._run(test_id, user_id, params, emit_progress=emit_progress)
+
+    @staticmethod
+    def _lease_timeout_result(test_id: str, waited: float) -> Dict[str, Any]:
+        """等待设备租约超时的失败结果（与授权测试的失败结果结构相同，错误码为 LEASE_TIMEOUT）"""
+        step = {
+            "step": 0,
+            "name": "等待设备空闲",
+            "status": "failed",
+            "error": {
+                "code": "LEASE_TIMEOUT",
+                "message": f"等待设备空闲超过 {int(waited)} 秒",
+                "suggestion": "设备可能被异常退出的进程占用，租约到期后重试"
+            }
+        }
+        return {
+            "success": False,
+            "test_id": test_id,
+            "data": {"steps": [step]},
+            "message": "等待设备空闲超时，授权测试未执行"
+        }
+
+    def _lease_result(self, lease: Dict[str, Any], user_id: int) -> Dict[str, Any]:
+        """租约申请结果转换为返回给调用方的任务信息"""
+        job_dict = self.get(lease['test_id'])
+        job_dict['attached'] = lease['state'] == 'attached'
+        if job_dict['attached'] and job_dict['user_id'] != user_id:
+            device_lease.watch(lease['test_id'], user_id)
+            users = self._attached_users.get(lease['test_id']) or frozenset()
+            self._attached_users.set(lease['test_id'], users | {user_id})
+        elif lease['state'] == 'queued':
+            self._emit_progress(job_dict)
+        return job_dict
+
+    def _create(self, user_id: int, device_ip: str, product_name: str, version: str,
+                emit_progress: bool = True) -> Dict[str, Any]:
+        """创建排队中的任务记录并推送"""
+        if self.app is None:
+            raise RuntimeError("任务引擎未初始化")
+
+        test_id = f"TEST-{datetime.now().strftime('%Y%m%d')}-{uuid.uuid4().hex[:8].upper()}"
+
+        with self.app.app_context():
+            job = TestJob(
+                test_id=test_id,
+                user_id=user_id,
+                device_ip=device_ip,
+                product_name=product_name,
+                version=version,
+                status='queued'
+            )
+            db.session.add(job)
+            db.session.commit()
+            job_dict = job.to_dict()
+
+        if emit_progress:
+            self._emit_progress(job_dict)
+        return job_dict
+
+    def get(self, test_id: str) -> Optional[Dict[str, Any]]:
+        """查询任务状态（排队中的任务附带排队位置）"""
+        with self.app.app_context():
+            job = TestJob.query.filter_by(test_id=test_id).first()
+            if not job:
+                return None
+            job_dict = job.to_dict()
+
+        job_dict['queue_position'] = device_lease.position(test_id) if job_dict['status'] == 'queued' else None
+        return job_dict
+
+    def can_view(self, job_dict: Dict[str, Any], user_id: int) -> bool:
+        """任务所属用户，或提交相同测试时关联到该任务的用户"""
+        if job_dict['user_id'] == user_id:
+            return True
+        return user_id in (self._attached_users.get(job_dict['test_id']) or ()) \
+            or user_id in device_lease.watchers(job_dict['test_id'])
+
+    def recover_interrupted(self):
+        """
+        服务重启后，将已中断的任务标记为失败并清除过期租约（需在应用上下文中调用）
+
+        执行中的任务以设备租约判断：租约不存在或已过期说明执行进程已退出。
+        排队中的任务只保存在所属进程的内存中：memory 租约（单进程）时全部视为中断；
+        database 租约下只处理设备空闲且排队超过一个租约时长的任务
+        （所属进程存活时，设备空闲后会在轮询间隔内开始执行）。
+        其他进程仍在执行或排队的任务与有效租约保持不变。
+        """
+        stale_before = datetime.utcnow() - timedelta(seconds=device_lease.ttl)
+        interrupted = []
+        for job in TestJob.query.filter(TestJob.status.in_(['queued', 'running'])):
+            holder = device_lease.holder(job.device_ip)
+            if job.status == 'running':
+                alive = holder is not None and holder[0] == job.test_id
+            elif device_lease.shared:
+                alive = holder is not None or job.created_at > stale_before
+            else:
+                alive = False
+            if not alive:
+                interrupted.append(job)
+
+        for job in interrupted:
+            job.status = 'failed'
+            job.finished_at = datetime.utcnow()
+            job.result = json.dumps({
+                "success": False,
+                "test_id": job.test_id,
+                "message": "服务重启，授权测试被中断，请重新执行"
+            }, ensure_ascii=False)
+        if interrupted:
+            db.session.commit()
+        device_lease.clear_expired()
+
+    def _run(self, test_id: str, user_id: int, params: Dict[str, Any],
+             emit_progress: bool = True) -> Optional[Dict[str, Any]]:
+        """在工作线程中执行任务（调用前已持有设备租约），返回完成后的任务信息"""
+        device_ip = params['device_ip']
+        try:
+            self._update(test_id, emit_progress, status='running', started_at=datetime.utcnow())
+
+            def on_step(step, steps):
+                device_lease.renew(device_ip, test_id)
+                self._update(test_id, emit_progress, current_step=step['step'], steps=steps)
+
+            try:
+                result = run_auth_test(test_id=test_id, on_step=on_step, **params)
+            except Exception as e:
+                result = {
+                    "success": False,
+                    "test_id": test_id,
+                    "message": f"授权测试执行异常: {e}"
+                }
+
+            return self._update(
+                test_id,
+                emit_progress,
+                status='success' if result.get('success') else 'failed',
+                result=result,
+                finished_at=datetime.utcnow()
+            )
+        finally:
+            # 释放设备并通知仍在排队的任务新的排队位置
+            for queued_test_id, _ in device_lease.release(device_ip, test_id):
+                job_dict = self.get(queued_test_id)
+                if job_dict and job_dict['status'] == 'queued':
+                    self._emit_progress(job_dict)
+
+    def _update(self, test_id: str, emit_progress: bool = True, **fields) -> Optional[Dict[str, Any]]:
+        """更新任务字段并向任务所属用户推送进度"""
+        with self.app.app_context():
+            job = TestJob.query.filter_by(test_id=test_id).first()
+            if not job:
+                return None
+            for key, value in fields.items():
+                if key in ('steps', 'result'):
+                    value = json.dumps(value, ensure_ascii=False)
+                setattr(job, key, value)
+            db.session.commit()
+            job_dict = job.to_dict()
+
+        if emit_progress:
+            job_dict['queue_position'] = None
+            self._emit_progress(job_dict)
+        return job_dict
+
+    def _emit_progress(self, job_dict: Dict[str, Any]):
+        """推送 test_progress 事件到任务所属用户及关联到该任务的用户房间"""
+        if self.socketio is None:
+            return
+        rooms = [user_room(job_dict['user_id'])]
+        rooms.extend(user_room(user_id) for user_id in device_lease.watchers(job_dict['test_id']))
+        self.socketio.emit('test_progress', job_dict, to=rooms)
+
+    def shutdown(self):
+        """关闭工作线程池"""
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+# 全局任务管理器，在 app.py 中通过 init_app 初始化
+job_manager = JobManager()
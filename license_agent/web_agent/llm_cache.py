@@ -0,0 +1,140 @@
+"""
+LLM响应缓存 - 相同模型、工具定义与（归一化后）相同提示词的调用直接返回缓存的回复
+
+缓存键由模型名、工具schema与归一化消息列表计算：忽略消息ID、工具调用ID，
+统一Unicode形式并折叠空白，使仅有格式差异的重复提问也能命中。
+调用了有副作用工具（如提交授权测试、保存记录）的回复不会被缓存，
+命中缓存只会复用只读决策，副作用始终由实时的模型调用触发。
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+import unicodedata
+import uuid
+from typing import Any, Dict, Iterable, List, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage, message_to_dict, messages_from_dict
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from web_agent.cache import SQLiteCache, TTLCache
+from web_agent.metrics import record_llm_call
+
+_WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+def normalize_text(text: str) -> str:
+    """Unicode NFKC归一化（全角转半角等）并折叠空白"""
+    return _WHITESPACE_PATTERN.sub(' ', unicodedata.normalize('NFKC', text)).strip()
+
+
+def normalize_message(message: BaseMessage) -> Dict[str, Any]:
+    """提取消息中影响模型输出的部分"""
+    content = message.content if isinstance(message.content, str) else json.dumps(message.content, ensure_ascii=False)
+    normalized = {"type": message.type, "content": normalize_text(content)}
+    if isinstance(message, AIMessage) and message.tool_calls:
+        normalized["tool_calls"] = [
+            {"name": call["name"], "args": call.get("args", {})} for call in message.tool_calls
+        ]
+    if isinstance(message, ToolMessage):
+        normalized["name"] = message.name
+    return normalized
+
+
+class LLMResponseCache:
+    """包装LLM调用的响应缓存，统计命中率与节省的调用耗时"""
+
+    def __init__(self, backend, model_name: str, tools: Iterable, side_effect_tools: Iterable[str] = ()):
+        """
+        Args:
+            backend: 缓存后端（TTLCache 或 SQLiteCache）
+            model_name: 模型名称
+            tools: 绑定到模型的工具列表
+            side_effect_tools: 有副作用的工具名，调用这些工具的回复不缓存
+        """
+        self.backend = backend
+        self.model_name = model_name
+        self.side_effect_tools = frozenset(side_effect_tools)
+        schema = json.dumps([convert_to_openai_tool(t) for t in tools], ensure_ascii=False, sort_keys=True)
+        self._tools_digest = hashlib.sha256(schema.encode('utf-8')).hexdigest()
+
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.saved_seconds = 0.0
+
+    def make_key(self, messages: List[BaseMessage]) -> str:
+        payload = json.dumps({
+            "model": self.model_name,
+            "tools": self._tools_digest,
+            "messages": [normalize_message(m) for m in messages]
+        }, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def invoke(self, llm, messages: List[BaseMessage], **kwargs) -> AIMessage:
+        """命中缓存时直接返回回复，否则调用模型并按规则写入缓存"""
+        started = time.perf_counter()
+        key = self.make_key(messages)
+        cached = self._lookup(key)
+        if cached is not None:
+            record_llm_call(cached, time.perf_counter() - started, cached=True)
+            return cached
+
+        started = time.perf_counter()
+        response = llm.invoke(messages, **kwargs)
+        elapsed = time.perf_counter() - started
+        record_llm_call(response, elapsed)
+
+        if self._has_side_effects(response):
+            with self._lock:
+                self.bypassed += 1
+        else:
+            self.backend.set(key, json.dumps({
+                "message": message_to_dict(response),
+                "latency": elapsed
+            }, ensure_ascii=False))
+        return response
+
+    def _lookup(self, key: str) -> Optional[AIMessage]:
+        raw = self.backend.get(key)
+        if raw is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        entry = json.loads(raw)
+        with self._lock:
+            self.hits += 1
+            self.saved_seconds += entry.get("latency", 0.0)
+
+        message = messages_from_dict([entry["message"]])[0]
+        # 重新生成消息ID与工具调用ID，避免与对话记忆中已有的消息冲突
+        tool_calls = [dict(call, id=f"call_{uuid.uuid4().hex[:24]}") for call in message.tool_calls]
+        return message.model_copy(update={"id": f"run-{uuid.uuid4()}", "tool_calls": tool_calls})
+
+    def _has_side_effects(self, response: AIMessage) -> bool:
+        return any(call["name"] in self.side_effect_tools for call in getattr(response, "tool_calls", None) or [])
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.backend),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                "bypassed": self.bypassed,
+                "saved_seconds": round(self.saved_seconds, 3)
+            }
+
+
+def create_llm_cache_backend(config):
+    """按应用配置创建缓存后端，未启用时返回 None"""
+    if not config.get('LLM_CACHE_ENABLED'):
+        return None
+    if config.get('LLM_CACHE_BACKEND') == 'sqlite':
+        return SQLiteCache(config['LLM_CACHE_PATH'], max_entries=config['LLM_CACHE_MAX_ENTRIES'],
+                           ttl=config['LLM_CACHE_TTL'])
+    return TTLCache(max_entries=config['LLM_CACHE_MAX_ENTRIES'], ttl=config['LLM_CACHE_TTL'])
@@ -0,0 +1,184 @@
+"""
+运行指标与链路追踪 - 导出 Prometheus 指标（/metrics），可选输出 OpenTelemetry 风格的 span 日志
+
+指标覆盖：对话轮次耗时与首字延迟、LangGraph 各节点（agent / tools）耗时、每个工具的耗时与调用结果、
+LLM token 用量、handle_message 各阶段（限流、保存、分发、推送）耗时、REST 接口耗时、
+活跃会话数，以及连接池、缓存、持久化队列等组件的运行统计。
+
+span 日志每行一个 JSON（trace_id / span_id / parent_span_id / name / 起止时间 / attributes / status），
+同一轮对话内的节点与工具 span 通过 contextvars 关联到同一个 trace。
+"""
+import contextvars
+import json
+import logging
+import secrets
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, REGISTRY, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+
+# 对话与LLM调用的耗时分布跨度较大（毫秒级缓存命中到分钟级工具调用）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+TOKEN_BUCKETS = (16, 64, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+# ==================== 指标定义 ====================
+
+AGENT_TURN_SECONDS = Histogram(
+    'agent_turn_duration_seconds', '一轮对话的总耗时', ['outcome'], buckets=LATENCY_BUCKETS
+)
+AGENT_TTFT_SECONDS = Histogram(
+    'agent_time_to_first_token_seconds', '从收到消息到推送第一个回复片段的耗时', buckets=LATENCY_BUCKETS
+)
+AGENT_NODE_SECONDS = Histogram(
+    'agent_node_duration_seconds', 'LangGraph节点单次执行耗时', ['node'], buckets=LATENCY_BUCKETS
+)
+AGENT_ERRORS = Counter('agent_errors_total', '对话处理错误数', ['stage'])
+AGENT_TURNS_ACTIVE = Gauge('agent_turns_active', '正在执行的对话轮次数')
+
+LLM_CALL_SECONDS = Histogram(
+    'llm_call_duration_seconds', 'LLM调用耗时（缓存命中时为查缓存耗时）', ['cached'], buckets=LATENCY_BUCKETS
+)
+LLM_TOKENS = Histogram('llm_tokens_per_call', '单次LLM调用的token数', ['type'], buckets=TOKEN_BUCKETS)
+LLM_TOKENS_TOTAL = Counter('llm_tokens_total', 'LLM累计token用量', ['type'])
+
+TOOL_CALL_SECONDS = Histogram(
+    'tool_call_duration_seconds', '工具调用耗时', ['tool'], buckets=LATENCY_BUCKETS
+)
+TOOL_CALLS = Counter('tool_calls_total', '工具调用次数', ['tool', 'status'])
+
+MESSAGE_STAGE_SECONDS = Histogram(
+    'message_stage_duration_seconds', 'handle_message 各阶段耗时', ['stage'], buckets=LATENCY_BUCKETS
+)
+SOCKETIO_EMIT_SECONDS = Histogram(
+    'socketio_emit_duration_seconds', 'Socket.IO事件推送耗时', ['event'], buckets=LATENCY_BUCKETS
+)
+SOCKETIO_SESSIONS_ACTIVE = Gauge('socketio_sessions_active', '当前Socket.IO连接数')
+
+HTTP_REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'REST接口耗时', ['method', 'endpoint', 'status'], buckets=LATENCY_BUCKETS
+)
+
+
+# ==================== span 日志 ====================
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+trace_logger = logging.getLogger('license_agent.trace')
+trace_logger.propagate = False
+
+
+class Span:
+    __slots__ = ('trace_id', 'span_id', 'parent_span_id', 'name', 'attributes', 'status', 'started_at')
+
+    def __init__(self, name: str, parent: Optional['Span'], attributes: Dict[str, Any]):
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_span_id = parent.span_id if parent else None
+        self.name = name
+        self.attributes = attributes
+        self.status = 'OK'
+        self.started_at = time.time()
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    记录一个span：未开启span日志时只维护上下文，开销可忽略
+
+    在线程池中执行的子任务需要通过 contextvars.copy_context().run 提交才能关联到父span。
+    """
+    current = Span(name, _current_span.get(), attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except Exception as e:
+        current.status = 'ERROR'
+        current.attributes['error'] = str(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        if trace_logger.handlers:
+            ended_at = time.time()
+            trace_logger.info(json.dumps({
+                'trace_id': current.trace_id,
+                'span_id': current.span_id,
+                'parent_span_id': current.parent_span_id,
+                'name': current.name,
+                'start_time': current.started_at,
+                'end_time': ended_at,
+                'duration_ms': round((ended_at - current.started_at) * 1000, 3),
+                'attributes': current.attributes,
+                'status': current.status
+            }, ensure_ascii=False, default=str))
+
+
+# ==================== 记录辅助函数 ====================
+
+@contextmanager
+def observe(histogram, **labels):
+    """记录代码块耗时到直方图"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        (histogram.labels(**labels) if labels else histogram).observe(time.perf_counter() - started)
+
+
+def record_llm_call(response, elapsed: float, cached: bool = False):
+    """记录一次LLM调用的耗时与token用量（缓存命中不计token）"""
+    LLM_CALL_SECONDS.labels(cached='true' if cached else 'false').observe(elapsed)
+    usage = getattr(response, 'usage_metadata', None)
+    if cached or not usage:
+        return
+    for token_type, key in (('input', 'input_tokens'), ('output', 'output_tokens')):
+        count = usage.get(key) or 0
+        LLM_TOKENS.labels(type=token_type).observe(count)
+        LLM_TOKENS_TOTAL.labels(type=token_type).inc(count)
+
+
+class ComponentStatsCollector:
+    """把各组件自带的 stats() 统计导出为指标（抓取时读取，不在请求路径上计数）"""
+
+    def __init__(self):
+        self.sources = {}  # 组件名 -> 返回统计字典的函数
+
+    def add(self, name: str, stats: Callable[[], Optional[Dict[str, Any]]]):
+        self.sources[name] = stats
+
+    def collect(self):
+        family = GaugeMetricFamily('component_stat', '组件运行统计（来自各组件的 stats()）',
+                                   labels=['component', 'stat'])
+        for name, stats in list(self.sources.items()):
+            try:
+                values = stats() or {}
+            except Exception:
+                continue
+            for key, value in values.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                family.add_metric([name, key], value)
+        yield family
+
+
+component_stats = ComponentStatsCollector()
+REGISTRY.register(component_stats)
+
+
+def init_tracing(app):
+    """按配置开启span日志（TRACE_SPANS_LOG 为文件路径，'-' 表示标准输出）"""
+    target = app.config.get('TRACE_SPANS_LOG')
+    if not target or trace_logger.handlers:
+        return
+    handler = logging.StreamHandler() if target == '-' else logging.FileHandler(target, encoding='utf-8')
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    trace_logger.addHandler(handler)
+    trace_logger.setLevel(logging.INFO)
+
+
+def render_metrics():
+    """返回 (响应体, Content-Type)"""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
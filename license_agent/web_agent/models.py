@@ -1,14 +1,55 @@
 """
 数据库模型定义
 """
+import json
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.exc import DBAPIError
 from flask_login import UserMixin
-import bcrypt
+
+from web_agent.passwords import password_hasher
+from web_agent import tool_log
 
 db = SQLAlchemy()
 
 
+def init_db(app):
+    """
+    绑定数据库并按后端应用性能配置
+
+    SQLite 在每个新连接上执行 SQLITE_PRAGMAS（journal_mode=WAL 写入数据库文件后持久生效，
+    其余参数只对当前连接有效）；其他后端只使用 SQLALCHEMY_ENGINE_OPTIONS 中的连接池配置。
+    """
+    db.init_app(app)
+    pragmas = app.config.get('SQLITE_PRAGMAS') or {}
+    with app.app_context():
+        engine = db.engine
+        if engine.dialect.name != 'sqlite' or not pragmas:
+            return
+
+        @event.listens_for(engine, 'connect')
+        def apply_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            try:
+                for name, value in pragmas.items():
+                    cursor.execute(f'PRAGMA {name}={value}')
+            finally:
+                cursor.close()
+
+
+def init_schema():
+    """
+    创建缺失的表和索引
+
+    db.create_all() 会跳过已存在的表，已有表上新增的索引需要单独补建。
+    """
+    db.create_all()
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+
+
 class User(UserMixin, db.Model):
     """用户模型"""
     __tablename__ = 'users'
@@ -23,12 +64,16 @@ class User(UserMixin, db.Model):
     conversations = db.relationship('Conversation', backref='user', lazy=True, cascade='all, delete-orphan')
 
     def set_password(self, password):
-        """设置密码（加密）"""
-        self.password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        """设置密码（加密，在密码哈希进程池中计算）"""
+        self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password):
         """验证密码"""
-        return bcrypt.checkpw(password.encode('utf-8'), self.password_hash.encode('utf-8'))
+        return password_hasher.verify(password, self.password_hash)
+
+    def password_needs_rehash(self):
+        """密码哈希的 cost 与当前 BCRYPT_ROUNDS 不同"""
+        return password_hasher.needs_rehash(self.password_hash)
 
     def to_dict(self):
         """转换为字典"""
@@ -43,6 +88,10 @@ class User(UserMixin, db.Model):
 class Conversation(db.Model):
     """对话模型"""
     __tablename__ = 'conversations'
+    __table_args__ = (
+        # 侧边栏按更新时间列出用户的对话
+        db.Index('ix_conversations_user_updated', 'user_id', 'updated_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -53,36 +102,389 @@ class Conversation(db.Model):
     # 关系
     messages = db.relationship('Message', backref='conversation', lazy=True, cascade='all, delete-orphan')
 
-    def to_dict(self):
-        """转换为字典"""
+    def to_dict(self, message_count: int):
+        """
+        转换为字典
+
+        Args:
+            message_count: 消息数，由调用方通过 count_messages 批量统计（列表中逐个对话 COUNT 会产生 N+1 查询）
+        """
         return {
             'id': self.id,
             'user_id': self.user_id,
             'title': self.title,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
-            'message_count': len(self.messages)
+            'message_count': message_count
         }
 
+    @staticmethod
+    def count_messages(conversation_ids):
+        """一次分组查询统计多个对话的消息数，返回 {conversation_id: count}"""
+        if not conversation_ids:
+            return {}
+        rows = db.session.query(Message.conversation_id, db.func.count(Message.id))\
+            .filter(Message.conversation_id.in_(conversation_ids))\
+            .group_by(Message.conversation_id).all()
+        return dict(rows)
+
 
 class Message(db.Model):
     """消息模型"""
     __tablename__ = 'messages'
+    __table_args__ = (
+        # 按时间顺序读取对话消息
+        db.Index('ix_messages_conversation_created', 'conversation_id', 'created_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     conversation_id = db.Column(db.Integer, db.ForeignKey('conversations.id'), nullable=False)
     role = db.Column(db.String(20), nullable=False)  # user / assistant / tool
     content = db.Column(db.Text, nullable=False)
-    tool_calls = db.Column(db.Text)  # JSON格式的工具调用信息
+    tool_calls = db.Column(db.Text)  # 本轮工具调用事件日志（tool_log 编码，可能为压缩格式）
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     def to_dict(self):
-        """转换为字典"""
+        """转换为字典（tool_calls 只包含每个调用的工具名、状态与耗时）"""
         return {
             'id': self.id,
             'conversation_id': self.conversation_id,
             'role': self.role,
             'content': self.content,
-            'tool_calls': self.tool_calls,
+            'tool_calls': tool_log.summarize(self.tool_calls),
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+
+class ToolPayload(db.Model):
+    """工具调用的大结果（从消息的事件日志中拆出，按内容摘要去重，zlib压缩）"""
+    __tablename__ = 'tool_payloads'
+
+    digest = db.Column(db.String(64), primary_key=True)  # 结果内容的 sha256
+    data = db.Column(db.LargeBinary, nullable=False)
+    size = db.Column(db.Integer, nullable=False)  # 压缩前的字节数
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class TestJob(db.Model):
+    """授权测试后台任务模型"""
+    __tablename__ = 'test_jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    test_id = db.Column(db.String(64), unique=True, nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    device_ip = db.Column(db.String(100), nullable=False)
+    product_name = db.Column(db.String(100))
+    version = db.Column(db.String(50))
+    status = db.Column(db.String(20), default='queued')  # queued / running / success / failed
+    current_step = db.Column(db.Integer, default=0)
+    steps = db.Column(db.Text)  # JSON格式的步骤状态
+    result = db.Column(db.Text)  # JSON格式的最终结果
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        """转换为字典"""
+        return {
+            'test_id': self.test_id,
+            'user_id': self.user_id,
+            'device_ip': self.device_ip,
+            'product_name': self.product_name,
+            'version': self.version,
+            'status': self.status,
+            'current_step': self.current_step,
+            'steps': json.loads(self.steps) if self.steps else [],
+            'result': json.loads(self.result) if self.result else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
+class DeviceLease(db.Model):
+    """设备租约：同一设备同时只允许一个授权测试执行（多进程部署时的共享锁）"""
+    __tablename__ = 'device_leases'
+
+    device_ip = db.Column(db.String(100), primary_key=True)
+    test_id = db.Column(db.String(64), nullable=False)
+    fingerprint = db.Column(db.String(64), nullable=False)  # 产品、版本与凭证的HMAC，用于识别相同请求
+    acquired_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)  # 执行进程异常退出时租约到期自动失效
+
+
+class TestBatch(db.Model):
+    """批量授权测试（一次提交多台设备），items 中只保存各设备的执行情况，不保存凭证"""
+    __tablename__ = 'test_batches'
+
+    id = db.Column(db.Integer, primary_key=True)
+    batch_id = db.Column(db.String(64), unique=True, nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    status = db.Column(db.String(20), default='running')  # running / completed / interrupted
+    total = db.Column(db.Integer, nullable=False, default=0)
+    succeeded = db.Column(db.Integer, nullable=False, default=0)
+    failed = db.Column(db.Integer, nullable=False, default=0)
+    items = db.Column(db.Text)  # JSON格式的各设备执行情况
+    report = db.Column(db.Text)  # JSON格式的合并报告（全部完成后生成）
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+    def to_dict(self, include_items=True):
+        """转换为字典"""
+        data = {
+            'batch_id': self.batch_id,
+            'user_id': self.user_id,
+            'status': self.status,
+            'total': self.total,
+            'succeeded': self.succeeded,
+            'failed': self.failed,
+            'report': json.loads(self.report) if self.report else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+        if include_items:
+            data['items'] = json.loads(self.items) if self.items else []
+        return data
+
+
+class TestRecord(db.Model):
+    """授权测试验证记录（测试完成后由 save_test_record 归档，供历史查询）"""
+    __tablename__ = 'test_records'
+    __table_args__ = (
+        # 历史查询的筛选条件都带时间倒序，复合索引末列为 created_at 以支持键集分页
+        db.Index('ix_test_records_product_version_created', 'product_name', 'version', 'created_at'),
+        # 只按产品筛选时避免对该产品全部记录排序
+        db.Index('ix_test_records_product_created', 'product_name', 'created_at'),
+        db.Index('ix_test_records_operator_created', 'operator', 'created_at'),
+        db.Index('ix_test_records_status_created', 'status', 'created_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    record_id = db.Column(db.String(64), unique=True, nullable=False)
+    test_id = db.Column(db.String(64), unique=True, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    product_name = db.Column(db.String(100), nullable=False)
+    version = db.Column(db.String(50), nullable=False)
+    device_ip = db.Column(db.String(100))
+    operator = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), nullable=False)  # success / failed
+    message = db.Column(db.String(255))
+    total_duration = db.Column(db.Float)
+    report_url = db.Column(db.String(255))
+    tags = db.Column(db.Text)  # JSON格式的标签列表
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # 关系
+    steps = db.relationship('TestRecordStep', backref='record', lazy=True, cascade='all, delete-orphan',
+                            order_by='TestRecordStep.step')
+
+    def to_dict(self, include_steps=False):
+        """转换为字典（列表查询不加载步骤明细）"""
+        data = {
+            'record_id': self.record_id,
+            'test_id': self.test_id,
+            'product_name': self.product_name,
+            'version': self.version,
+            'device_ip': self.device_ip,
+            'operator': self.operator,
+            'status': self.status,
+            'message': self.message,
+            'total_duration': self.total_duration,
+            'report_url': self.report_url,
+            'tags': json.loads(self.tags) if self.tags else [],
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
+        if include_steps:
+            data['steps'] = [step.to_dict() for step in self.steps]
+        return data
+
+
+class TestRecordStep(db.Model):
+    """测试记录的步骤明细"""
+    __tablename__ = 'test_record_steps'
+
+    id = db.Column(db.Integer, primary_key=True)
+    record_id = db.Column(db.Integer, db.ForeignKey('test_records.id'), nullable=False, index=True)
+    step = db.Column(db.Integer, nullable=False)
+    name = db.Column(db.String(100), nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    duration = db.Column(db.Float)
+    error_code = db.Column(db.String(50))
+    error_message = db.Column(db.String(255))
+
+    def to_dict(self):
+        """转换为字典"""
+        return {
+            'step': self.step,
+            'name': self.name,
+            'status': self.status,
+            'duration': self.duration,
+            'error_code': self.error_code,
+            'error_message': self.error_message
+        }
+
+
+class AgentCheckpoint(db.Model):
+    """LangGraph检查点（对话记忆），thread_id 即 Conversation.id"""
+    __tablename__ = 'agent_checkpoints'
+    __table_args__ = (
+        db.UniqueConstraint('thread_id', 'checkpoint_ns', 'checkpoint_id', name='uq_agent_checkpoint'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    thread_id = db.Column(db.String(64), nullable=False)
+    checkpoint_ns = db.Column(db.String(255), nullable=False, default='')
+    checkpoint_id = db.Column(db.String(64), nullable=False)
+    parent_checkpoint_id = db.Column(db.String(64))
+    checkpoint_type = db.Column(db.String(32), nullable=False)
+    checkpoint = db.Column(db.LargeBinary, nullable=False)  # 序列化后的检查点（通道值另存于 agent_checkpoint_blobs）
+    checkpoint_metadata = db.Column(db.Text)  # JSON格式的检查点元数据
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class AgentCheckpointBlob(db.Model):
+    """检查点的通道值，按 (通道, 版本) 保存：未变化的通道在多个检查点间共用，不重复保存"""
+    __tablename__ = 'agent_checkpoint_blobs'
+    __table_args__ = (
+        db.UniqueConstraint('thread_id', 'checkpoint_ns', 'channel', 'version', name='uq_agent_checkpoint_blob'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    thread_id = db.Column(db.String(64), nullable=False)
+    checkpoint_ns = db.Column(db.String(255), nullable=False, default='')
+    channel = db.Column(db.String(255), nullable=False)
+    version = db.Column(db.String(64), nullable=False)
+    value_type = db.Column(db.String(32), nullable=False)  # empty 表示该版本的通道为空
+    value = db.Column(db.LargeBinary)
+
+
+class AgentCheckpointWrite(db.Model):
+    """LangGraph检查点的待应用写入（节点中间结果）"""
+    __tablename__ = 'agent_checkpoint_writes'
+    __table_args__ = (
+        db.UniqueConstraint('thread_id', 'checkpoint_ns', 'checkpoint_id', 'task_id', 'idx',
+                            name='uq_agent_checkpoint_write'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    thread_id = db.Column(db.String(64), nullable=False)
+    checkpoint_ns = db.Column(db.String(255), nullable=False, default='')
+    checkpoint_id = db.Column(db.String(64), nullable=False)
+    task_id = db.Column(db.String(64), nullable=False)
+    task_path = db.Column(db.String(255), nullable=False, default='')
+    idx = db.Column(db.Integer, nullable=False)
+    channel = db.Column(db.String(255), nullable=False)
+    value_type = db.Column(db.String(32), nullable=False)
+    value = db.Column(db.LargeBinary)
+
+
+# ==================== 全文检索索引 ====================
+#
+# SQLite：FTS5 trigram 分词（按3字符切分，不依赖分词词典，中文、IP地址、版本号都可按子串检索）。
+# 消息索引带 owner 列（见 search_owner），消息较多的用户检索时与关键词一起 MATCH，
+# 只遍历本人消息的倒排表，不必先匹配全部用户的消息再过滤。
+# 索引表保存文本副本，由触发器随插入、修改、删除增量维护。
+# PostgreSQL：pg_trgm 的 GIN 索引，ILIKE 子串查询走索引，同样随写入增量维护。
+
+OWNER_MARK = 0xE00A
+OWNER_DIGIT_BASE = 0xE000
+
+
+def search_owner(user_id: int) -> str:
+    """
+    消息索引 owner 列的值：用户ID的各位数字映射为Unicode私用区字符，首尾加分隔符
+
+    trigram 的倒排表按词元共享，不区分列；若直接写入数字，owner 会与正文中IP、编号的数字片段
+    共用同一批倒排表。私用区字符不会出现在正文中，首尾分隔符保证用户 12 不会匹配到用户 123。
+    """
+    return chr(OWNER_MARK) + ''.join(chr(OWNER_DIGIT_BASE + int(d)) for d in str(user_id)) + chr(OWNER_MARK)
+
+
+def _owner_sql(column: str) -> str:
+    """search_owner 的 SQL 写法（用于触发器）"""
+    expr = f"CAST({column} AS TEXT)"
+    for digit in range(10):
+        expr = f"replace({expr}, '{digit}', char({OWNER_DIGIT_BASE + digit}))"
+    return f"char({OWNER_MARK}) || {expr} || char({OWNER_MARK})"
+
+
+SQLITE_SEARCH_DDL = [
+    """CREATE VIRTUAL TABLE messages_fts USING fts5(content, owner, tokenize='trigram')""",
+    f"""CREATE TRIGGER messages_fts_insert AFTER INSERT ON messages WHEN new.content <> '' BEGIN
+        INSERT INTO messages_fts(rowid, content, owner)
+        SELECT new.id, new.content, {_owner_sql('user_id')} FROM conversations WHERE id = new.conversation_id;
+    END""",
+    f"""CREATE TRIGGER messages_fts_update AFTER UPDATE OF content ON messages BEGIN
+        DELETE FROM messages_fts WHERE rowid = old.id;
+        INSERT INTO messages_fts(rowid, content, owner)
+        SELECT new.id, new.content, {_owner_sql('user_id')} FROM conversations
+        WHERE id = new.conversation_id AND new.content <> '';
+    END""",
+    """CREATE TRIGGER messages_fts_delete AFTER DELETE ON messages BEGIN
+        DELETE FROM messages_fts WHERE rowid = old.id;
+    END""",
+    f"""INSERT INTO messages_fts(rowid, content, owner)
+    SELECT m.id, m.content, {_owner_sql('c.user_id')} FROM messages m
+    JOIN conversations c ON c.id = m.conversation_id WHERE m.content <> ''""",
+
+    """CREATE VIRTUAL TABLE test_records_fts USING fts5(
+        record_id, test_id, product_name, version, device_ip, operator, message, tags, tokenize='trigram')""",
+    """CREATE TRIGGER test_records_fts_insert AFTER INSERT ON test_records BEGIN
+        INSERT INTO test_records_fts(rowid, record_id, test_id, product_name, version, device_ip, operator, message, tags)
+        VALUES (new.id, new.record_id, new.test_id, new.product_name, new.version, new.device_ip,
+                new.operator, new.message, new.tags);
+    END""",
+    """CREATE TRIGGER test_records_fts_update AFTER UPDATE ON test_records BEGIN
+        DELETE FROM test_records_fts WHERE rowid = old.id;
+        INSERT INTO test_records_fts(rowid, record_id, test_id, product_name, version, device_ip, operator, message, tags)
+        VALUES (new.id, new.record_id, new.test_id, new.product_name, new.version, new.device_ip,
+                new.operator, new.message, new.tags);
+    END""",
+    """CREATE TRIGGER test_records_fts_delete AFTER DELETE ON test_records BEGIN
+        DELETE FROM test_records_fts WHERE rowid = old.id;
+    END""",
+    """INSERT INTO test_records_fts(rowid, record_id, test_id, product_name, version, device_ip, operator, message, tags)
+    SELECT id, record_id, test_id, product_name, version, device_ip, operator, message, tags FROM test_records""",
+]
+
+# 测试记录各检索字段拼接后建索引，查询时使用同一表达式才能命中
+TEST_RECORD_SEARCH_TEXT = (
+    "(record_id || ' ' || test_id || ' ' || product_name || ' ' || version || ' ' || "
+    "coalesce(device_ip, '') || ' ' || operator || ' ' || coalesce(message, '') || ' ' || coalesce(tags, ''))"
+)
+
+POSTGRESQL_SEARCH_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_messages_content_trgm ON messages USING gin (content gin_trgm_ops)",
+    f"CREATE INDEX IF NOT EXISTS ix_test_records_search_trgm ON test_records "
+    f"USING gin ({TEST_RECORD_SEARCH_TEXT} gin_trgm_ops)",
+]
+
+
+@event.listens_for(db.metadata, 'after_create')
+def create_search_index(target, connection, **kw):
+    """
+    建表（db.create_all / init_schema / migrate_db）后创建全文检索索引
+
+    SQLite 首次创建时把已有数据写入索引；SQLite 未编译 FTS5 或版本低于 3.34（无 trigram）、
+    PostgreSQL 无权安装 pg_trgm 时只打印警告，检索退化为 LIKE 扫描。
+    """
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        exists = connection.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'"
+        ).first()
+        if exists:
+            return
+        statements = SQLITE_SEARCH_DDL
+    elif dialect == 'postgresql':
+        statements = POSTGRESQL_SEARCH_DDL
+    else:
+        return
+
+    try:
+        with connection.begin_nested():
+            for statement in statements:
+                connection.exec_driver_sql(statement)
+    except DBAPIError as e:
+        print(f"⚠️ 全文检索索引创建失败，检索将使用 LIKE 扫描: {e.orig}")
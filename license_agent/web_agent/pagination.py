@@ -0,0 +1,56 @@
+"""
+键集分页工具 - 基于 (时间, id) 游标分页，翻页代价与偏移量无关
+"""
+import base64
+from datetime import datetime
+from typing import Optional, Tuple
+
+from sqlalchemy import and_, or_
+
+
+def encode_cursor(timestamp: datetime, row_id: int) -> str:
+    """把 (时间, id) 编码为不透明的游标字符串"""
+    raw = f"{timestamp.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    解析游标字符串
+
+    Raises:
+        ValueError: 游标格式错误
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8')
+        timestamp, row_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except (UnicodeError, ValueError, TypeError) as e:
+        raise ValueError(f"无效的分页游标: {cursor}") from e
+
+
+def before_cursor(time_column, id_column, cursor: Tuple[datetime, int]):
+    """构造 (time, id) < 游标 的过滤条件（用于倒序翻页）"""
+    timestamp, row_id = cursor
+    return or_(
+        time_column < timestamp,
+        and_(time_column == timestamp, id_column < row_id)
+    )
+
+
+def parse_limit(value: Optional[str], default: int, maximum: int) -> int:
+    """解析每页数量参数，非法值回退为默认值，并限制上限"""
+    try:
+        limit = int(value) if value is not None else default
+    except ValueError:
+        limit = default
+    return max(1, min(limit, maximum))
+
+
+def parse_offset(value: Optional[str]) -> int:
+    """解析偏移量参数（用于按相关度排序、无法使用游标的检索结果），非法值回退为0"""
+    try:
+        return max(0, int(value)) if value is not None else 0
+    except ValueError:
+        return 0
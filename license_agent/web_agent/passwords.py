@@ -0,0 +1,147 @@
+"""
+密码哈希 - bcrypt 计算在独立的进程池中执行
+
+登录高峰时大量 bcrypt 计算与对话流式推送争抢CPU（协程模式下还会阻塞事件循环）。
+哈希与校验交给固定大小的进程池：同时进行的 bcrypt 计算数有上限，工作进程以较低优先级运行，
+请求线程只等待结果。cost（BCRYPT_ROUNDS）可配置，登录时发现旧哈希的 cost 不同会自动重新哈希。
+
+进程池在 init_app 中创建并立即启动全部工作进程：此时后台线程尚未启动，fork 出的子进程
+不会继承其他线程持有的锁。请求路径上不再 fork——工作进程异常退出后不重建进程池，改为在当前线程计算。
+init_app 需在启动任何后台线程的扩展（SocketIO、任务引擎等）之前调用。
+
+eventlet / gevent 模式下 multiprocessing 与协程补丁不兼容，改用各自的原生线程池
+（bcrypt 计算时释放GIL，不阻塞事件循环）。
+"""
+import multiprocessing
+import os
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict
+
+import bcrypt
+
+
+def _lower_priority(nice: int):
+    """进程池工作进程初始化：降低调度优先级，CPU紧张时优先保证对话处理"""
+    if nice and hasattr(os, 'nice'):
+        try:
+            os.nice(nice)
+        except OSError:
+            pass
+
+
+def _hash(password: bytes, rounds: int) -> bytes:
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+
+def _verify(password: bytes, hashed: bytes) -> bool:
+    try:
+        return bcrypt.checkpw(password, hashed)
+    except ValueError:
+        # 无效的哈希格式
+        return False
+
+
+class PasswordHasher:
+    """bcrypt 哈希与校验（Flask扩展风格，通过 init_app 读取配置）"""
+
+    def __init__(self):
+        self.rounds = 12
+        self.workers = 2
+        self.nice = 10
+        self._pool = None
+        self._offload = None  # 协程模式下的原生线程池执行函数
+        self._lock = threading.Lock()
+        self.stats_counter = Counter()
+
+    def init_app(self, app):
+        self.rounds = app.config.get('BCRYPT_ROUNDS', 12)
+        self.workers = app.config.get('PASSWORD_HASH_WORKERS', 2)
+        self.nice = app.config.get('PASSWORD_HASH_NICE', 10)
+        async_mode = app.config.get('SOCKETIO_ASYNC_MODE')
+        if async_mode == 'eventlet':
+            from eventlet import tpool
+            self._offload = tpool.execute
+        elif async_mode == 'gevent':
+            from gevent import get_hub
+            self._offload = lambda func, *args: get_hub().threadpool.apply(func, args)
+        else:
+            self._offload = None
+        # 配置变化后按新配置重建进程池
+        self.shutdown()
+        if self._offload is None:
+            self._start_pool()
+
+    # ==================== 哈希与校验 ====================
+
+    def hash(self, password: str) -> str:
+        """按当前 cost 生成哈希"""
+        self.stats_counter['hashed'] += 1
+        return self._run(_hash, password.encode('utf-8'), self.rounds).decode('utf-8')
+
+    def verify(self, password: str, hashed: str) -> bool:
+        """校验密码"""
+        self.stats_counter['verified'] += 1
+        return self._run(_verify, password.encode('utf-8'), hashed.encode('utf-8'))
+
+    def needs_rehash(self, hashed: str) -> bool:
+        """哈希的 cost 与当前配置不同时需要重新哈希（格式为 $2b$<cost>$...）"""
+        parts = hashed.split('$')
+        try:
+            return int(parts[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    # ==================== 进程池 ====================
+
+    def _run(self, func, *args):
+        if self._offload is not None and self.workers > 0:
+            return self._offload(func, *args)
+        pool = self._pool
+        if pool is None:
+            return func(*args)
+        try:
+            return pool.submit(func, *args).result()
+        except BrokenProcessPool:
+            # 工作进程异常退出：丢弃进程池，此后在当前线程计算（多线程进程中 fork 不安全，不在此重建）
+            self.stats_counter['pool_broken'] += 1
+            with self._lock:
+                if self._pool is pool:
+                    self._pool = None
+            print("⚠️ 密码哈希进程池已失效，改为在请求线程中计算")
+            return func(*args)
+
+    def _start_pool(self):
+        """创建进程池并立即 fork 出全部工作进程"""
+        # spawn 方式的子进程会重新导入主模块（即 app.py），不支持 fork 的平台在当前线程计算
+        if self.workers <= 0 or 'fork' not in multiprocessing.get_all_start_methods():
+            return
+        pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('fork'),
+            initializer=_lower_priority,
+            initargs=(self.nice,)
+        )
+        # fork 方式的进程池在第一次提交时一次启动全部工作进程
+        pool.submit(os.getpid).result()
+        with self._lock:
+            self._pool = pool
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rounds": self.rounds,
+            "workers": self.workers,
+            **self.stats_counter
+        }
+
+
+# 全局密码哈希器，在 app.py 中通过 init_app 读取配置
+password_hasher = PasswordHasher()
@@ -0,0 +1,264 @@
+"""
+后写式持久化队列 - 把消息与对话更新合并为组提交，写库不再阻塞Socket.IO处理线程与智能体线程
+
+- 写操作进入有界队列，由单个写线程每隔几毫秒取出一批，在一个事务中提交
+- 队列已满时调用方阻塞等待（背压），超时后抛出异常
+- 进程退出时写完队列中剩余的操作
+- 读取对话消息前可等待该对话的待写操作落库，保证读到自己刚写入的内容
+- 落库后的回调（推送、分发）通过 on_done 在独立的回调线程中执行，写线程只负责写库
+"""
+import atexit
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy.dialects import postgresql, sqlite
+
+from web_agent import tool_log
+from web_agent.models import db, Conversation, Message, ToolPayload
+
+_STOP = object()
+
+
+class PersistenceFullError(RuntimeError):
+    """持久化队列已满且等待超时"""
+
+
+class _WriteOp:
+    __slots__ = ('work', 'conversation_id', 'future')
+
+    def __init__(self, work, conversation_id):
+        self.work = work
+        self.conversation_id = conversation_id
+        self.future = Future()
+
+
+class PersistenceQueue:
+    """后写式持久化服务（Flask扩展风格，通过 init_app 绑定应用并启动写线程）"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self._queue = None
+        self._thread = None
+        self._callbacks = None
+        self._pending = Counter()  # conversation_id -> 尚未提交的写操作数
+        self._pending_cond = threading.Condition()
+        self.batches = 0
+        self.writes = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """绑定应用，按配置创建有界队列并启动写线程"""
+        if self._thread is not None:
+            return
+        self.app = app
+        self.flush_interval = app.config.get('PERSIST_FLUSH_INTERVAL', 0.005)
+        self.max_batch = app.config.get('PERSIST_MAX_BATCH', 200)
+        self.put_timeout = app.config.get('PERSIST_PUT_TIMEOUT', 5.0)
+        self.tool_log_inline_limit = app.config.get('TOOL_LOG_INLINE_LIMIT', 2048)
+        self._queue = queue.Queue(maxsize=app.config.get('PERSIST_QUEUE_SIZE', 10000))
+        self._callbacks = ThreadPoolExecutor(
+            max_workers=app.config.get('PERSIST_CALLBACK_WORKERS', 4),
+            thread_name_prefix='persistence-callback'
+        )
+        self._thread = threading.Thread(target=self._run, name='persistence-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.shutdown)
+
+    # ==================== 写操作 ====================
+
+    def submit(self, work: Callable[[], Any], conversation_id: Optional[int] = None) -> Future:
+        """
+        提交写操作，返回的 Future 在所在批次提交后完成
+
+        Args:
+            work: 在写线程的应用上下文中执行，通过 db.session 写入并返回结果（不要返回ORM对象）
+            conversation_id: 所属对话，用于读己之写
+
+        Raises:
+            PersistenceFullError: 队列已满且等待超时
+        """
+        if self._thread is None:
+            raise RuntimeError("持久化队列未初始化")
+
+        op = _WriteOp(work, conversation_id)
+        if conversation_id is not None:
+            with self._pending_cond:
+                self._pending[conversation_id] += 1
+        try:
+            self._queue.put(op, timeout=self.put_timeout)
+        except queue.Full:
+            self._done(op)
+            raise PersistenceFullError("持久化队列已满，请稍后重试")
+        return op.future
+
+    def add_message(self, conversation_id: int, role: str, content: str,
+                    touch_conversation: bool = False,
+                    tool_events: Optional[List[Dict[str, Any]]] = None) -> Future:
+        """
+        写入一条消息，Future 结果为消息字典
+
+        Args:
+            touch_conversation: 是否同时更新对话的更新时间
+            tool_events: 本轮的工具调用事件（ToolCallLog.take()），在写线程中编码保存
+        """
+        def work():
+            message = Message(conversation_id=conversation_id, role=role, content=content)
+            if tool_events:
+                message.tool_calls, payloads = tool_log.encode(tool_events, self.tool_log_inline_limit)
+                self._save_payloads(payloads)
+            db.session.add(message)
+            if touch_conversation:
+                # 与模型默认值同为UTC时间，保证分页游标可比较
+                Conversation.query.filter_by(id=conversation_id)\
+                    .update({'updated_at': datetime.utcnow()})
+            db.session.flush()
+            return message.to_dict()
+
+        return self.submit(work, conversation_id=conversation_id)
+
+    def delete_message(self, message_id: int, conversation_id: int) -> Future:
+        """删除一条消息（本轮被拒绝执行时撤回已保存的用户消息）"""
+        def work():
+            return Message.query.filter_by(id=message_id, conversation_id=conversation_id).delete()
+
+        return self.submit(work, conversation_id=conversation_id)
+
+    def on_done(self, future: Future, callback: Callable[[Future], None]):
+        """
+        写操作完成后在回调线程中执行 callback(future)
+
+        Future.add_done_callback 的回调在写线程中执行，推送事件或分发任务会拖慢后续批次的提交。
+        """
+        future.add_done_callback(lambda done: self._callbacks.submit(self._run_callback, callback, done))
+
+    @staticmethod
+    def _run_callback(callback, future):
+        try:
+            callback(future)
+        except Exception as e:
+            print(f"⚠️ 持久化回调执行失败: {e}")
+
+    @staticmethod
+    def _save_payloads(payloads: Dict[str, tuple]):
+        """写入拆出的大结果，已存在的摘要跳过（多个进程可能同时写入相同结果）"""
+        if not payloads:
+            return
+        rows = [
+            {'digest': digest, 'data': data, 'size': size, 'created_at': datetime.utcnow()}
+            for digest, (data, size) in payloads.items()
+        ]
+        dialect = db.session.get_bind().dialect.name
+        if dialect in ('sqlite', 'postgresql'):
+            insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+            db.session.execute(insert(ToolPayload).values(rows).on_conflict_do_nothing(index_elements=['digest']))
+            return
+        existing = {digest for (digest,) in db.session.query(ToolPayload.digest)
+                    .filter(ToolPayload.digest.in_(payloads))}
+        db.session.add_all(ToolPayload(**row) for row in rows if row['digest'] not in existing)
+
+    # ==================== 读己之写 ====================
+
+    def wait_for_conversation(self, conversation_id: int, timeout: float = 2.0) -> bool:
+        """等待对话已提交的写操作全部落库，返回是否在超时前完成"""
+        deadline = time.monotonic() + timeout
+        with self._pending_cond:
+            while self._pending.get(conversation_id):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._pending_cond.wait(remaining)
+        return True
+
+    # ==================== 写线程 ====================
+
+    def _run(self):
+        while True:
+            op = self._queue.get()
+            if op is _STOP:
+                return
+            batch = [op]
+            stopping = False
+            # 等待一个很短的窗口收集同批写操作，一次提交
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.max_batch:
+                try:
+                    op = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if op is _STOP:
+                    stopping = True
+                    break
+                batch.append(op)
+
+            self._write_batch(batch)
+            if stopping:
+                return
+
+    def _write_batch(self, batch):
+        with self.app.app_context():
+            try:
+                results = [op.work() for op in batch]
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                # 批次中有失败的操作时逐个重写，只让失败的操作报错
+                results = None
+
+            if results is not None:
+                self.batches += 1
+                for op, result in zip(batch, results):
+                    self._resolve(op, result)
+                return
+
+            for op in batch:
+                try:
+                    result = op.work()
+                    db.session.commit()
+                except Exception as e:
+                    db.session.rollback()
+                    self._resolve(op, error=e)
+                else:
+                    self.batches += 1
+                    self._resolve(op, result)
+
+    def _resolve(self, op, result=None, error=None):
+        self.writes += 1
+        self._done(op)
+        if error is not None:
+            op.future.set_exception(error)
+        else:
+            op.future.set_result(result)
+
+    def _done(self, op):
+        if op.conversation_id is None:
+            return
+        with self._pending_cond:
+            self._pending[op.conversation_id] -= 1
+            if self._pending[op.conversation_id] <= 0:
+                del self._pending[op.conversation_id]
+            self._pending_cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self._queue.qsize() if self._queue else 0,
+            "batches": self.batches,
+            "writes": self.writes
+        }
+
+    def shutdown(self, timeout: float = 10.0):
+        """写完队列中剩余的操作后停止写线程"""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._callbacks.shutdown(wait=True)
+
+
+# 全局持久化队列，在 app.py / agent_worker.py 中通过 init_app 启动
+persistence = PersistenceQueue()
@@ -0,0 +1,286 @@
+"""
+全文检索 - 按关键词检索本人的对话消息与测试记录（如"在哪个对话里测过 192.168.1.100"）
+
+- 倒排索引见 models.py 中的全文检索索引（SQLite FTS5 trigram / PostgreSQL pg_trgm），随写入增量维护
+- 关键词按空白切分，多个关键词之间为 AND；少于3个字符的关键词无法使用 trigram 索引，在索引命中的行上用 LIKE 过滤
+- 消息只在本人范围内检索：消息不多的用户直接扫描本人消息，超过 scan_limit 的用户按 owner 列走索引
+- 按时间倒序取出最近的 max_candidates 条命中行，在应用内按 BM25 打分排序后分页。
+  FTS5 的 bm25() 需要统计每个关键词在全表的命中数，常见词（如"授权测试"）在百万级消息上单次就要上百毫秒；
+  在候选行内打分，耗时与全表规模无关
+- 因此结果是"最近 max_candidates 条命中"内的相关度排序：命中更多时更早的命中不参与排序，
+  分页也止于这些候选，返回的 truncated 为 True（提示用户增加关键词缩小范围）
+"""
+import math
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import text
+
+from web_agent.models import db, Conversation, Message, TestRecord, TEST_RECORD_SEARCH_TEXT, search_owner
+
+TRIGRAM = 3
+
+# BM25 参数
+K1 = 1.2
+B = 0.75
+
+# 测试记录各字段的打分权重（设备IP、记录编号命中比备注命中更相关）
+RECORD_FIELD_WEIGHTS = {
+    'record_id': 3.0,
+    'test_id': 3.0,
+    'device_ip': 3.0,
+    'product_name': 2.0,
+    'version': 1.5,
+    'operator': 1.5,
+    'message': 1.0,
+    'tags': 1.0,
+}
+RECORD_FIELDS = list(RECORD_FIELD_WEIGHTS)
+
+
+def parse_query(q: Optional[str]) -> List[str]:
+    """按空白切分关键词（去重、保持顺序）"""
+    terms = []
+    for term in (q or '').split():
+        if term.lower() not in (t.lower() for t in terms):
+            terms.append(term)
+    return terms
+
+
+def fts_phrase(term: str, column: Optional[str] = None) -> str:
+    """关键词转为 FTS5 短语（按原文子串匹配，不解析 AND / OR / * 等查询语法）"""
+    phrase = '"' + term.replace('"', '""') + '"'
+    return f'{column}:{phrase}' if column else phrase
+
+
+def like_pattern(term: str) -> str:
+    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+
+def bm25_rank(docs: Sequence[Tuple[Any, Dict[str, str]]], terms: List[str],
+              weights: Optional[Dict[str, float]] = None) -> List[Tuple[Any, float]]:
+    """
+    对候选文档打分并按分数降序排列（分数相同时保持原顺序，即较新的在前）
+
+    Args:
+        docs: [(文档标识, {字段: 文本})]
+        weights: 各字段权重，默认均为1
+    """
+    if not docs:
+        return []
+    terms = [term.lower() for term in terms]
+    fields = list(docs[0][1])
+    weights = [(weights or {}).get(field, 1.0) for field in fields]
+    lowered = [[(value or '').lower() for value in doc.values()] for _, doc in docs]
+
+    n = len(lowered)
+    avg_len = [(sum(len(values[i]) for values in lowered) / n) or 1 for i in range(len(fields))]
+    # 候选集内的逆文档频率：只出现在少数候选中的关键词权重更高
+    joined = ['\0'.join(values) for values in lowered]
+    idf = []
+    for term in terms:
+        df = sum(1 for text in joined if term in text)
+        idf.append(math.log(1 + (n - df + 0.5) / (df + 0.5)))
+
+    scored = []
+    for (key, _), values, text in zip(docs, lowered, joined):
+        score = 0.0
+        for term, term_idf in zip(terms, idf):
+            if term not in text:
+                continue
+            for value, weight, avg in zip(values, weights, avg_len):
+                tf = value.count(term)
+                if tf:
+                    norm = K1 * (1 - B + B * len(value) / avg)
+                    score += weight * term_idf * tf * (K1 + 1) / (tf + norm)
+        scored.append((key, round(score, 4)))
+    scored.sort(key=lambda item: -item[1])
+    return scored
+
+
+def make_snippet(content: str, terms: List[str], width: int = 80) -> str:
+    """截取第一个关键词附近的片段"""
+    if len(content) <= width:
+        return content
+    lowered = content.lower()
+    positions = [pos for pos in (lowered.find(term.lower()) for term in terms) if pos >= 0]
+    start = max(0, min(positions, default=0) - width // 4)
+    start = min(start, len(content) - width)
+    snippet = content[start:start + width]
+    return ('…' if start > 0 else '') + snippet + ('…' if start + width < len(content) else '')
+
+
+class SearchIndex:
+    """全文检索（Flask扩展风格，通过 init_app 读取配置）"""
+
+    def __init__(self, app=None):
+        self.max_candidates = 1000
+        self.scan_limit = 5000
+        self.snippet_chars = 80
+        self._fts_available = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_candidates = app.config.get('SEARCH_MAX_CANDIDATES', 1000)
+        self.scan_limit = app.config.get('SEARCH_SCAN_LIMIT', 5000)
+        self.snippet_chars = app.config.get('SEARCH_SNIPPET_CHARS', 80)
+        self._fts_available = None
+
+    # ==================== 对话消息 ====================
+
+    def search_messages(self, user_id: int, q: str, limit: int = 20,
+                        offset: int = 0) -> Tuple[List[Dict[str, Any]], Optional[int], bool]:
+        """
+        检索用户本人的对话消息（在最近 max_candidates 条命中内按相关度排序）
+
+        Returns:
+            (结果列表, 下一页偏移量, 命中是否超过 max_candidates)；没有更多结果时偏移量为 None
+        """
+        terms = parse_query(q)
+        if not terms:
+            return [], None, False
+
+        candidates = self._message_candidates(user_id, terms)
+        truncated = len(candidates) > self.max_candidates
+        candidates = candidates[:self.max_candidates]
+        ranked = bm25_rank([(row, {'content': row.content}) for row in candidates], terms)
+        page = ranked[offset:offset + limit]
+
+        titles = dict(
+            db.session.query(Conversation.id, Conversation.title)
+            .filter(Conversation.id.in_({row.conversation_id for row, _ in page}))
+        ) if page else {}
+        results = [{
+            'message_id': row.id,
+            'conversation_id': row.conversation_id,
+            'conversation_title': titles.get(row.conversation_id),
+            'role': row.role,
+            'snippet': make_snippet(row.content, terms, self.snippet_chars),
+            'score': score,
+            'created_at': row.created_at.isoformat() if row.created_at else None
+        } for row, score in page]
+        return results, (offset + limit if offset + limit < len(ranked) else None), truncated
+
+    def _message_candidates(self, user_id: int, terms: List[str]):
+        """最近的命中行，多取一条用于判断是否超过 max_candidates"""
+        indexed = [term for term in terms if len(term) >= TRIGRAM]
+        params = {'limit': self.max_candidates + 1}
+        dialect = db.engine.dialect.name
+
+        if dialect == 'sqlite' and self._has_fts() and self._exceeds_scan_limit(user_id):
+            # 只有短关键词时只按 owner 匹配，按时间倒序遍历本人消息并用 LIKE 过滤
+            likes = []
+            for i, term in enumerate(terms):
+                if len(term) < TRIGRAM:
+                    likes.append(f"m.content LIKE :like{i} ESCAPE '\\'")
+                    params[f'like{i}'] = like_pattern(term)
+            params['match'] = ' AND '.join(
+                [fts_phrase(search_owner(user_id), 'owner')] + [fts_phrase(term, 'content') for term in indexed]
+            )
+            where = ' AND '.join(['messages_fts MATCH :match'] + likes)
+            sql = f"""
+                SELECT m.id, m.conversation_id, m.role, m.content, m.created_at
+                FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid
+                WHERE {where}
+                ORDER BY messages_fts.rowid DESC LIMIT :limit
+            """
+        else:
+            # PostgreSQL 的 ILIKE 由 pg_trgm 索引支撑；SQLite 中消息不多的用户或无 FTS5 时扫描本人消息
+            op = 'ILIKE' if dialect == 'postgresql' else 'LIKE'
+            conditions = [f"m.content {op} :like{i} ESCAPE '\\'" for i in range(len(terms))]
+            params.update({f'like{i}': like_pattern(term) for i, term in enumerate(terms)})
+            params['user_id'] = user_id
+            sql = f"""
+                SELECT m.id, m.conversation_id, m.role, m.content, m.created_at
+                FROM messages m JOIN conversations c ON c.id = m.conversation_id
+                WHERE c.user_id = :user_id AND {' AND '.join(conditions)}
+                ORDER BY m.id DESC LIMIT :limit
+            """
+        # 按模型列声明结果类型（SQLite 中 created_at 以文本保存）
+        columns = (Message.id, Message.conversation_id, Message.role, Message.content, Message.created_at)
+        return db.session.execute(text(sql).columns(*columns), params).all()
+
+    def _exceeds_scan_limit(self, user_id: int) -> bool:
+        """
+        用户的消息数是否超过 scan_limit（最多计数到 scan_limit + 1 条）
+
+        trigram 短语要合并每个3字符片段的倒排表，IP地址中的 "10." ".1" 等片段几乎出现在每条消息中，
+        即使限定了 owner 单次也要数十毫秒；消息不多的用户直接扫描本人消息更快。
+        """
+        count = db.session.execute(text("""
+            SELECT COUNT(*) FROM (
+                SELECT 1 FROM messages m JOIN conversations c ON c.id = m.conversation_id
+                WHERE c.user_id = :user_id LIMIT :limit
+            )
+        """), {'user_id': user_id, 'limit': self.scan_limit + 1}).scalar()
+        return count > self.scan_limit
+
+    # ==================== 测试记录 ====================
+
+    def search_records(self, q: str, limit: int = 20,
+                       offset: int = 0) -> Tuple[List[Dict[str, Any]], Optional[int], bool]:
+        """
+        检索测试记录（与测试记录查询接口一致，所有登录用户可见；在最近 max_candidates 条命中内按相关度排序）
+
+        Returns:
+            (记录列表（附 score）, 下一页偏移量, 命中是否超过 max_candidates)
+        """
+        terms = parse_query(q)
+        if not terms:
+            return [], None, False
+
+        # 候选行只取检索字段参与打分，当前页的记录再按 id 加载
+        candidates = self._record_candidates(terms)
+        truncated = len(candidates) > self.max_candidates
+        candidates = candidates[:self.max_candidates]
+        ranked = bm25_rank([(row.id, dict(zip(RECORD_FIELDS, row[1:]))) for row in candidates],
+                           terms, RECORD_FIELD_WEIGHTS)
+        page = ranked[offset:offset + limit]
+        records = {
+            record.id: record for record in TestRecord.query.filter(TestRecord.id.in_([i for i, _ in page]))
+        } if page else {}
+        results = [{**records[record_id].to_dict(), 'score': score} for record_id, score in page]
+        return results, (offset + limit if offset + limit < len(ranked) else None), truncated
+
+    def _record_candidates(self, terms: List[str]):
+        """最近的命中行，多取一条用于判断是否超过 max_candidates"""
+        indexed = [term for term in terms if len(term) >= TRIGRAM]
+        params = {'limit': self.max_candidates + 1}
+        dialect = db.engine.dialect.name
+
+        if dialect == 'sqlite' and indexed and self._has_fts():
+            params['match'] = ' AND '.join(fts_phrase(term) for term in indexed)
+            # 索引表与 test_records 的字段同名，拼接表达式可直接用于索引表
+            likes = []
+            for i, term in enumerate(terms):
+                if len(term) < TRIGRAM:
+                    likes.append(f"{TEST_RECORD_SEARCH_TEXT} LIKE :like{i} ESCAPE '\\'")
+                    params[f'like{i}'] = like_pattern(term)
+            where = ' AND '.join(['test_records_fts MATCH :match'] + likes)
+            sql = f"""
+                SELECT rowid AS id, {', '.join(RECORD_FIELDS)} FROM test_records_fts
+                WHERE {where}
+                ORDER BY rowid DESC LIMIT :limit
+            """
+        else:
+            op = 'ILIKE' if dialect == 'postgresql' else 'LIKE'
+            conditions = [f"{TEST_RECORD_SEARCH_TEXT} {op} :like{i} ESCAPE '\\'" for i in range(len(terms))]
+            params.update({f'like{i}': like_pattern(term) for i, term in enumerate(terms)})
+            sql = f"""
+                SELECT id, {', '.join(RECORD_FIELDS)} FROM test_records
+                WHERE {' AND '.join(conditions)}
+                ORDER BY id DESC LIMIT :limit
+            """
+        return db.session.execute(text(sql), params).all()
+
+    def _has_fts(self) -> bool:
+        if self._fts_available is None:
+            self._fts_available = db.session.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'"
+            )).first() is not None
+        return self._fts_available
+
+
+# 全局检索实例，在 app.py 中通过 init_app 读取配置
+search_index = SearchIndex()
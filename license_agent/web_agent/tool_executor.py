@@ -0,0 +1,139 @@
+"""
+并发工具执行器 - 替代 LangGraph 的 ToolNode，在有界线程池中并行执行同一轮的工具调用
+"""
+import contextvars
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Dict, List, Optional
+
+from langchain_core.messages import AIMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig
+
+from web_agent.metrics import AGENT_NODE_SECONDS, TOOL_CALL_SECONDS, TOOL_CALLS, observe, span
+
+
+class ConcurrentToolNode:
+    """
+    并发工具节点
+
+    同一条 AIMessage 中的多个 tool_calls 彼此独立，提交到共享线程池并行执行，
+    整轮耗时取决于最慢的工具而不是所有工具耗时之和。
+    返回的 ToolMessage 顺序与 tool_calls 顺序保持一致，response_metadata 中记录
+    执行状态（ok / failed / error / timeout / not_found）与耗时（duration_ms）。
+    """
+
+    def __init__(self, tools: List, max_workers: int = 8,
+                 default_timeout: float = 60, tool_timeouts: Optional[Dict[str, float]] = None):
+        """
+        Args:
+            tools: 工具列表
+            max_workers: 线程池大小（所有会话共享）
+            default_timeout: 单个工具默认超时时间（秒）
+            tool_timeouts: 按工具名覆盖的超时时间
+        """
+        self.tools_by_name = {t.name: t for t in tools}
+        self.default_timeout = default_timeout
+        self.tool_timeouts = tool_timeouts or {}
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='tool')
+
+    def __call__(self, state: Dict[str, Any], config: RunnableConfig) -> Dict[str, Any]:
+        """LangGraph节点入口"""
+        with span('agent.node', node='tools'), observe(AGENT_NODE_SECONDS, node='tools'):
+            return self._execute(state, config)
+
+    def _execute(self, state: Dict[str, Any], config: RunnableConfig) -> Dict[str, Any]:
+        last_message = state["messages"][-1]
+        if not isinstance(last_message, AIMessage) or not last_message.tool_calls:
+            return {"messages": []}
+
+        tool_calls = last_message.tool_calls
+        submitted_at = time.monotonic()
+        # 复制上下文提交，工具的span关联到当前对话轮次
+        futures = [
+            self.executor.submit(contextvars.copy_context().run, self._run_one, tool_call, config)
+            for tool_call in tool_calls
+        ]
+
+        # 按 tool_calls 顺序收集结果；超时按各自的截止时间计算，互不累加
+        results = []
+        for tool_call, future in zip(tool_calls, futures):
+            timeout = self.tool_timeouts.get(tool_call['name'], self.default_timeout)
+            remaining = max(0.0, submitted_at + timeout - time.monotonic())
+            try:
+                results.append(future.result(timeout=remaining))
+            except FutureTimeoutError:
+                # 线程无法被强制终止，这里只是不再等待其结果
+                future.cancel()
+                TOOL_CALLS.labels(tool=tool_call['name'], status='timeout').inc()
+                results.append(self._error_message(
+                    tool_call,
+                    "TOOL_TIMEOUT",
+                    f"工具 {tool_call['name']} 执行超过 {timeout} 秒未返回",
+                    'timeout',
+                    (time.monotonic() - submitted_at) * 1000
+                ))
+
+        return {"messages": results}
+
+    def _run_one(self, tool_call: Dict[str, Any], config: RunnableConfig) -> ToolMessage:
+        """在工作线程中执行单个工具调用"""
+        tool = self.tools_by_name.get(tool_call['name'])
+        if tool is None:
+            TOOL_CALLS.labels(tool='unknown', status='not_found').inc()
+            return self._error_message(tool_call, "TOOL_NOT_FOUND", f"未知工具: {tool_call['name']}",
+                                       'not_found', 0.0)
+
+        started = time.perf_counter()
+        with span('agent.tool', tool=tool_call['name']) as tool_span, \
+                observe(TOOL_CALL_SECONDS, tool=tool_call['name']):
+            try:
+                output = tool.invoke(tool_call['args'], config)
+            except Exception as e:
+                tool_span.status = 'ERROR'
+                TOOL_CALLS.labels(tool=tool_call['name'], status='error').inc()
+                return self._error_message(tool_call, "TOOL_ERROR", str(e), 'error',
+                                           (time.perf_counter() - started) * 1000)
+        duration_ms = (time.perf_counter() - started) * 1000
+
+        # 工具正常返回但业务失败（success=False）单独计数
+        failed = isinstance(output, dict) and output.get('success') is False
+        status = 'failed' if failed else 'ok'
+        TOOL_CALLS.labels(tool=tool_call['name'], status=status).inc()
+
+        return ToolMessage(
+            content=self._format_output(output),
+            name=tool_call['name'],
+            tool_call_id=tool_call['id'],
+            response_metadata={"status": status, "duration_ms": round(duration_ms, 1)}
+        )
+
+    @staticmethod
+    def _format_output(output: Any) -> str:
+        """工具输出序列化为字符串（与ToolNode一致，字典转为JSON）"""
+        if isinstance(output, str):
+            return output
+        try:
+            return json.dumps(output, ensure_ascii=False)
+        except (TypeError, ValueError):
+            return str(output)
+
+    @staticmethod
+    def _error_message(tool_call: Dict[str, Any], code: str, message: str,
+                       status: str, duration_ms: float) -> ToolMessage:
+        """构造失败的ToolMessage，让LLM能够据此向用户解释"""
+        return ToolMessage(
+            content=json.dumps({
+                "success": False,
+                "error": code,
+                "message": message
+            }, ensure_ascii=False),
+            name=tool_call['name'],
+            tool_call_id=tool_call['id'],
+            status="error",
+            response_metadata={"status": status, "duration_ms": round(duration_ms, 1)}
+        )
+
+    def shutdown(self):
+        """关闭线程池"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
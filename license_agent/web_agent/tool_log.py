@@ -0,0 +1,148 @@
+"""
+工具调用事件日志 - 记录每轮对话中的工具调用与结果，保存到 Message.tool_calls
+
+- 一轮对话内按发生顺序只追加事件：call（工具名、参数）与 result（状态、耗时、结果）
+- 参数中的密码、令牌等字段脱敏后再保存；CSV 文本参数（如批量测试的设备清单）按列脱敏
+- 保存时编码为紧凑JSON，压缩后更小时使用 zlib + base64（前缀 z1:）
+- 超过 inline_limit 的工具结果不放在消息中，按内容摘要保存到 tool_payloads 表（相同结果只存一份），
+  事件中只保留 ref 与 size；读取历史消息时只解码事件摘要，审计时再按需加载完整结果
+"""
+import base64
+import csv
+import hashlib
+import io
+import json
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+COMPRESSED_PREFIX = 'z1:'
+SENSITIVE_KEYS = ('password', 'passwd', 'secret', 'token', 'api_key')
+
+
+def _sensitive(name: str) -> bool:
+    return any(s in name.lower() for s in SENSITIVE_KEYS)
+
+
+def redact_csv(text: str) -> str:
+    """CSV 文本中表头为敏感字段的列替换为 ***（无法解析时整体替换）"""
+    try:
+        rows = list(csv.reader(io.StringIO(text.strip())))
+    except csv.Error:
+        return '***'
+    if not rows:
+        return text
+    masked = [index for index, name in enumerate(rows[0]) if _sensitive(name)]
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator='\n')
+    writer.writerow(rows[0])
+    for row in rows[1:]:
+        writer.writerow(['***' if index in masked else value for index, value in enumerate(row)])
+    return output.getvalue()
+
+
+def redact(args: Any) -> Any:
+    """参数中的敏感字段替换为 ***，名称含 csv 的文本参数按列脱敏"""
+    if isinstance(args, dict):
+        return {
+            key: '***' if _sensitive(key)
+            else redact_csv(value) if 'csv' in key.lower() and isinstance(value, str)
+            else redact(value)
+            for key, value in args.items()
+        }
+    if isinstance(args, list):
+        return [redact(value) for value in args]
+    return args
+
+
+class ToolCallLog:
+    """一轮对话的工具调用事件（只追加）"""
+
+    def __init__(self):
+        self.events = []
+        self._started = time.monotonic()
+
+    def __bool__(self):
+        return bool(self.events)
+
+    def call(self, tool_call_id: str, name: str, args: Dict[str, Any]):
+        self.events.append({
+            "t": "call",
+            "id": tool_call_id,
+            "name": name,
+            "args": redact(args or {}),
+            "at": self._offset_ms()
+        })
+
+    def result(self, tool_call_id: str, name: str, status: str,
+               duration_ms: Optional[float], content: str):
+        self.events.append({
+            "t": "result",
+            "id": tool_call_id,
+            "name": name,
+            "status": status,
+            "ms": duration_ms,
+            "result": content,
+            "at": self._offset_ms()
+        })
+
+    def take(self) -> List[Dict[str, Any]]:
+        """取出已记录的事件并清空（每轮的事件只保存一次）"""
+        events, self.events = self.events, []
+        return events
+
+    def _offset_ms(self) -> int:
+        return int((time.monotonic() - self._started) * 1000)
+
+
+# ==================== 编码与解码 ====================
+
+def encode(events: List[Dict[str, Any]], inline_limit: int = 2048) -> Tuple[str, Dict[str, Tuple[bytes, int]]]:
+    """
+    编码事件列表
+
+    Returns:
+        (保存到 Message.tool_calls 的文本, {摘要: (zlib压缩后的大结果, 原始字节数)})
+    """
+    payloads = {}
+    stored = []
+    for event in events:
+        result = event.get("result")
+        if isinstance(result, str) and len(result) > inline_limit:
+            raw = result.encode('utf-8')
+            digest = hashlib.sha256(raw).hexdigest()
+            payloads[digest] = (zlib.compress(raw), len(raw))
+            event = {key: value for key, value in event.items() if key != "result"}
+            event.update(ref=digest, size=len(raw))
+        stored.append(event)
+
+    text = json.dumps(stored, ensure_ascii=False, separators=(',', ':'))
+    raw = text.encode('utf-8')
+    compressed = COMPRESSED_PREFIX + base64.b64encode(zlib.compress(raw, 6)).decode('ascii')
+    return (compressed if len(compressed) < len(raw) else text), payloads
+
+
+def decode(text: Optional[str]) -> List[Dict[str, Any]]:
+    """解码 Message.tool_calls（大结果仍为 ref，不查询数据库）"""
+    if not text:
+        return []
+    if text.startswith(COMPRESSED_PREFIX):
+        text = zlib.decompress(base64.b64decode(text[len(COMPRESSED_PREFIX):])).decode('utf-8')
+    return json.loads(text)
+
+
+def summarize(text: Optional[str]) -> Optional[List[Dict[str, Any]]]:
+    """历史消息中展示的工具调用摘要：每个调用一项（工具名、状态、耗时）"""
+    events = decode(text)
+    if not events:
+        return None
+    calls = {}
+    for event in events:
+        item = calls.setdefault(event["id"], {"name": event["name"], "status": None, "ms": None})
+        if event["t"] == "result":
+            item.update(status=event.get("status"), ms=event.get("ms"))
+    return list(calls.values())
+
+
+def load_payload(data: bytes) -> str:
+    return zlib.decompress(data).decode('utf-8')
@@ -0,0 +1,131 @@
+"""
+用户身份缓存 - load_user 与 Socket.IO 事件不再每次查询 users 表
+
+- 已登录用户以只读的 UserPrincipal 缓存（LRU + TTL），与数据库会话无关，可跨请求复用
+- 本进程内更新或删除用户时在事务提交后失效对应条目；其他进程中的条目最长 TTL 后过期
+- Socket.IO 连接在 connect 时绑定用户，之后该连接的事件经同一缓存取用户身份，
+  角色变更或用户删除与 HTTP 请求同样在失效后（其他进程最长 TTL 后）生效
+"""
+import threading
+from typing import Any, Dict, Optional
+
+from flask_login import UserMixin
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from web_agent.cache import TTLCache
+from web_agent.models import db, User
+
+
+class UserPrincipal(UserMixin):
+    """已登录用户的只读身份（提供路由中用到的 id / username / role / to_dict）"""
+
+    def __init__(self, id: int, username: str, role: str, created_at):
+        self.id = id
+        self.username = username
+        self.role = role
+        self.created_at = created_at
+
+    @classmethod
+    def from_user(cls, user: User) -> 'UserPrincipal':
+        return cls(user.id, user.username, user.role, user.created_at)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'id': self.id,
+            'username': self.username,
+            'role': self.role,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+
+class UserCache:
+    """用户身份缓存（Flask扩展风格，通过 init_app 读取配置并注册失效事件）"""
+
+    def __init__(self, ttl: float = 60, max_entries: int = 10000):
+        self.cache = TTLCache(max_entries=max_entries, ttl=ttl)
+        self._sockets = {}  # Socket.IO 连接ID -> UserPrincipal
+        self._lock = threading.Lock()
+        self._listening = False
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def init_app(self, app):
+        self.cache = TTLCache(
+            max_entries=app.config.get('USER_CACHE_SIZE', 10000),
+            ttl=app.config.get('USER_CACHE_TTL', 60)
+        )
+        if not self._listening:
+            event.listen(User, 'after_update', self._mark_changed)
+            event.listen(User, 'after_delete', self._mark_changed)
+            event.listen(Session, 'after_commit', self._invalidate_committed)
+            self._listening = True
+
+    # ==================== 查询与失效 ====================
+
+    def load(self, user_id: int) -> Optional[UserPrincipal]:
+        """按ID返回用户身份，未缓存时查询数据库（用户不存在时返回 None，不缓存）"""
+        principal = self.cache.get(str(user_id))
+        if principal is not None:
+            with self._lock:
+                self.hits += 1
+            return principal
+
+        with self._lock:
+            self.misses += 1
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        principal = UserPrincipal.from_user(user)
+        self.cache.set(str(user_id), principal)
+        return principal
+
+    def invalidate(self, user_id: int):
+        self.cache.delete(str(user_id))
+        with self._lock:
+            self.invalidations += 1
+
+    def _mark_changed(self, mapper, connection, target):
+        # 刷新时立即失效，提交后再失效一次，避免提交前被其他请求读回旧值重新缓存
+        self.invalidate(target.id)
+        session = object_session(target)
+        if session is not None:
+            session.info.setdefault('changed_user_ids', set()).add(target.id)
+
+    def _invalidate_committed(self, session):
+        for user_id in session.info.pop('changed_user_ids', ()):
+            self.invalidate(user_id)
+
+    # ==================== Socket.IO 连接身份 ====================
+
+    def bind_socket(self, sid: str, principal: UserPrincipal):
+        with self._lock:
+            self._sockets[sid] = principal
+
+    def socket_user(self, sid: str) -> Optional[UserPrincipal]:
+        """连接所属用户的当前身份（需在应用上下文中调用），未认证的连接或用户已删除时返回 None"""
+        bound = self._sockets.get(sid)
+        if bound is None:
+            return None
+        return self.load(bound.id)
+
+    def unbind_socket(self, sid: str) -> Optional[UserPrincipal]:
+        with self._lock:
+            return self._sockets.pop(sid, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self.cache),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "invalidations": self.invalidations,
+                "sockets": len(self._sockets)
+            }
+
+
+# 全局用户身份缓存，在 app.py 中通过 init_app 读取配置
+user_cache = UserCache()